@@ -0,0 +1 @@
+"""Benchmarks for PortfolioMind hot paths. Run each module with `python -m benchmarks.<name>`."""
@@ -0,0 +1,44 @@
+"""Compare LightGBM's Booster.predict with the vectorized NumPy tree evaluator on small and large batches.
+
+    python -m benchmarks.bench_engines --coins 3 100 1000 10000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_coin_records
+from src.data.crypto_models import CryptoCoin
+from src.ml.features import build_feature_csr, extract_feature_columns
+from src.ml.xgboost_pred import ENGINES, _predictor, calibrate_engines
+
+
+def best_of(fn, features, repeat: int) -> float:
+    """Return the best wall time in ms."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(features)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--coins", type=int, nargs="+", default=[3, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    predictors = {engine: _predictor(engine) for engine in ENGINES}
+    schema = predictors["lightgbm"][1]
+    print(f"{'coins':>7} " + " ".join(f"{engine + ' ms':>12}" for engine in ENGINES))
+    for count in args.coins:
+        coins = [CryptoCoin(**record) for record in make_coin_records(count, symbols=list(schema.symbol_columns) + ["NEW1"])]
+        symbols, columns = extract_feature_columns(coins)
+        features, _ = build_feature_csr(symbols, columns, schema)
+        results = [predictor.predict(features) for predictor, _ in predictors.values()]
+        assert all(np.array_equal(results[0], result) for result in results), "engines disagree"
+        timings = [best_of(predictor.predict, features, args.repeat) for predictor, _ in predictors.values()]
+        print(f"{count:>7} " + " ".join(f"{timing:>12.2f}" for timing in timings))
+    print(f"auto after calibration: {calibrate_engines()}")
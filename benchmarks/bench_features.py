@@ -0,0 +1,99 @@
+"""Compare the pandas feature pipeline of predict_from_coin_data with the preallocated dense feature
+matrix and the CSR feature matrix, and time predictions on the dense and sparse inputs.
+
+    python -m benchmarks.bench_features --coins 100 1000 10000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_coin_records
+from src.data.crypto_models import CryptoCoin
+from src.ml.features import build_feature_csr, build_feature_matrix, extract_feature_columns
+from src.ml.xgboost_pred import model, model_schema, predict_from_coin_data
+
+NUMERIC_DTYPES = {
+    'galaxy_score': 'float64', 'galaxy_score_previous': 'float64', 'alt_rank': 'int64',
+    'alt_rank_previous': 'int64', 'market_cap': 'float64', 'market_cap_rank': 'int64',
+    'volume_24h': 'float64', 'interactions_24h': 'int64', 'social_volume_24h': 'int64',
+    'social_dominance': 'float64', 'sentiment': 'float64', 'percent_change_1h': 'float64',
+    'percent_change_7d': 'float64', 'percent_change_30d': 'float64', 'market_dominance': 'float64',
+    'market_dominance_prev': 'float64', 'volatility': 'float64',
+}
+CRITICAL_FIELDS = ['symbol', 'galaxy_score', 'alt_rank', 'market_cap_rank', 'interactions_24h', 'social_volume_24h', 'social_dominance']
+
+
+def pandas_features(coins) -> pd.DataFrame:
+    """The previous path: per-coin dicts, per-column coercion, get_dummies and a dense template frame."""
+    df = pd.DataFrame([{'symbol': coin.symbol, 'time': None, **{col: getattr(coin, col, None) for col in NUMERIC_DTYPES}} for coin in coins])
+    df['time'] = pd.Timestamp.now()
+    df['galaxy_score_previous'] = df['galaxy_score_previous'].fillna(df['galaxy_score'])
+    df['alt_rank_previous'] = df['alt_rank_previous'].fillna(df['alt_rank'])
+    df['sentiment'] = df['sentiment'].fillna(0.0)
+    df['percent_change_30d'] = df['percent_change_30d'].fillna(0.0)
+    df = df.dropna(subset=CRITICAL_FIELDS)
+    for col, dtype in NUMERIC_DTYPES.items():
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    df = df.drop('time', axis=1)
+
+    model_feature_names = model.feature_name()
+    model_symbols = {feature[7:] for feature in model_feature_names if feature.startswith('symbol_')}
+    df['symbol'] = df['symbol'].apply(lambda x: x if x in model_symbols else 'UNKNOWN')
+    symbol_dummies = pd.get_dummies(df['symbol'], prefix='symbol')
+    df = df.drop('symbol', axis=1)
+    feature_dict = {col: 0 for col in model_feature_names}
+    for col in df.columns:
+        if col in model_feature_names:
+            feature_dict[col] = df[col].values
+    for col in symbol_dummies.columns:
+        if col in model_feature_names:
+            feature_dict[col] = symbol_dummies[col].values
+    return pd.DataFrame(feature_dict, index=df.index)
+
+
+def matrix_features(coins) -> np.ndarray:
+    """The current path: columns straight into a preallocated matrix in feature order."""
+    symbols, columns = extract_feature_columns(coins)
+    return build_feature_matrix(symbols, columns, model_schema)[0]
+
+
+def csr_features(coins):
+    """The sparse path: numeric features and at most one one-hot value per row."""
+    symbols, columns = extract_feature_columns(coins)
+    return build_feature_csr(symbols, columns, model_schema)[0]
+
+
+def best_of(fn, coins, repeat: int) -> float:
+    """Return the best wall time in ms."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(coins)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--coins', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    known = [name[len('symbol_'):] for name in model.feature_name() if name.startswith('symbol_')]
+    print(f"{'coins':>7} {'pandas ms':>10} {'matrix ms':>10} {'csr ms':>8} {'dense MB':>9} {'csr MB':>7} {'predict dense':>14} {'predict csr':>12}")
+    for count in args.coins:
+        coins = [CryptoCoin(**record) for record in make_coin_records(count, symbols=known + ['NEW1', 'NEW2'])]
+        expected = model.predict(pandas_features(coins))
+        dense, csr = matrix_features(coins), csr_features(coins)
+        assert np.array_equal(expected, model.predict(dense)), 'feature matrix predictions differ from the pandas pipeline'
+        assert np.array_equal(expected, model.predict(csr)), 'CSR predictions differ from the pandas pipeline'
+        csr_mb = (csr.data.nbytes + csr.indices.nbytes + csr.indptr.nbytes) / 2**20
+        old = best_of(pandas_features, coins, args.repeat)
+        new = best_of(matrix_features, coins, args.repeat)
+        sparse = best_of(csr_features, coins, args.repeat)
+        total_dense = best_of(lambda c: predict_from_coin_data(c, sparse=False), coins, args.repeat)
+        total_sparse = best_of(predict_from_coin_data, coins, args.repeat)
+        print(f"{count:>7} {old:>10.1f} {new:>10.1f} {sparse:>8.1f} {dense.nbytes / 2**20:>9.1f} {csr_mb:>7.2f} {total_dense:>14.1f} {total_sparse:>12.1f}")
@@ -0,0 +1,59 @@
+"""Compare rescoring the full coin universe on every refresh with rescoring only the coins whose model
+inputs changed since the previous snapshot.
+
+    python -m benchmarks.bench_incremental --coins 5000 --changed 0.01 0.1 0.5 1.0
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_coin_records
+from src.data.crypto_models import CryptoCoin
+from src.data.snapshot import MarketSnapshot
+from src.ml.prediction_cache import PredictionCache
+from src.ml.xgboost_pred import LABEL_THRESHOLD, get_model_registry, get_model_schema, score_coin_data
+
+
+def refresh(coins, fraction: float, seed: int):
+    """Copy the universe with `fraction` of the coins' galaxy_score moved."""
+    rng = random.Random(seed)
+    changed = set(rng.sample(range(len(coins)), int(len(coins) * fraction)))
+    return [coin.model_copy(update={"galaxy_score": rng.uniform(0, 100)}) if i in changed else coin for i, coin in enumerate(coins)]
+
+
+def time_refresh(incremental: bool, base: MarketSnapshot, updated: MarketSnapshot, repeat: int):
+    """Return the best wall time in ms to score `updated` after `base`, and the rows rescored."""
+    best = float("inf")
+    holder = get_model_registry().active
+    for _ in range(repeat):
+        cache = PredictionCache(lambda table, holder: score_coin_data(table, holder=holder), lambda: holder, LABEL_THRESHOLD, incremental=incremental)
+        cache.get(base)
+        start = time.perf_counter()
+        scored = cache.get(updated)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, scored
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--coins", type=int, default=5000)
+    parser.add_argument("--changed", type=float, nargs="+", default=[0.01, 0.1, 0.5, 1.0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    known = list(get_model_schema().symbol_columns)
+    coins = [CryptoCoin(**record) for record in make_coin_records(args.coins, symbols=known + ["NEW1", "NEW2"])]
+    base = MarketSnapshot(coins, version=1)
+    base.table  # build the columnar view outside the timed region, as the refresh path does
+
+    print(f"{'changed':>8} {'full ms':>8} {'incremental ms':>15} {'rows rescored':>14}")
+    for fraction in args.changed:
+        updated = MarketSnapshot(refresh(coins, fraction, seed=int(fraction * 1000)), version=2)
+        updated.table
+        full_ms, full = time_refresh(False, base, updated, args.repeat)
+        incremental_ms, incremental = time_refresh(True, base, updated, args.repeat)
+        assert np.array_equal(full.confidence, incremental.confidence, equal_nan=True), "incremental scores differ from a full rescoring"
+        print(f"{fraction:>8.0%} {full_ms:>8.1f} {incremental_ms:>15.1f} {incremental.rescored:>14}")
@@ -0,0 +1,56 @@
+"""Compare loading the LightGBM text model with memory-mapping the compact binary artifact.
+
+Each loader runs in a fresh interpreter; load time and the RSS it adds are reported:
+
+    python -m src.ml.tree_artifact
+    python -m benchmarks.bench_model_load --runs 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SCENARIO = r"""
+import json, sys, time
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+
+import numpy as np
+if sys.argv[1] == "text":
+    import lightgbm as lgb
+else:
+    from src.ml.tree_artifact import TreeEnsemble
+before = rss_kb()
+start = time.perf_counter()
+if sys.argv[1] == "text":
+    model = lgb.Booster(model_file=sys.argv[2])
+else:
+    model = TreeEnsemble.load(sys.argv[2])
+loaded = time.perf_counter()
+model.predict(np.zeros((1, model.num_feature())))
+print(json.dumps({"load": loaded - start, "rss_mb": (rss_kb() - before) / 1024}))
+"""
+
+
+def run(kind: str, path: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", SCENARIO, kind, path], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="src/ml/lgbm_model.txt")
+    parser.add_argument("--artifact", default="src/ml/lgbm_model.bin")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'model':<8} {'load ms':>8} {'RSS added MB':>13}")
+    for kind, path in (("text", args.model), ("binary", args.artifact)):
+        results = [run(kind, path) for _ in range(args.runs)]
+        load = statistics.median(result["load"] for result in results) * 1000
+        rss = statistics.median(result["rss_mb"] for result in results)
+        print(f"{kind:<8} {load:>8.2f} {rss:>13.2f}")
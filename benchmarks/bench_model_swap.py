@@ -0,0 +1,79 @@
+"""Measure hot-swapping the active model and shadow scoring a candidate model.
+
+Prediction latency is sampled from a request loop while the registry swaps model versions in the
+background, then with a shadow model attached; the registry's own swap and shadow timings are reported:
+
+    python -m benchmarks.bench_model_swap --coins 1000 --swaps 3
+"""
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.synthetic import make_coin_records
+from src.data.coin_table import CoinTable
+from src.data.crypto_models import CryptoCoin
+from src.ml.xgboost_pred import MODEL_PATH, get_model_registry, get_model_schema, score_coin_data
+
+
+def latencies(table: CoinTable, seconds: float) -> list:
+    """Score `table` back to back for `seconds`, returning each call's latency in ms."""
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        score_coin_data(table)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summary(samples: list) -> str:
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"{len(samples):>6} {statistics.median(samples):>8.2f} {p99:>8.2f} {max(samples):>8.2f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--coins", type=int, default=1000)
+    parser.add_argument("--swaps", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    registry = get_model_registry()
+    registry.active.warmup()
+    known = list(get_model_schema().symbol_columns)
+    table = CoinTable.from_coins([CryptoCoin(**record) for record in make_coin_records(args.coins, symbols=known + ["NEW1"])])
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [shutil.copy(MODEL_PATH, f"{directory}/model_{i}.txt") for i in range(args.swaps)]
+
+        def swap_all():
+            for path in paths:
+                time.sleep(args.seconds / (args.swaps + 1))
+                registry.load(path, wait=True)
+                swaps.append(registry.stats()["last_swap"])
+
+        print(f"{'scenario':<12} {'calls':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        print(f"{'steady':<12} {summary(latencies(table, args.seconds))}")
+
+        swaps = []
+        swapper = threading.Thread(target=swap_all)
+        swapper.start()
+        print(f"{'swapping':<12} {summary(latencies(table, args.seconds))}")
+        swapper.join()
+
+        registry.load_shadow(paths[0], wait=True)
+        print(f"{'shadow':<12} {summary(latencies(table, args.seconds))}")
+        registry.wait_for_shadow()
+        stats = registry.stats()
+        registry.clear_shadow()
+
+    print()
+    for swap in swaps:
+        print(f"swap to {swap['to']}: load+warmup {swap['load_seconds'] * 1000:.1f} ms, swap {swap['swap_seconds'] * 1e6:.1f} us")
+    print(f"shadow: {stats['shadow_runs']} runs, {stats['shadow_skipped']} skipped while busy, "
+          f"mean {stats['shadow_seconds_mean'] * 1000:.2f} ms per run off the request path")
@@ -0,0 +1,64 @@
+"""Compare prompt tokens of per-symbol narrative prompts with batched multi-symbol prompts.
+
+Prompts are rendered exactly as crypto_narrative_agent sends them; no LLM is called. Tokens are counted
+with tiktoken when its encoding is available, otherwise estimated at 4 characters per token.
+Response tokens are not included:
+
+    python -m benchmarks.bench_narrative_tokens --symbols 10 --batch-sizes 1 2 5 10
+"""
+
+import argparse
+
+from benchmarks.synthetic import make_coin_records
+from src.agents.crypto_narrative_sentiment import build_narrative_batch_prompt, build_narrative_prompt, get_confidence_level
+from src.data.crypto_models import CryptoCoin
+from src.data.snapshot import MarketSnapshot
+
+
+def token_counter(encoding: str):
+    """Return (count function, description)."""
+    try:
+        import tiktoken
+
+        encoder = tiktoken.get_encoding(encoding)
+        return (lambda text: len(encoder.encode(text))), f"tiktoken {encoding}"
+    except Exception:
+        return (lambda text: (len(text) + 3) // 4), "estimate, 4 chars/token (tiktoken encoding unavailable)"
+
+
+def prompt_text(prompt) -> str:
+    return "\n".join(message.content for message in prompt.to_messages())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--encoding", default="cl100k_base")
+    args = parser.parse_args()
+
+    count, description = token_counter(args.encoding)
+    coins = [CryptoCoin(**record) for record in make_coin_records(args.symbols, seed=3)]
+    snapshot = MarketSnapshot(coins, version=0)
+    symbols = [coin.symbol for coin in coins]
+    analysis = {
+        symbol: {"signal": "bullish", "confidence": get_confidence_level(0.5), "model_prediction": {"predicted_label": 1, "confidence": 0.5}}
+        for symbol in symbols
+    }
+
+    print(f"tokens: {description}")
+    print(f"{'batch size':>10} {'calls':>6} {'prompt tokens':>14} {'tokens/symbol':>14} {'vs per-symbol':>14}")
+    baseline = None
+    for size in args.batch_sizes:
+        batches = [symbols[i:i + size] for i in range(0, len(symbols), size)]
+        total = 0
+        for batch in batches:
+            data = {symbol: analysis[symbol] for symbol in batch}
+            if len(batch) == 1:
+                prompt = build_narrative_prompt(batch[0], data, snapshot)
+            else:
+                prompt = build_narrative_batch_prompt(batch, data, snapshot)
+            total += count(prompt_text(prompt))
+        baseline = baseline or (total if size == 1 else None)
+        saving = f"{1 - total / baseline:>13.0%}" if baseline else f"{'-':>14}"
+        print(f"{size:>10} {len(batches):>6} {total:>14} {total / len(symbols):>14.0f} {saving}")
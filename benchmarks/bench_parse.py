@@ -0,0 +1,64 @@
+"""Compare the old dict round-trip parse of the coins list with parsing straight from bytes,
+and with the streaming parser that keeps only a few requested symbols.
+
+    python -m benchmarks.bench_parse --coins 5000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_response_bytes
+from src.data.coin_stream import coin_filter, parse_coins_stream
+from src.data.crypto_models import CryptoCoin, CryptoCoinResponse
+from src.tools.api import parse_coins_response
+
+
+def dict_round_trip(content: bytes):
+    """The previous path: decode to dicts, validate, dump back to dicts for the cache, revalidate on a cache hit."""
+    data = json.loads(content)
+    cached = [coin.model_dump() for coin in CryptoCoinResponse(**data).data]
+    return [CryptoCoin(**coin) for coin in cached]
+
+
+def from_bytes(content: bytes):
+    """The current path: validate once from the raw body and cache the models."""
+    return parse_coins_response(content).data
+
+
+def stream_three_symbols(content: bytes):
+    """The streaming path used by symbol lookups on a cold cache."""
+    chunks = (content[i:i + 64 * 1024] for i in range(0, len(content), 64 * 1024))
+    return parse_coins_stream(chunks, coin_filter(symbols=["C1", "C2", "C3"]))[1]
+
+
+def measure(fn, content: bytes, repeat: int) -> tuple[float, float]:
+    """Return (best wall time in ms, peak traced memory in MB)."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(content)
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 2**20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--coins", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'coins':>7} {'path':<16} {'time ms':>9} {'peak MB':>9}")
+    for count in args.coins:
+        content = make_response_bytes(count)
+        for name, fn in (("dict round trip", dict_round_trip), ("from bytes", from_bytes), ("stream 3 symbols", stream_three_symbols)):
+            elapsed, peak = measure(fn, content, args.repeat)
+            print(f"{count:>7} {name:<16} {elapsed:>9.1f} {peak:>9.1f}")
@@ -0,0 +1,50 @@
+"""Measure process startup with the lazily loaded model, with and without the warmup hook.
+
+Each scenario runs in a fresh interpreter, so import and load costs are not shared:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SCENARIO = r"""
+import json, sys, time
+start = time.perf_counter()
+import src.ml.xgboost_pred as xp
+imported = time.perf_counter()
+if sys.argv[1] == "warmup":
+    xp.warmup()
+ready = time.perf_counter()
+from benchmarks.synthetic import make_coin_records
+from src.data.crypto_models import CryptoCoin
+coins = [CryptoCoin(**record) for record in make_coin_records(3, symbols=["BTC", "ETH", "SOL"])]
+first = time.perf_counter()
+xp.predict_from_coin_data(coins)
+done = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "ready": ready - start,
+    "first_predict": done - first,
+}))
+"""
+
+
+def run(mode: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", SCENARIO, mode], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'import ms':>10} {'ready ms':>9} {'first predict ms':>17}")
+    for mode in ("lazy", "warmup"):
+        results = [run(mode) for _ in range(args.runs)]
+        median = lambda key: statistics.median(result[key] for result in results) * 1000
+        print(f"{mode:<8} {median('import'):>10.1f} {median('ready'):>9.1f} {median('first_predict'):>17.1f}")
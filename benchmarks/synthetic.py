@@ -0,0 +1,53 @@
+"""Synthetic LunarCrush data shaped like the coins list endpoint."""
+
+import json
+import random
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def make_coin_records(count: int, symbols: Optional[Sequence[str]] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """Build `count` coin records with every field the API returns, some of them missing."""
+    rng = random.Random(seed)
+    maybe = lambda value: None if rng.random() < 0.05 else value
+    records = []
+    for i in range(count):
+        symbol = rng.choice(symbols) if symbols else f"C{i}"
+        records.append({
+            "id": i + 1,
+            "symbol": symbol,
+            "name": f"{symbol} coin",
+            "price": rng.uniform(1e-6, 1e5),
+            "price_btc": rng.uniform(1e-12, 1),
+            "volume_24h": maybe(rng.uniform(1e3, 1e10)),
+            "volatility": maybe(rng.uniform(0, 1)),
+            "circulating_supply": maybe(rng.uniform(1e6, 1e12)),
+            "max_supply": maybe(rng.uniform(1e6, 1e12)),
+            "percent_change_1h": maybe(rng.uniform(-10, 10)),
+            "percent_change_24h": maybe(rng.uniform(-30, 30)),
+            "percent_change_7d": maybe(rng.uniform(-50, 50)),
+            "percent_change_30d": maybe(rng.uniform(-90, 200)),
+            "market_cap": maybe(rng.uniform(1e5, 1e12)),
+            "market_cap_rank": maybe(i + 1),
+            "interactions_24h": maybe(rng.randint(0, 10**8)),
+            "social_volume_24h": maybe(rng.randint(0, 10**6)),
+            "social_dominance": maybe(rng.uniform(0, 5)),
+            "market_dominance": maybe(rng.uniform(0, 50)),
+            "market_dominance_prev": maybe(rng.uniform(0, 50)),
+            "galaxy_score": maybe(rng.uniform(0, 100)),
+            "galaxy_score_previous": maybe(rng.uniform(0, 100)),
+            "alt_rank": maybe(rng.randint(1, 5000)),
+            "alt_rank_previous": maybe(rng.randint(1, 5000)),
+            "sentiment": maybe(rng.randint(0, 100)),
+            "categories": "layer-1,defi",
+            "blockchains": [{"type": "layer1", "network": symbol.lower(), "address": None, "decimals": 18}],
+            "last_updated_price": 1717171717,
+            "last_updated_price_by": "cmc",
+            "topic": symbol.lower(),
+            "logo": f"https://cdn.lunarcrush.com/{symbol.lower()}.png",
+        })
+    return records
+
+
+def make_response_bytes(count: int, symbols: Optional[Sequence[str]] = None, seed: int = 0, generated: int = 1717171717) -> bytes:
+    """Build a raw coins list response body."""
+    return json.dumps({"config": {"generated": generated}, "data": make_coin_records(count, symbols, seed)}).encode()
@@ -14,6 +14,11 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from jsonrpc.routes import model_router, portfolio_router, websocket_router
 from jsonrpc.db import init_mongodb, close_mongodb, check_mongodb_connection
+from src.tools.api import get_fetch_stats, start_background_refresh, stop_background_refresh
+from src.ml.xgboost_pred import get_model_registry, get_prediction_cache, warmup as warmup_model
+from src.llm.models import get_client_pool, preconnect_models
+from src.utils.llm_cache import get_response_cache
+from src.utils.llm_resilience import get_llm_resilience
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -22,12 +27,21 @@ async def lifespan(app: FastAPI):
         # 启动时初始化 MongoDB 连接
         if not init_mongodb():
             raise HTTPException(status_code=503, detail="Database connection failed")
+        # 就绪前预加载预测模型，避免首个请求承担加载开销
+        warmup_model()
+        # 预先建立 LLM_PRECONNECT 中模型的连接，首个请求复用连接池
+        preconnect_models()
+        # 按需启动行情快照后台刷新
+        if os.getenv("CRYPTO_CACHE_BACKGROUND_REFRESH", "False").lower() == "true":
+            start_background_refresh()
         yield
     except Exception as e:
         logger.error(f"Application startup failed: {str(e)}")
         raise
     finally:
         # 关闭时清理连接
+        stop_background_refresh()
+        get_model_registry().stop_watcher()
         close_mongodb()
 
 # 创建 FastAPI 应用
@@ -64,5 +78,18 @@ async def health_check():
         logger.error(f"Health check failed: {str(e)}")
         return {"status": "unhealthy", "error": str(e)}
 
+# 运行统计端点
+@fastapi_app.get("/stats")
+async def stats():
+    """行情抓取、预测缓存、模型注册表、LLM 连接池、LLM 响应缓存（按 agent）以及各 provider 熔断和对冲请求的统计"""
+    return {
+        "market_data": get_fetch_stats(),
+        "predictions": get_prediction_cache().stats(),
+        "model_registry": get_model_registry().stats(),
+        "llm_clients": get_client_pool().stats(),
+        "llm_cache": get_response_cache().stats(),
+        "llm_resilience": get_llm_resilience().stats(),
+    }
+
 # 导出 FastAPI 应用
 app = fastapi_app
@@ -1,13 +1,16 @@
 from src.graph.state import AgentState, show_agent_reasoning
-from src.tools.api import get_coins
+from src.tools.api import get_market_snapshot, get_pinned_snapshot
+from src.data.snapshot import MarketSnapshot
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 from typing_extensions import Literal
 from src.utils.progress import progress
 from src.utils.llm import call_llm
-from src.ml.xgboost_pred import predict_from_coin_data
+from src.ml.xgboost_pred import get_scored_snapshot
 
 
 class CryptoNarrativeSignal(BaseModel):
@@ -16,6 +19,34 @@ class CryptoNarrativeSignal(BaseModel):
     reasoning: str
 
 
+class CryptoNarrativeBatch(BaseModel):
+    # Entries are validated one by one so a single malformed symbol does not fail the whole batch
+    signals: dict[str, dict]
+
+
+# System prompt principles shared by the per-symbol and batched narrative prompts
+NARRATIVE_GUIDELINES = """You are a Crypto Analysis AI agent. Your role is to interpret machine learning model outputs and current market data to generate investment signals in the cryptocurrency market. Follow these principles:
+
+                    1. Consider both the model's prediction (`predicted_label`) and its **confidence in price increase** (`confidence`, between 0 and 1).
+                    2. If `predicted_label` is 1, the model predicts a potential price increase. Otherwise, the model predicts no price increase.
+                    3. Express **confidence in price increase** using semantic descriptors only (not numeric values):
+                        - confidence > 0.7 → "high confidence in price increase"
+                        - 0.45 < confidence ≤ 0.7 → "moderate confidence in price increase"
+                        - 0.35 < confidence ≤ 0.45 → "low confidence in price increase"
+                        - confidence ≤ 0.35 → model predicts no price increase, return "no confidence in price increase"
+
+                    4. The model is conservative when predicting price increases. Even moderate or low confidence signals should be interpreted with caution.
+                    5. Use a balanced, analytical, and professional tone. Avoid exaggeration or overconfidence.
+
+                When composing your response:
+                - Clearly state the model's directional prediction (bullish, bearish, or neutral)
+                - Describe **confidence in price increase** using one of the approved phrases
+                - Explain the rationale behind the prediction using the data provided in `current_market_data` and `analysis_data`
+                - Highlight any uncertainty or signal weakness when applicable
+
+"""
+
+
 def get_confidence_level(confidence: float) -> str:
     """
     将数值置信度转换为描述性置信度
@@ -30,6 +61,40 @@ def get_confidence_level(confidence: float) -> str:
         return "no confidence in price increase"
 
 
+def create_default_narrative_signal() -> CryptoNarrativeSignal:
+    """
+    LLM调用失败时使用的中性默认信号
+    """
+    return CryptoNarrativeSignal(signal="neutral", confidence="no confidence in price increase", reasoning="Error in generating analysis; defaulting to neutral.")
+
+
+def parse_narrative_batch(batch: CryptoNarrativeBatch, symbols: list[str]) -> tuple[dict[str, CryptoNarrativeSignal], list[str]]:
+    """
+    逐个校验批量结果中每个币种的信号，返回 (有效信号, 缺失或无效的币种)
+    """
+    results, failed = {}, []
+    for symbol in symbols:
+        try:
+            results[symbol] = CryptoNarrativeSignal.model_validate(batch.signals[symbol])
+        except (KeyError, ValidationError):
+            failed.append(symbol)
+    return results, failed
+
+
+def get_narrative_concurrency() -> int:
+    """
+    同时进行的叙事分析LLM调用数上限，由环境变量 NARRATIVE_CONCURRENCY 配置，默认4
+    """
+    return max(1, int(os.getenv("NARRATIVE_CONCURRENCY", "4")))
+
+
+def get_narrative_batch_size() -> int:
+    """
+    一次LLM调用分析的币种数，由环境变量 NARRATIVE_BATCH_SIZE 配置，默认1（逐个币种分析）
+    """
+    return max(1, int(os.getenv("NARRATIVE_BATCH_SIZE", "1")))
+
+
 def crypto_narrative_agent(state: AgentState):
     """
     Analyzes cryptocurrencies using ML model predictions and narrative analysis:
@@ -46,27 +111,23 @@ def crypto_narrative_agent(state: AgentState):
 
     # Get only the specified coins data
     progress.update_status("crypto_narrative_agent", None, "Fetching cryptocurrency data")
-    coins = get_coins(symbols)  # 只获取指定的币种数据
-    # print(f"Fetched {len(coins)} coins for analysis")
+    snapshot = get_pinned_snapshot(data, symbols)  # 整个分析过程使用同一份市场快照
 
-    # Get model predictions for the specified coins
+    # Get model predictions; the whole snapshot is scored once and shared by every request
     progress.update_status("crypto_narrative_agent", None, "Running ML model predictions")
-    predictions_df = predict_from_coin_data(coins)
-    # print(f"\nPredictions DataFrame shape: {predictions_df.shape}")
-    # print("Predictions DataFrame head:")
-    # print(predictions_df.head())
+    predictions = get_scored_snapshot(snapshot)
 
     for symbol in symbols:
         # print(f"\nProcessing symbol: {symbol}")
         # Find the coin data for this symbol
-        coin_data = next((coin for coin in coins if coin.symbol == symbol), None)
+        coin_data = snapshot.get(symbol)
         if not coin_data:
             # print(f"Symbol {symbol} not found in coins data")
             progress.update_status("crypto_narrative_agent", symbol, "Symbol not found")
             continue
 
         # Get prediction for this symbol
-        symbol_prediction = predictions_df[predictions_df['symbol'] == symbol].iloc[0] if len(predictions_df[predictions_df['symbol'] == symbol]) > 0 else None
+        symbol_prediction = predictions.get(symbol)
         
         if symbol_prediction is None:
             # print(f"No prediction available for symbol {symbol}")
@@ -76,37 +137,61 @@ def crypto_narrative_agent(state: AgentState):
         # print(f"Found prediction for {symbol}:")
         # print(symbol_prediction)
 
+        predicted_label, confidence = symbol_prediction
+
         # Map prediction to signal
-        if symbol_prediction['predicted_label'] == 1:
+        if predicted_label == 1:
             signal = "bullish"
         else:
             signal = "bearish"
 
         analysis_data[symbol] = {
             "signal": signal,
-            "confidence": get_confidence_level(float(symbol_prediction['confidence'])),
+            "confidence": get_confidence_level(confidence),
             "model_prediction": {
-                "predicted_label": int(symbol_prediction['predicted_label']),
-                "confidence": float(symbol_prediction['confidence'])
+                "predicted_label": predicted_label,
+                "confidence": confidence
             }
         }
 
-        progress.update_status("crypto_narrative_agent", symbol, "Generating narrative analysis")
-        narrative_output = generate_narrative_output(
-            symbol=symbol,
-            analysis_data=analysis_data,
+    # Generate the narratives concurrently, at most NARRATIVE_CONCURRENCY LLM calls at a time,
+    # each covering up to NARRATIVE_BATCH_SIZE symbols
+    def analyze(batch: list[str]) -> dict[str, CryptoNarrativeSignal]:
+        for symbol in batch:
+            progress.update_status("crypto_narrative_agent", symbol, "Generating narrative analysis")
+        outputs = generate_narrative_batch(
+            symbols=batch,
+            analysis_data={symbol: analysis_data[symbol] for symbol in batch},
             model_name=state["metadata"]["model_name"],
             model_provider=state["metadata"]["model_provider"],
+            snapshot=snapshot,
         )
+        for symbol in batch:
+            progress.update_status("crypto_narrative_agent", symbol, "Done")
+        return outputs
+
+    pending = list(analysis_data)
+    batch_size = get_narrative_batch_size()
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    concurrency = min(get_narrative_concurrency(), len(batches))
+    outputs = {}
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="narrative") as executor:
+            for batch_outputs in executor.map(analyze, batches):
+                outputs.update(batch_outputs)
+    else:
+        for batch in batches:
+            outputs.update(analyze(batch))
 
+    # Merge results in input order
+    for symbol in pending:
+        narrative_output = outputs[symbol]
         narrative_analysis[symbol] = {
             "signal": narrative_output.signal,
             "confidence": narrative_output.confidence,
             "reasoning": narrative_output.reasoning
         }
 
-        progress.update_status("crypto_narrative_agent", symbol, "Done")
-
     # print("\nFinal narrative analysis:")
     # print(json.dumps(narrative_analysis, indent=2))
 
@@ -131,25 +216,13 @@ def crypto_narrative_agent(state: AgentState):
     return {"messages": [message], "data": state["data"]}
 
 
-def generate_narrative_output(
-    symbol: str,
-    analysis_data: dict[str, any],
-    model_name: str,
-    model_provider: str,
-) -> CryptoNarrativeSignal:
+def get_current_market_data(coin_data) -> dict | str:
     """
-    Generates a crypto investment decision based on ML model predictions and narrative analysis:
-    - Uses model predictions for technical and market analysis
-    - Provides comprehensive reasoning based on model outputs
-    - Return the result in a JSON structure: { signal, confidence, reasoning }
+    Builds the market data section of a narrative prompt for one coin
     """
-    # Get current market data for the symbol
-    coins = get_coins()
-    coin_data = next((coin for coin in coins if coin.symbol == symbol), None)
-    
     if coin_data:
         # Convert all numeric values to float to ensure JSON serialization
-        current_market_data = {
+        return {
             "Technical Indicators": {
                 "Galaxy Score": float(coin_data.galaxy_score) if coin_data.galaxy_score is not None else None,
                 "Alt Rank": int(coin_data.alt_rank) if coin_data.alt_rank is not None else None,
@@ -173,32 +246,49 @@ def generate_narrative_output(
             }
         }
     else:
-        current_market_data = "Market data not available"
+        return "Market data not available"
 
-    template = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                """You are a Crypto Analysis AI agent. Your role is to interpret machine learning model outputs and current market data to generate investment signals in the cryptocurrency market. Follow these principles:
 
-                    1. Consider both the model's prediction (`predicted_label`) and its **confidence in price increase** (`confidence`, between 0 and 1).
-                    2. If `predicted_label` is 1, the model predicts a potential price increase. Otherwise, the model predicts no price increase.
-                    3. Express **confidence in price increase** using semantic descriptors only (not numeric values):
-                        - confidence > 0.7 → "high confidence in price increase"
-                        - 0.45 < confidence ≤ 0.7 → "moderate confidence in price increase"
-                        - 0.35 < confidence ≤ 0.45 → "low confidence in price increase"
-                        - confidence ≤ 0.35 → model predicts no price increase, return "no confidence in price increase"
+def generate_narrative_output(
+    symbol: str,
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+    snapshot: MarketSnapshot = None,
+) -> CryptoNarrativeSignal:
+    """
+    Generates a crypto investment decision based on ML model predictions and narrative analysis:
+    - Uses model predictions for technical and market analysis
+    - Provides comprehensive reasoning based on model outputs
+    - Return the result in a JSON structure: { signal, confidence, reasoning }
+    """
+    prompt = build_narrative_prompt(symbol, analysis_data, snapshot)
 
-                    4. The model is conservative when predicting price increases. Even moderate or low confidence signals should be interpreted with caution.
-                    5. Use a balanced, analytical, and professional tone. Avoid exaggeration or overconfidence.
+    return call_llm(
+        prompt=prompt,
+        model_name=model_name,
+        model_provider=model_provider,
+        pydantic_model=CryptoNarrativeSignal,
+        agent_name="crypto_narrative_agent",
+        default_factory=create_default_narrative_signal,
+        temperature=0.1
+    )
 
-                When composing your response:
-                - Clearly state the model's directional prediction (bullish, bearish, or neutral)
-                - Describe **confidence in price increase** using one of the approved phrases
-                - Explain the rationale behind the prediction using the data provided in `current_market_data` and `analysis_data`
-                - Highlight any uncertainty or signal weakness when applicable
 
-                ### Output strictly in the following JSON format:
+def build_narrative_prompt(symbol: str, analysis_data: dict[str, any], snapshot: MarketSnapshot = None):
+    """
+    Renders the per-symbol narrative prompt
+    """
+    # Get current market data for the symbol
+    if snapshot is None:
+        snapshot = get_market_snapshot()
+    current_market_data = get_current_market_data(snapshot.get(symbol))
+
+    template = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                NARRATIVE_GUIDELINES + """                ### Output strictly in the following JSON format:
                 {{
                     "signal": "bullish" or "bearish" or "neutral",
                     "confidence": "high confidence in price increase" or "moderate confidence in price increase" or "low confidence in price increase" or "no confidence in price increase",
@@ -220,21 +310,105 @@ def generate_narrative_output(
         ]
     )
 
-    prompt = template.invoke({
+    return template.invoke({
         "analysis_data": json.dumps(analysis_data, indent=2),
         "symbol": symbol,
         "current_market_data": json.dumps(current_market_data, indent=2)
     })
 
-    def create_default_narrative_signal():
-        return CryptoNarrativeSignal(signal="neutral", confidence="no confidence in price increase", reasoning="Error in generating analysis; defaulting to neutral.")
 
-    return call_llm(
+def generate_narrative_batch(
+    symbols: list[str],
+    analysis_data: dict[str, any],
+    model_name: str,
+    model_provider: str,
+    snapshot: MarketSnapshot = None,
+) -> dict[str, CryptoNarrativeSignal]:
+    """
+    Generates narrative signals for several symbols with one LLM call:
+    - Sends the shared instructions once with every symbol's market and model data
+    - Validates each symbol's entry separately; only the symbols that are missing or invalid are retried,
+      as a smaller batch, or split in half when the whole batch failed
+    - A single remaining symbol falls back to the per-symbol prompt
+    - When the LLM call itself fails, every symbol gets the neutral default without further calls
+    - Responses are only cached when every symbol's entry is valid
+    Returns a map of symbol to signal, in the order of `symbols`
+    """
+    if len(symbols) == 1:
+        symbol = symbols[0]
+        return {symbol: generate_narrative_output(symbol, analysis_data, model_name, model_provider, snapshot)}
+
+    if snapshot is None:
+        snapshot = get_market_snapshot()
+    prompt = build_narrative_batch_prompt(symbols, analysis_data, snapshot)
+
+    fallback = CryptoNarrativeBatch(signals={})
+    batch = call_llm(
         prompt=prompt,
         model_name=model_name,
         model_provider=model_provider,
-        pydantic_model=CryptoNarrativeSignal,
+        pydantic_model=CryptoNarrativeBatch,
         agent_name="crypto_narrative_agent",
-        default_factory=create_default_narrative_signal,
-        temperature=0.1
+        default_factory=lambda: fallback,
+        temperature=0.1,
+        cacheable=lambda response: not parse_narrative_batch(response, symbols)[1],
     )
+
+    # The LLM call itself failed after its retries: splitting would only multiply calls to a failing provider
+    if batch is fallback:
+        return {symbol: create_default_narrative_signal() for symbol in symbols}
+
+    results, failed = parse_narrative_batch(batch, symbols)
+    if failed:
+        progress.update_status("crypto_narrative_agent", None, f"Retrying {len(failed)} of {len(symbols)} symbols")
+        # Retry only the failing subset; split it when nothing in the batch came back valid
+        parts = [failed] if len(failed) < len(symbols) else [failed[:len(failed) // 2], failed[len(failed) // 2:]]
+        for part in parts:
+            results.update(generate_narrative_batch(part, {symbol: analysis_data[symbol] for symbol in part}, model_name, model_provider, snapshot))
+
+    return {symbol: results[symbol] for symbol in symbols}
+
+
+def build_narrative_batch_prompt(symbols: list[str], analysis_data: dict[str, any], snapshot: MarketSnapshot):
+    """
+    Renders the multi-symbol narrative prompt
+    """
+    current_market_data = {symbol: get_current_market_data(snapshot.get(symbol)) for symbol in symbols}
+
+    template = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                NARRATIVE_GUIDELINES + """                You are analyzing several cryptocurrencies at once. Produce one independent signal per symbol, based only on that symbol's data.
+
+                ### Output strictly in the following JSON format, with one entry for every requested symbol:
+                {{
+                    "signals": {{
+                        "<SYMBOL>": {{
+                            "signal": "bullish" or "bearish" or "neutral",
+                            "confidence": "high confidence in price increase" or "moderate confidence in price increase" or "low confidence in price increase" or "no confidence in price increase",
+                            "reasoning": "string"
+                        }}
+                    }}
+                }}
+                """
+            ),
+            (
+                "human",
+                """Based on the following analysis and current market data, create a crypto investment signal for each of these symbols: {symbols}
+
+            Current Market Data:
+            {current_market_data}
+
+            Model Analysis Data:
+            {analysis_data}
+            """
+            )
+        ]
+    )
+
+    return template.invoke({
+        "symbols": ", ".join(symbols),
+        "analysis_data": json.dumps(analysis_data, indent=2),
+        "current_market_data": json.dumps(current_market_data, indent=2)
+    })
@@ -7,6 +7,8 @@ from src.utils.progress import progress
 from langchain_core.messages import HumanMessage
 from src.ml.xgboost_pred import get_top3_predictions
 from src.tools.preference import get_user_preference
+from src.tools.api import get_pinned_snapshot
+from src.data.snapshot import MarketSnapshot
 import pandas as pd
 import logging
 
@@ -20,12 +22,13 @@ class InvestmentRecommendation(BaseModel):
 class InvestmentManagerOutput(BaseModel):
     result: list[dict] = Field(description="List of investment recommendations, each containing token and usd amount")
 
-def prepare_investment_data(address: str) -> tuple[dict, pd.DataFrame]:
+def prepare_investment_data(address: str, snapshot: MarketSnapshot = None) -> tuple[dict, pd.DataFrame]:
     """
     准备投资决策所需的数据
     
     Args:
         address: 用户地址
+        snapshot: 本次分析固定使用的市场快照
         
     Returns:
         tuple: (user_preference, predictions_df)
@@ -35,7 +38,7 @@ def prepare_investment_data(address: str) -> tuple[dict, pd.DataFrame]:
     
     # 使用tokens_number作为市值排名阈值获取预测结果
     market_cap_rank = int(user_preference["tokens_number"])
-    predictions_df = get_top3_predictions(market_cap_rank)
+    predictions_df = get_top3_predictions(market_cap_rank, snapshot)
     
     return user_preference, predictions_df
 
@@ -89,7 +92,7 @@ def investment_recommendation_agent(state: AgentState):
             raise ValueError("User address not provided")
 
         # 准备投资数据
-        user_preference, predictions_df = prepare_investment_data(address)
+        user_preference, predictions_df = prepare_investment_data(address, get_pinned_snapshot(state["data"]))
         
         if predictions_df.empty:
             logger.error("No predictions available")
@@ -0,0 +1,151 @@
+import codecs
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.data.crypto_models import Config, CryptoCoin
+
+CoinFilter = Callable[[Dict[str, Any]], bool]
+
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_GENERATED = re.compile(rb'"generated"\s*:\s*(\d+)')
+_PEEK_BYTES = 4096
+
+
+class _JsonStream:
+    """Incremental reader over a JSON document arriving in byte chunks.
+
+    Only the unread tail of the document is buffered, so memory stays bounded
+    by the chunk size plus the largest single value being decoded.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._text = ""
+        self._pos = 0
+        self._eof = False
+
+    def _more(self) -> bool:
+        """Append the next chunk, dropping everything already consumed."""
+        for chunk in self._chunks:
+            if text := self._utf8.decode(chunk):
+                self._text = self._text[self._pos:] + text
+                self._pos = 0
+                return True
+        if not self._eof:
+            self._eof = True
+            self._text = self._text[self._pos:] + self._utf8.decode(b"", final=True)
+            self._pos = 0
+        return False
+
+    def peek(self) -> str:
+        """Get the next non-whitespace character without consuming it."""
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._more():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(self, char: str) -> None:
+        if (found := self.peek()) != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if self._more():
+                    continue
+                raise
+            # A number ending exactly at the buffer edge may continue in the next chunk
+            if end == len(self._text) and self._more():
+                continue
+            self._pos = end
+            return value
+
+    def members(self):
+        """Iterate the keys of the object at the cursor, leaving the cursor on each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def items(self):
+        """Iterate the decoded elements of the array at the cursor."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def parse_coins_stream(chunks: Iterable[bytes], keep: CoinFilter) -> Tuple[Optional[Config], List[CryptoCoin]]:
+    """Parse a coins list response incrementally, validating only the coins `keep` accepts.
+
+    Each element of the `data` array is decoded on its own and dropped unless
+    `keep` returns True for its raw record, so peak memory is bounded by the
+    result size rather than the size of the universe.
+
+    Args:
+        chunks: the response body as byte chunks, e.g. `response.iter_content()`
+        keep: predicate over the raw coin record
+    Returns:
+        (config, coins) with coins in upstream order
+    """
+    stream = _JsonStream(chunks)
+    config = None
+    coins = []
+    for key in stream.members():
+        if key == "data":
+            coins.extend(CryptoCoin.model_validate(record) for record in stream.items() if keep(record))
+        elif key == "config":
+            config = Config.model_validate(stream.value())
+        else:
+            stream.value()
+    return config, coins
+
+
+def peek_generated(content: bytes) -> Optional[int]:
+    """Read `config.generated` from a raw coins list body without parsing it.
+
+    Only the head and tail of the body are scanned, where the `config` object sits.
+    """
+    match = _GENERATED.search(content, 0, _PEEK_BYTES) or _GENERATED.search(content, max(0, len(content) - _PEEK_BYTES))
+    return int(match.group(1)) if match else None
+
+
+def coin_filter(symbols: Optional[Iterable[str]] = None, max_rank: Optional[int] = None, keep: Optional[CoinFilter] = None) -> CoinFilter:
+    """Build a raw-record predicate matching any of: a requested symbol, a rank threshold, or an extra policy."""
+    wanted = set(symbols or ())
+
+    def matches(record: Dict[str, Any]) -> bool:
+        if record.get("symbol") in wanted:
+            return True
+        rank = record.get("market_cap_rank")
+        if max_rank is not None and rank is not None and rank <= max_rank:
+            return True
+        return keep is not None and keep(record)
+
+    return matches
@@ -0,0 +1,128 @@
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data.crypto_models import CryptoCoin, CryptoCoinResponse
+
+# Numeric CryptoCoin fields stored as float64 columns
+NUMERIC_FIELDS: Tuple[str, ...] = (
+    "price",
+    "price_btc",
+    "volume_24h",
+    "volatility",
+    "circulating_supply",
+    "max_supply",
+    "percent_change_1h",
+    "percent_change_24h",
+    "percent_change_7d",
+    "percent_change_30d",
+    "market_cap",
+    "market_cap_rank",
+    "interactions_24h",
+    "social_volume_24h",
+    "social_dominance",
+    "market_dominance",
+    "market_dominance_prev",
+    "galaxy_score",
+    "galaxy_score_previous",
+    "alt_rank",
+    "alt_rank_previous",
+    "sentiment",
+    "last_updated_price",
+)
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+class CoinTable:
+    """Columnar, read-only view of the coin universe.
+
+    Every numeric field is a float64 NumPy array with NaN for missing values,
+    symbols are an array of interned strings, and rows line up with the coins
+    the table was built from. Those coins are kept as they are, so callers that
+    still need `CryptoCoin` objects get the exact Decimal values, not float64
+    round trips.
+    """
+
+    __slots__ = ("ids", "symbols", "_columns", "_missing", "_coins")
+
+    def __init__(self, ids: np.ndarray, symbols: np.ndarray, columns: Dict[str, np.ndarray], coins: np.ndarray):
+        self.ids = _read_only(ids)
+        self.symbols = _read_only(symbols)
+        self._columns = {name: _read_only(values) for name, values in columns.items()}
+        self._missing: Dict[str, np.ndarray] = {}
+        self._coins = _read_only(coins)
+
+    @classmethod
+    def from_coins(cls, coins: Sequence[CryptoCoin]) -> "CoinTable":
+        """Build a table from validated coins."""
+        size = len(coins)
+        ids = np.fromiter((coin.id for coin in coins), dtype=np.int64, count=size)
+        symbols = np.empty(size, dtype=object)
+        symbols[:] = [sys.intern(coin.symbol) for coin in coins]
+        columns = {
+            name: np.fromiter(
+                (np.nan if (value := getattr(coin, name)) is None else float(value) for coin in coins),
+                dtype=np.float64,
+                count=size,
+            )
+            for name in NUMERIC_FIELDS
+        }
+        originals = np.empty(size, dtype=object)
+        originals[:] = list(coins)
+        return cls(ids, symbols, columns, originals)
+
+    @classmethod
+    def from_response(cls, response: CryptoCoinResponse) -> "CoinTable":
+        """Build a table from a parsed LunarCrush coins response."""
+        return cls.from_coins(response.data)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def column(self, name: str) -> np.ndarray:
+        """Get a numeric column; missing values are NaN."""
+        return self._columns[name]
+
+    def missing(self, name: str) -> np.ndarray:
+        """Get the boolean mask of rows where a numeric field is missing."""
+        if name not in self._missing:
+            self._missing[name] = _read_only(np.isnan(self._columns[name]))
+        return self._missing[name]
+
+    def rows_for(self, symbols: Iterable[str]) -> np.ndarray:
+        """Get the row indices whose symbol is in `symbols`, in table order."""
+        return np.flatnonzero(np.isin(self.symbols, list(set(symbols))))
+
+    def rows_by_rank(self, n: int) -> np.ndarray:
+        """Get the rows with market_cap_rank <= n ordered by rank; n == 0 keeps every row in table order.
+
+        Rows without a rank never pass a threshold.
+        """
+        if n == 0:
+            return np.arange(len(self))
+        rank = self._columns["market_cap_rank"]
+        rows = np.flatnonzero(rank <= n)
+        return rows[np.argsort(rank[rows], kind="stable")]
+
+    def take(self, rows: Sequence[int]) -> "CoinTable":
+        """Get a new table holding only the given rows, in the given order."""
+        rows = np.asarray(rows, dtype=np.intp)
+        return CoinTable(
+            self.ids[rows],
+            self.symbols[rows],
+            {name: values[rows] for name, values in self._columns.items()},
+            self._coins[rows],
+        )
+
+    def coin(self, row: int) -> CryptoCoin:
+        """Get the coin the row was built from."""
+        return self._coins[row]
+
+    def coins(self, rows: Optional[Sequence[int]] = None) -> List[CryptoCoin]:
+        """Get the given rows (all rows by default) as CryptoCoin objects."""
+        return [self.coin(int(row)) for row in (range(len(self)) if rows is None else rows)]
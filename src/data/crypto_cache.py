@@ -1,14 +1,66 @@
-from typing import List, Dict, Any, Optional
+import logging
+import os
+import threading
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Callable, Sequence, Tuple, Union
 from datetime import datetime, timedelta
+from src.data.crypto_models import CryptoCoin
+from src.data.history import HistoryStore
+from src.data.singleflight import SingleFlight
+from src.data.snapshot import MarketSnapshot, SnapshotDelta
+from src.data.snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+CoinsLoader = Callable[[], List[CryptoCoin]]
+SnapshotListener = Callable[[MarketSnapshot], None]
+RefreshSchedule = Callable[[], datetime]
+
+# Returned by a loader when upstream has not changed since the cached snapshot
+NOT_MODIFIED: Any = object()
+# Returned by a loader when the request budget did not allow a fetch
+THROTTLED: Any = object()
 
 
 class CryptoCache:
-    """In-memory cache for cryptocurrency API responses."""
+    """In-memory cache for cryptocurrency API responses.
+
+    With `max_staleness` set the cache runs in stale-while-revalidate mode: an
+    expired snapshot younger than `max_staleness` is served immediately while a
+    background thread refreshes it, and only older snapshots make callers block.
+    With `refresh_ahead` set, the refresh starts that long before expiry.
 
-    def __init__(self):
-        self._coins_cache: Dict[str, List[Dict[str, Any]]] = {}
+    With a `store`, every write is also published to disk and a cold or expired
+    cache first adopts a newer snapshot written by a sibling or previous process.
+    """
+
+    def __init__(
+        self,
+        cache_duration: timedelta = timedelta(minutes=5),
+        max_staleness: Optional[timedelta] = None,
+        refresh_ahead: Optional[timedelta] = None,
+        store: Optional[SnapshotStore] = None,
+    ):
+        self._snapshots: Dict[str, MarketSnapshot] = {}
         self._last_update: Dict[str, datetime] = {}
-        self._cache_duration = timedelta(minutes=5)  # Cache duration of 5 minutes
+        self._cache_duration = cache_duration  # Cache duration, 5 minutes by default
+        self._max_staleness = max_staleness  # Oldest snapshot served without blocking; None disables
+        self._refresh_ahead = refresh_ahead  # Refresh this long before expiry; None waits for expiry
+        self._store = store  # Optional disk tier shared across processes
+        self._version = 0  # Bumped on every write so readers can tell snapshots apart
+        self._lock = threading.RLock()  # Guards cache mutation across threads
+        self._flights = SingleFlight()  # One in-flight load per key
+        self._refreshing = False
+        self._refresher: Optional[threading.Thread] = None
+        self._stop_refresher = threading.Event()
+        self._stale_served = 0
+        self._background_refreshes = 0
+        self._refresh_failures = 0
+        self._disk_loads = 0
+        self._not_modified = 0
+        self._throttled = 0
+        self._streamed = 0
+        self._listeners: List[SnapshotListener] = []
 
     def _is_cache_valid(self, key: str) -> bool:
         """Check if the cache for a given key is still valid."""
@@ -16,49 +68,370 @@ class CryptoCache:
             return False
         return datetime.now() - self._last_update[key] < self._cache_duration
 
-    def _merge_data(self, existing: Optional[List[Dict[str, Any]]], new_data: List[Dict[str, Any]], key_field: str) -> List[Dict[str, Any]]:
-        """Merge existing and new data, avoiding duplicates based on a key field.
-        
+    def _merge_data(self, existing: Optional[MarketSnapshot], new_data: List[CryptoCoin]) -> Tuple[List[CryptoCoin], Optional[SnapshotDelta]]:
+        """Upsert new data onto the existing snapshot, keyed by coin id.
+
+        Every field of a coin already cached is replaced by its new value, and
+        coins missing from new_data are kept. The existing snapshot's id index
+        serves the lookups, so nothing is rebuilt per write.
+
         Args:
-            existing: Existing cached data
-            new_data: New data to merge
-            key_field: Field to use for identifying duplicates (e.g., 'id' for coins)
-            
+            existing: Snapshot currently cached, if any
+            new_data: New coins to merge
+
         Returns:
-            Merged data with duplicates removed
+            Merged coins (new data in upstream order, then retained coins) and
+            the delta against `existing`, or None when there is nothing to diff against
         """
-        if not existing:
-            return new_data
-
-        # Create a set of existing keys for O(1) lookup
-        existing_keys = {item[key_field] for item in existing}
+        merged: Dict[int, CryptoCoin] = {}
+        for coin in new_data:
+            merged[coin.id] = coin
+        if existing is None:
+            return list(merged.values()), None
 
-        # Only add items that don't exist yet
-        merged = existing.copy()
-        merged.extend([item for item in new_data if item[key_field] not in existing_keys])
-        return merged
+        added = []
+        changed = {}
+        for coin_id, coin in merged.items():
+            previous = existing.get_by_id(coin_id)
+            if previous is None:
+                added.append(coin_id)
+            elif previous.__dict__ != coin.__dict__:
+                changed[coin_id] = frozenset(
+                    name for name, value in coin.__dict__.items() if previous.__dict__.get(name) != value
+                )
+        for coin in existing.coins:
+            merged.setdefault(coin.id, coin)
+        delta = SnapshotDelta(existing.version, frozenset(added), MappingProxyType(changed))
+        return list(merged.values()), delta
 
-    def get_coins(self) -> Optional[List[Dict[str, Any]]]:
+    def get_coins(self) -> Optional[List[CryptoCoin]]:
         """Get cached coins data if available and valid."""
-        if not self._is_cache_valid("coins"):
+        snapshot = self.get_snapshot()
+        return list(snapshot.coins) if snapshot else None
+
+    def get_snapshot(self) -> Optional[MarketSnapshot]:
+        """Get the cached coins snapshot if available and valid."""
+        with self._lock:
+            if not self._is_cache_valid("coins"):
+                return None
+            return self._snapshots.get("coins")
+
+    def get_latest_snapshot(self) -> Optional[MarketSnapshot]:
+        """Get the cached coins snapshot regardless of its age."""
+        with self._lock:
+            return self._snapshots.get("coins")
+
+    def touch(self) -> Optional[MarketSnapshot]:
+        """Mark the cached snapshot fresh without changing it, e.g. when upstream has not regenerated."""
+        with self._lock:
+            snapshot = self._snapshots.get("coins")
+            if snapshot is not None:
+                self._last_update["coins"] = datetime.now()
+                self._not_modified += 1
+            return snapshot
+
+    def _keep_throttled(self) -> Optional[MarketSnapshot]:
+        """Keep serving the cached snapshot as it is when a fetch was throttled; its age is left alone."""
+        with self._lock:
+            self._throttled += 1
+            return self._snapshots.get("coins")
+
+    def get_or_load_snapshot(self, loader: CoinsLoader) -> Optional[MarketSnapshot]:
+        """Get the cached coins snapshot, loading it with `loader` on a miss.
+
+        Concurrent misses are coalesced: only one caller runs the loader and
+        the others wait for and share the snapshot it produces. A loader may
+        return NOT_MODIFIED to keep the cached snapshot and restart its TTL, or
+        THROTTLED to keep serving it, expired or not, until a later fetch.
+        """
+        if snapshot := self._serve_cached(loader):
+            return snapshot
+        return self._flights.do("coins", lambda: self._load_snapshot(loader))
+
+    def _serve_cached(self, loader: CoinsLoader) -> Optional[MarketSnapshot]:
+        """Get a snapshot that can be served without blocking, scheduling a refresh when due."""
+        if self._store is not None and not self._is_cache_valid("coins"):
+            self._adopt_from_disk()
+        with self._lock:
+            snapshot = self._snapshots.get("coins")
+            if snapshot is None:
+                return None
+            age = datetime.now() - self._last_update["coins"]
+            if age < self._cache_duration:
+                if self._refresh_ahead is not None and age >= self._cache_duration - self._refresh_ahead:
+                    self._refresh_in_background(loader, snapshot.version)
+                return snapshot
+            if self._max_staleness is not None and age < self._max_staleness:
+                self._stale_served += 1
+                self._refresh_in_background(loader, snapshot.version)
+                return snapshot
             return None
-        return self._coins_cache.get("coins")
 
-    def set_coins(self, data: List[Dict[str, Any]]) -> None:
-        """Set coins data in cache with current timestamp."""
-        # Merge new data with existing cache
-        self._coins_cache["coins"] = self._merge_data(
-            self._coins_cache.get("coins"),
-            data,
-            key_field="id"  # Use coin's id as the unique identifier
-        )
-        self._last_update["coins"] = datetime.now()
+    def stream_while_cold(self, stream: CoinsLoader, loader: CoinsLoader) -> Optional[List[CryptoCoin]]:
+        """Serve a cold-cache caller from `stream` while the full snapshot loads in the background.
+
+        Only the caller that starts the background load streams. While that load is
+        in flight every other caller gets None and should wait on get_or_load_snapshot,
+        so a cold start costs one stream plus one coalesced load. None is also
+        returned when the cache can serve a snapshot.
+        """
+        if self._serve_cached(loader) is not None:
+            return None
+        latest = self.get_latest_snapshot()
+        if self._flights.in_flight("coins") or not self._refresh_in_background(loader, latest.version if latest else None):
+            return None
+        with self._lock:
+            self._streamed += 1
+        return stream()
+
+    def _refresh_in_background(self, loader: CoinsLoader, seen_version: Optional[int]) -> bool:
+        """Start a background refresh unless one is already running; returns whether it started one."""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        threading.Thread(
+            target=self._background_refresh,
+            args=(loader, seen_version),
+            name="crypto-cache-refresh",
+            daemon=True,
+        ).start()
+        return True
+
+    def _background_refresh(self, loader: CoinsLoader, seen_version: int) -> None:
+        try:
+            self._flights.do("coins", lambda: self._refresh_snapshot(loader, seen_version))
+        except Exception as e:
+            with self._lock:
+                self._refresh_failures += 1
+            logger.warning(f"Background refresh of coins failed, keeping last snapshot: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_snapshot(self, loader: CoinsLoader, seen_version: Optional[int]) -> Optional[MarketSnapshot]:
+        """Reload the snapshot unless it changed since `seen_version` was read."""
+        with self._lock:
+            current = self._snapshots.get("coins")
+            if current is not None and current.version != seen_version:
+                return current
+        if adopted := self._adopt_from_disk():
+            return adopted
+        data = loader()
+        if data is NOT_MODIFIED:
+            return self.touch()
+        if data is THROTTLED:
+            return self._keep_throttled()
+        if not data:
+            return current
+        with self._lock:
+            self._background_refreshes += 1
+        return self.set_coins(data)
+
+    def start_refresher(
+        self,
+        loader: CoinsLoader,
+        retry_delay: timedelta = timedelta(seconds=30),
+        schedule: Optional[RefreshSchedule] = None,
+    ) -> None:
+        """Keep the snapshot warm from a daemon thread.
+
+        The thread refreshes `refresh_ahead` before each expiry (or at expiry if
+        unset), so request paths find a valid snapshot instead of paying for the fetch.
+        With `schedule`, refreshes happen when it says instead, e.g. when upstream
+        is expected to have regenerated the data.
+        """
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop_refresher.clear()
+            self._refresher = threading.Thread(
+                target=self._run_refresher,
+                args=(loader, retry_delay, schedule),
+                name="crypto-cache-refresher",
+                daemon=True,
+            )
+            self._refresher.start()
+
+    def stop_refresher(self) -> None:
+        """Stop the background refresher thread, if running."""
+        self._stop_refresher.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+    def _run_refresher(self, loader: CoinsLoader, retry_delay: timedelta, schedule: Optional[RefreshSchedule]) -> None:
+        # Never lead by more than half the TTL, or the refresher would spin
+        lead = min(self._refresh_ahead or timedelta(0), self._cache_duration / 2)
+        while not self._stop_refresher.is_set():
+            with self._lock:
+                snapshot = self._snapshots.get("coins")
+                updated = self._last_update.get("coins")
+                due = updated + self._cache_duration - lead if snapshot else datetime.now()
+            if snapshot is not None and schedule is not None:
+                due = schedule()
+            wait = (due - datetime.now()).total_seconds()
+            if wait > 0:
+                self._stop_refresher.wait(wait)
+                continue
+            try:
+                refreshed = self._flights.do("coins", lambda: self._refresh_snapshot(loader, snapshot.version if snapshot else None))
+            except Exception as e:
+                with self._lock:
+                    self._refresh_failures += 1
+                logger.warning(f"Scheduled refresh of coins failed, retrying in {retry_delay}: {e}")
+                refreshed = None
+            # Back off when nothing was refreshed, e.g. the fetch was throttled
+            if refreshed is None or self._last_update.get("coins") == updated:
+                self._stop_refresher.wait(retry_delay.total_seconds())
+
+    def _load_snapshot(self, loader: CoinsLoader) -> Optional[MarketSnapshot]:
+        """Run the loader and cache its result, unless a previous flight already did."""
+        if snapshot := self.get_snapshot():
+            return snapshot
+        if self._adopt_from_disk() and (snapshot := self.get_snapshot()):
+            return snapshot
+        data = loader()
+        if data is NOT_MODIFIED:
+            return self.touch()
+        if data is THROTTLED:
+            return self._keep_throttled()
+        if not data:
+            return None
+        return self.set_coins(data)
+
+    def _adopt_from_disk(self) -> Optional[MarketSnapshot]:
+        """Adopt the disk snapshot if it is newer than the one in memory.
+
+        Only the header is read unless the file is actually newer.
+        """
+        if self._store is None:
+            return None
+        try:
+            header = self._store.peek()
+            if header is None or not self._is_newer(header[1]):
+                return None
+            snapshot = self._store.read()
+        except Exception as e:
+            logger.warning(f"Failed to read coins snapshot from {self._store.path}: {e}")
+            return None
+        with self._lock:
+            if snapshot is None or not self._is_newer(snapshot.created_at):
+                return None
+            self._snapshots["coins"] = snapshot
+            self._last_update["coins"] = snapshot.created_at
+            self._version = max(self._version, snapshot.version)
+            self._disk_loads += 1
+        self._notify(snapshot)
+        return snapshot
+
+    def _is_newer(self, created_at: datetime) -> bool:
+        with self._lock:
+            current = self._snapshots.get("coins")
+            return current is None or created_at > current.created_at
+
+    def set_coins(self, data: Sequence[Union[CryptoCoin, Dict[str, Any]]]) -> MarketSnapshot:
+        """Set coins data in cache with current timestamp.
+
+        Coins are expected to be validated already; plain dicts are validated here.
+        """
+        snapshot = self._set_coins([coin if isinstance(coin, CryptoCoin) else CryptoCoin(**coin) for coin in data])
+        if self._store is not None:
+            try:
+                self._store.write(snapshot)
+            except Exception as e:
+                logger.warning(f"Failed to write coins snapshot to {self._store.path}: {e}")
+        self._notify(snapshot)
+        return snapshot
+
+    def subscribe(self, listener: SnapshotListener) -> SnapshotListener:
+        """Call `listener` with every new snapshot; its `delta` tells which coins changed."""
+        with self._lock:
+            self._listeners.append(listener)
+        return listener  # Return listener to support use as decorator
+
+    def unsubscribe(self, listener: SnapshotListener) -> None:
+        """Stop calling a previously subscribed listener."""
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, snapshot: MarketSnapshot) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.warning(f"Snapshot listener failed: {e}")
+
+    def _set_coins(self, coins: List[CryptoCoin]) -> MarketSnapshot:
+        with self._lock:
+            if self._store is not None:
+                # Keep versions increasing across processes sharing the store
+                header = self._store.peek()
+                if header is not None:
+                    self._version = max(self._version, header[0])
+            # Upsert new data onto the existing cache
+            merged, delta = self._merge_data(self._snapshots.get("coins"), coins)
+            now = datetime.now()
+            self._version += 1
+            snapshot = MarketSnapshot(merged, version=self._version, created_at=now, delta=delta)
+            self._snapshots["coins"] = snapshot
+            self._last_update["coins"] = now
+            return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters, including coalesced and waiting loaders."""
+        with self._lock:
+            return {
+                "version": self._version,
+                "stale_served": self._stale_served,
+                "background_refreshes": self._background_refreshes,
+                "refresh_failures": self._refresh_failures,
+                "disk_loads": self._disk_loads,
+                "not_modified": self._not_modified,
+                "throttled": self._throttled,
+                "streamed": self._streamed,
+                "loads": self._flights.stats(),
+            }
+
+
+def _env_seconds(name: str, default: Optional[float] = None) -> Optional[timedelta]:
+    """Read a duration in seconds from the environment."""
+    value = os.environ.get(name)
+    if not value:
+        return timedelta(seconds=default) if default is not None else None
+    return timedelta(seconds=float(value))
 
 
 # Global cache instance
-_crypto_cache = CryptoCache()
+_crypto_cache = CryptoCache(
+    cache_duration=_env_seconds("CRYPTO_CACHE_TTL_SECONDS", 300),
+    max_staleness=_env_seconds("CRYPTO_CACHE_MAX_STALENESS_SECONDS"),
+    refresh_ahead=_env_seconds("CRYPTO_CACHE_REFRESH_AHEAD_SECONDS"),
+    store=SnapshotStore(os.path.join(os.environ["CRYPTO_CACHE_DIR"], "coins.snapshot")) if os.environ.get("CRYPTO_CACHE_DIR") else None,
+)
+
+
+# Global history store, recording every cached snapshot when CRYPTO_HISTORY_DIR is set
+_history_store = (
+    HistoryStore(
+        os.environ["CRYPTO_HISTORY_DIR"],
+        retention_days=int(os.environ["CRYPTO_HISTORY_RETENTION_DAYS"]) if os.environ.get("CRYPTO_HISTORY_RETENTION_DAYS") else None,
+    )
+    if os.environ.get("CRYPTO_HISTORY_DIR")
+    else None
+)
+if _history_store is not None:
+    _crypto_cache.subscribe(_history_store.record)
 
 
 def get_crypto_cache() -> CryptoCache:
     """Get the global crypto cache instance."""
-    return _crypto_cache 
\ No newline at end of file
+    return _crypto_cache
+
+
+def get_history_store() -> Optional[HistoryStore]:
+    """Get the global snapshot history store, or None if history is disabled."""
+    return _history_store 
\ No newline at end of file
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional
+
+
+class TokenBucket:
+    """Token bucket tracking the request budget of an API key.
+
+    The bucket holds up to `capacity` tokens and refills continuously at
+    `refill_per_second`; every request spends one token.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Spend `tokens` if the budget allows it."""
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def remaining(self) -> float:
+        """Get the tokens currently available."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Get the seconds until `tokens` are available, 0 if they are now."""
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+            return max(0.0, missing / self.refill_per_second)
+
+
+class FetchScheduler:
+    """Plans coins list fetches around upstream regeneration and the API budget.
+
+    LunarCrush regenerates the coins list periodically and stamps it with
+    `config.generated`. The scheduler remembers the last generation seen and
+    the response validators (ETag / Last-Modified), so a fetch can be made
+    conditional, an unchanged body can be recognised before it is parsed, and
+    the next fetch can be planned for just after the next expected generation.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        generation_interval: timedelta = timedelta(minutes=5),
+        settle_delay: timedelta = timedelta(seconds=10),
+        poll_interval: timedelta = timedelta(seconds=30),
+    ):
+        self.bucket = bucket
+        self._generation_interval = generation_interval  # How often upstream regenerates the list
+        self._settle_delay = settle_delay  # Margin after the expected generation before fetching
+        self._poll_interval = poll_interval  # Retry delay once a generation is overdue
+        self._generated: Optional[int] = None
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._last_fetch: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._fetches = 0
+        self._not_modified = 0
+        self._unchanged = 0
+        self._throttled = 0
+        self._waited = 0
+
+    @property
+    def generated(self) -> Optional[int]:
+        """Unix timestamp of the last generation fetched, or None."""
+        return self._generated
+
+    def acquire(self, wait: float = 0) -> bool:
+        """Spend one request from the budget, waiting up to `wait` seconds for it; False when it stays exhausted."""
+        deadline = time.monotonic() + wait
+        while not self.bucket.try_acquire():
+            delay = self.bucket.wait_time()
+            if time.monotonic() + delay > deadline:
+                with self._lock:
+                    self._throttled += 1
+                return False
+            with self._lock:
+                self._waited += 1
+            time.sleep(delay)
+        with self._lock:
+            self._fetches += 1
+            self._last_fetch = datetime.now()
+        return True
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Get the validators of the last fetch as conditional request headers."""
+        headers = {}
+        with self._lock:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+        return headers
+
+    def record_not_modified(self) -> None:
+        """Record a 304 response."""
+        with self._lock:
+            self._not_modified += 1
+
+    def is_unchanged(self, generated: Optional[int]) -> bool:
+        """Check whether a response carries the generation already fetched, counting it if so."""
+        with self._lock:
+            if generated is None or generated != self._generated:
+                return False
+            self._unchanged += 1
+            return True
+
+    def record(self, generated: int, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Record a parsed response: its generation and its validators."""
+        with self._lock:
+            self._generated = generated
+            if headers is not None:
+                self._etag = headers.get("ETag")
+                self._last_modified = headers.get("Last-Modified")
+
+    def next_fetch_at(self) -> datetime:
+        """Get when the next fetch is planned.
+
+        That is just after the next expected generation, polled every
+        `poll_interval` once it is overdue, and never before the budget allows.
+        """
+        now = datetime.now()
+        with self._lock:
+            if self._generated is None:
+                planned = now
+            else:
+                planned = datetime.fromtimestamp(self._generated) + self._generation_interval + self._settle_delay
+                if self._last_fetch is not None and planned <= self._last_fetch:
+                    planned = self._last_fetch + self._poll_interval
+        return max(planned, now + timedelta(seconds=self.bucket.wait_time()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the planned fetch time, the remaining budget and fetch counters."""
+        next_fetch_at = self.next_fetch_at()
+        with self._lock:
+            return {
+                "generated": self._generated,
+                "next_fetch_at": next_fetch_at.isoformat(),
+                "budget_remaining": self.bucket.remaining(),
+                "fetches": self._fetches,
+                "not_modified": self._not_modified,
+                "unchanged": self._unchanged,
+                "throttled": self._throttled,
+                "waited": self._waited,
+            }
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# Global scheduler for the LunarCrush API key
+_rate_limit = _env_float("LUNARCRUSH_RATE_LIMIT", 10)
+_fetch_scheduler = FetchScheduler(
+    TokenBucket(_rate_limit, _rate_limit / _env_float("LUNARCRUSH_RATE_LIMIT_WINDOW_SECONDS", 60)),
+    generation_interval=timedelta(seconds=_env_float("LUNARCRUSH_GENERATION_INTERVAL_SECONDS", 300)),
+)
+
+
+def get_fetch_scheduler() -> FetchScheduler:
+    """Get the global LunarCrush fetch scheduler."""
+    return _fetch_scheduler
@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.data.coin_table import NUMERIC_FIELDS
+from src.data.snapshot import MarketSnapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from several processes are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_TIME = "time"
+_ID = "id"
+_SYMBOL = "symbol"
+_DTYPES = {_TIME: np.int64, _ID: np.int64, _SYMBOL: np.int32, **{name: np.float64 for name in NUMERIC_FIELDS}}
+_SEALED = "columns.npz"
+_SYMBOLS = "symbols.json"
+
+
+def _millis(moment: datetime) -> int:
+    """Unix milliseconds; snapshots can be taken less than a second apart."""
+    return int(moment.timestamp() * 1000)
+
+
+class HistoryStore:
+    """Append-only, columnar history of market snapshots, partitioned by UTC day.
+
+    Each day is a directory with one flat file per column (`time` in Unix
+    milliseconds, `id`, dictionary-encoded `symbol`, and every numeric coin
+    field), appended to once per snapshot and read back through `np.memmap`.
+    `time` is written
+    last and defines how many rows are committed, so a torn append is never
+    visible. Past days are sealed into a single compressed `columns.npz` when
+    the first snapshot of a new day arrives, and days older than
+    `retention_days` are deleted then.
+
+    `record` queues snapshots for a single writer thread, so the cache
+    listener it is subscribed as never pays for the column writes.
+    """
+
+    def __init__(self, root: str, retention_days: Optional[int] = None, max_pending: int = 8):
+        self.root = root
+        self.retention_days = retention_days
+        self.max_pending = max_pending
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._recorded = 0
+        self._dropped = 0
+        self._failures = 0
+        self._sealed = 0
+        self._pruned = 0
+        self._maintained_day: Optional[date] = None
+
+    def record(self, snapshot: MarketSnapshot) -> bool:
+        """Queue a snapshot for the writer thread; returns False when it was dropped because the writer is behind."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._dropped += 1
+                return False
+            self._pending += 1
+        self._writer.submit(self._write, snapshot)
+        return True
+
+    def _write(self, snapshot: MarketSnapshot) -> None:
+        try:
+            self.append(snapshot)
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+            logger.warning(f"Failed to record snapshot {snapshot.version} in history: {e}")
+        else:
+            with self._lock:
+                self._recorded += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def flush(self) -> None:
+        """Wait for every queued snapshot to be written."""
+        self._writer.submit(lambda: None).result()
+
+    def append(self, snapshot: MarketSnapshot) -> int:
+        """Append every coin of a snapshot, returning the number of rows written.
+
+        Snapshots not newer than the last one recorded for the day are skipped,
+        so processes sharing the directory can all subscribe safely.
+        """
+        if not len(snapshot):
+            return 0
+        stamp = _millis(snapshot.created_at)
+        day = datetime.fromtimestamp(stamp / 1000, timezone.utc).date()
+        if day != self._maintained_day:
+            self.maintain(day)
+        day_dir = self._day_dir(day)
+        os.makedirs(day_dir, exist_ok=True)
+        with self._locked(day_dir):
+            if os.path.exists(os.path.join(day_dir, _SEALED)):
+                logger.warning(f"History partition {day_dir} is sealed, skipping snapshot {snapshot.version}")
+                return 0
+            times = self._column(day_dir, _TIME)
+            committed = len(times)
+            last_stamp = int(times[-1]) if committed else None
+            del times  # release the mapping before appending to the file
+            if last_stamp is not None and last_stamp >= stamp:
+                return 0
+
+            table = snapshot.table
+            codes = self._encode_symbols(day_dir, table.symbols)
+            columns = {_ID: table.ids, _SYMBOL: codes}
+            columns.update({name: table.column(name) for name in NUMERIC_FIELDS})
+            for name, values in columns.items():
+                self._append_column(day_dir, name, values, committed)
+            # Written last: its length is the committed row count
+            self._append_column(day_dir, _TIME, np.full(len(table), stamp, dtype=np.int64), committed)
+        return len(table)
+
+    def days(self) -> List[date]:
+        """Get every day with recorded history, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        days = []
+        for name in os.listdir(self.root):
+            try:
+                days.append(date.fromisoformat(name))
+            except ValueError:
+                continue
+        return sorted(days)
+
+    def read_day(self, day: date, fields: Sequence[str] = ()) -> Dict[str, np.ndarray]:
+        """Get the `time`, `id`, `symbol` and requested field columns recorded on a day.
+
+        Open partitions are memory-mapped; sealed ones are decompressed.
+        """
+        day_dir = self._day_dir(day)
+        names = [_TIME, _ID, _SYMBOL, *fields]
+        symbols = np.asarray(self._load_symbols(day_dir), dtype=object)
+        sealed = os.path.join(day_dir, _SEALED)
+        if os.path.exists(sealed):
+            with np.load(sealed) as data:
+                columns = {name: data[name] for name in names}
+        else:
+            rows = len(self._column(day_dir, _TIME))
+            columns = {name: self._column(day_dir, name, rows) for name in names}
+        columns[_SYMBOL] = symbols[columns[_SYMBOL]] if len(symbols) else np.empty(0, dtype=object)
+        return columns
+
+    def series(self, symbol: str, field: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> pd.Series:
+        """Get one field of one symbol over [start, end), indexed by UTC snapshot time."""
+        frame = self.frame([field], start, end, symbols=[symbol])
+        return frame.set_index(_TIME)[field]
+
+    def frame(
+        self,
+        fields: Sequence[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        symbols: Optional[Iterable[str]] = None,
+    ) -> pd.DataFrame:
+        """Get the requested fields for every recorded row in [start, end), optionally for some symbols only."""
+        lo = _millis(start) if start else None
+        hi = _millis(end) if end else None
+        wanted = list(set(symbols)) if symbols is not None else None
+        parts = []
+        for day in self._days_between(start, end):
+            columns = self.read_day(day, fields)
+            mask = np.ones(len(columns[_TIME]), dtype=bool)
+            if lo is not None:
+                mask &= columns[_TIME] >= lo
+            if hi is not None:
+                mask &= columns[_TIME] < hi
+            if wanted is not None:
+                mask &= np.isin(columns[_SYMBOL], wanted)
+            if mask.any():
+                parts.append(pd.DataFrame({name: np.asarray(values[mask]) for name, values in columns.items()}))
+        if not parts:
+            return pd.DataFrame(columns=[_TIME, _ID, _SYMBOL, *fields])
+        result = pd.concat(parts, ignore_index=True)
+        result[_TIME] = pd.to_datetime(result[_TIME], unit="ms", utc=True)
+        return result
+
+    def seal(self, day: date) -> None:
+        """Compress a finished day's columns into a single `columns.npz` and drop the raw files."""
+        day_dir = self._day_dir(day)
+        if day >= datetime.now(timezone.utc).date():
+            raise ValueError(f"Cannot seal {day}: the partition may still receive snapshots")
+        with self._locked(day_dir):
+            if os.path.exists(os.path.join(day_dir, _SEALED)):
+                return
+            rows = len(self._column(day_dir, _TIME))
+            columns = {name: np.array(self._column(day_dir, name, rows)) for name in _DTYPES}
+            tmp_path = os.path.join(day_dir, ".columns.tmp.npz")
+            np.savez_compressed(tmp_path, **columns)
+            os.replace(tmp_path, os.path.join(day_dir, _SEALED))
+            for name in _DTYPES:
+                path = self._column_path(day_dir, name)
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def maintain(self, today: Optional[date] = None) -> None:
+        """Seal every day before `today` (UTC today by default) and delete days past the retention window.
+
+        `append` runs this on the first snapshot of each day, so sealing and
+        pruning happen once per day rollover and once after a restart.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        oldest = today - timedelta(days=self.retention_days) if self.retention_days is not None else None
+        for day in self.days():
+            if day >= today:
+                continue
+            if oldest is not None and day < oldest:
+                shutil.rmtree(self._day_dir(day), ignore_errors=True)
+                with self._lock:
+                    self._pruned += 1
+            elif not os.path.exists(os.path.join(self._day_dir(day), _SEALED)):
+                self.seal(day)
+                with self._lock:
+                    self._sealed += 1
+        self._maintained_day = today
+
+    def stats(self) -> Dict[str, Any]:
+        """Get writer counters: snapshots recorded, queued, dropped while the writer was behind, and failed."""
+        with self._lock:
+            return {
+                "recorded": self._recorded,
+                "pending": self._pending,
+                "dropped": self._dropped,
+                "failures": self._failures,
+                "sealed": self._sealed,
+                "pruned": self._pruned,
+            }
+
+    def _days_between(self, start: Optional[datetime], end: Optional[datetime]) -> List[date]:
+        first = start.astimezone(timezone.utc).date() if start else None
+        last = end.astimezone(timezone.utc).date() if end else None
+        return [day for day in self.days() if (first is None or day >= first) and (last is None or day <= last)]
+
+    def _day_dir(self, day: date) -> str:
+        return os.path.join(self.root, day.isoformat())
+
+    @staticmethod
+    def _column_path(day_dir: str, name: str) -> str:
+        return os.path.join(day_dir, f"{name}.bin")
+
+    def _column(self, day_dir: str, name: str, rows: Optional[int] = None) -> np.ndarray:
+        """Memory-map a raw column, limited to `rows` committed rows."""
+        path = self._column_path(day_dir, name)
+        dtype = np.dtype(_DTYPES[name])
+        available = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+        rows = available if rows is None else min(rows, available)
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+    def _append_column(self, day_dir: str, name: str, values: np.ndarray, committed: int) -> None:
+        """Append values, first dropping any bytes a torn append left past the committed rows."""
+        dtype = np.dtype(_DTYPES[name])
+        with open(self._column_path(day_dir, name), "ab") as f:
+            if f.tell() != committed * dtype.itemsize:
+                f.truncate(committed * dtype.itemsize)
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def _load_symbols(self, day_dir: str) -> List[str]:
+        path = os.path.join(day_dir, _SYMBOLS)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def _encode_symbols(self, day_dir: str, symbols: np.ndarray) -> np.ndarray:
+        """Map symbols to the day's dictionary codes, extending the dictionary as needed."""
+        dictionary = self._load_symbols(day_dir)
+        codes = {symbol: code for code, symbol in enumerate(dictionary)}
+        size = len(dictionary)
+        for symbol in symbols:
+            if symbol not in codes:
+                codes[symbol] = len(dictionary)
+                dictionary.append(symbol)
+        if len(dictionary) != size:
+            path = os.path.join(day_dir, _SYMBOLS)
+            with open(path + ".tmp", "w") as f:
+                json.dump(dictionary, f)
+            os.replace(path + ".tmp", path)
+        return np.fromiter((codes[symbol] for symbol in symbols), dtype=np.int32, count=len(symbols))
+
+    @contextmanager
+    def _locked(self, day_dir: str):
+        """Serialize writers to a partition across processes."""
+        os.makedirs(day_dir, exist_ok=True)
+        with open(os.path.join(day_dir, ".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
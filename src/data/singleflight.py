@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the function; every thread that arrives
+    while it is in flight waits for and shares its result (or exception)
+    instead of running it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._calls_total = 0
+        self._executions = 0
+        self._coalesced = 0
+        self._waiting = 0
+        self._max_waiting = 0
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """Get the in-flight future for a key, creating it if this caller leads."""
+        with self._lock:
+            self._calls_total += 1
+            future = self._calls.get(key)
+            if future is not None:
+                self._coalesced += 1
+                self._waiting += 1
+                self._max_waiting = max(self._max_waiting, self._waiting)
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self._executions += 1
+            return future, True
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], T]) -> None:
+        """Run fn as the leader and publish its outcome to every waiter."""
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_result(result)
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._waiting -= 1
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run fn for key in the calling thread, or wait for the call already in flight."""
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+            return future.result()
+        try:
+            return future.result()
+        finally:
+            self._leave()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Whether a call for key is running now."""
+        with self._lock:
+            return key in self._calls
+
+    def stats(self) -> Dict[str, Any]:
+        """Get call counters: executions actually run, callers coalesced onto them, and callers waiting now."""
+        with self._lock:
+            return {
+                "calls": self._calls_total,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "waiting": self._waiting,
+                "max_waiting": self._max_waiting,
+                "in_flight": len(self._calls),
+            }
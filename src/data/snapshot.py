@@ -0,0 +1,104 @@
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from src.data.coin_table import CoinTable
+from src.data.crypto_models import CryptoCoin
+
+
+class SnapshotDelta(NamedTuple):
+    """What changed between a snapshot and the one it was merged onto."""
+
+    base_version: int
+    added: FrozenSet[int]  # ids of coins that are new
+    changed: Mapping[int, FrozenSet[str]]  # id -> names of the fields whose value changed
+
+    @property
+    def touched(self) -> FrozenSet[int]:
+        """Ids of every coin that is new or changed."""
+        return self.added | frozenset(self.changed)
+
+
+class MarketSnapshot:
+    """Immutable, versioned view of one coins fetch with O(1) lookups.
+
+    A snapshot is built once per fetch and then shared by every reader, so
+    lookups never revalidate or rescan the coin universe.
+    """
+
+    __slots__ = ("version", "created_at", "coins", "delta", "_symbol_index", "_by_id", "_by_rank", "_table")
+
+    def __init__(
+        self,
+        coins: Sequence[CryptoCoin],
+        version: int,
+        created_at: Optional[datetime] = None,
+        delta: Optional[SnapshotDelta] = None,
+    ):
+        coins = tuple(coins)
+        symbol_index: Dict[str, List[int]] = {}
+        by_id: Dict[int, CryptoCoin] = {}
+        by_rank: Dict[int, CryptoCoin] = {}
+        for position, coin in enumerate(coins):
+            symbol_index.setdefault(coin.symbol, []).append(position)
+            by_id[coin.id] = coin
+            if coin.market_cap_rank is not None:
+                # Keep the first coin for a rank, matching the upstream list order
+                by_rank.setdefault(coin.market_cap_rank, coin)
+
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "created_at", created_at or datetime.now())
+        object.__setattr__(self, "coins", coins)
+        object.__setattr__(self, "delta", delta)  # None when the previous snapshot is unknown
+        object.__setattr__(self, "_symbol_index", MappingProxyType({s: tuple(p) for s, p in symbol_index.items()}))
+        object.__setattr__(self, "_by_id", MappingProxyType(by_id))
+        object.__setattr__(self, "_by_rank", MappingProxyType(by_rank))
+        object.__setattr__(self, "_table", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __len__(self) -> int:
+        return len(self.coins)
+
+    def __iter__(self):
+        return iter(self.coins)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._symbol_index
+
+    def __repr__(self) -> str:
+        return f"MarketSnapshot(version={self.version}, coins={len(self.coins)}, created_at={self.created_at.isoformat()})"
+
+    @property
+    def table(self) -> CoinTable:
+        """Columnar view of the coins, built on first use; rows follow `coins`."""
+        if self._table is None:
+            object.__setattr__(self, "_table", CoinTable.from_coins(self.coins))
+        return self._table
+
+    @property
+    def symbols(self) -> Mapping[str, Tuple[int, ...]]:
+        """Read-only map of symbol to the positions of the coins carrying it."""
+        return self._symbol_index
+
+    def get(self, symbol: str) -> Optional[CryptoCoin]:
+        """Get the first coin listed under a symbol, or None."""
+        positions = self._symbol_index.get(symbol)
+        return self.coins[positions[0]] if positions else None
+
+    def get_by_id(self, coin_id: int) -> Optional[CryptoCoin]:
+        """Get a coin by its LunarCrush id, or None."""
+        return self._by_id.get(coin_id)
+
+    def get_by_rank(self, rank: int) -> Optional[CryptoCoin]:
+        """Get the coin holding a market cap rank, or None."""
+        return self._by_rank.get(rank)
+
+    def select(self, symbols: Iterable[str]) -> List[CryptoCoin]:
+        """Get every coin whose symbol is in `symbols`, in upstream list order."""
+        positions = sorted(p for symbol in set(symbols) for p in self._symbol_index.get(symbol, ()))
+        return [self.coins[p] for p in positions]
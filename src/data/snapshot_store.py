@@ -0,0 +1,91 @@
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from src.data.crypto_models import CryptoCoin
+from src.data.snapshot import MarketSnapshot
+
+# magic, format version, snapshot version, created_at (unix seconds), payload length
+_HEADER = struct.Struct("<8sHQdQ")
+_MAGIC = b"PMSNAP\x00\x00"
+_FORMAT_VERSION = 2  # 1 was a pickle payload; such files are ignored
+_COINS = TypeAdapter(List[CryptoCoin])
+
+
+class SnapshotStore:
+    """On-disk tier for market snapshots, shared by sibling and restarted processes.
+
+    Each write replaces the file atomically, and a fixed header carries the
+    snapshot version and creation time, so readers can check freshness without
+    touching the payload. The payload is the coins as JSON, read through mmap and
+    parsed by pydantic-core in one pass, so loading skips the network and nothing
+    in the file can execute code. The directory is created private to the service user.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, snapshot: MarketSnapshot) -> None:
+        """Atomically replace the stored snapshot."""
+        payload = _COINS.dump_json(list(snapshot.coins))
+        header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, snapshot.version, snapshot.created_at.timestamp(), len(payload))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".coins-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def peek(self) -> Optional[Tuple[int, datetime]]:
+        """Read only the header: (snapshot version, created_at), or None if there is no usable file."""
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        return self._parse_header(header)
+
+    def read(self) -> Optional[MarketSnapshot]:
+        """Load the stored snapshot, or None if there is no usable file."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                parsed = self._parse_header(mm[:_HEADER.size])
+                if parsed is None:
+                    return None
+                version, created_at = parsed
+                end = _HEADER.size + _HEADER.unpack_from(mm)[4]
+                if len(mm) < end:
+                    return None
+                try:
+                    coins = _COINS.validate_json(mm[_HEADER.size:end])
+                except ValueError:
+                    return None
+        return MarketSnapshot(coins, version=version, created_at=created_at)
+
+    @staticmethod
+    def _parse_header(header: bytes) -> Optional[Tuple[int, datetime]]:
+        if len(header) < _HEADER.size:
+            return None
+        magic, format_version, version, created_at, _ = _HEADER.unpack(header[:_HEADER.size])
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            return None
+        return version, datetime.fromtimestamp(created_at)
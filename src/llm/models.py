@@ -1,4 +1,6 @@
+import logging
 import os
+import threading
 from langchain_anthropic import ChatAnthropic
 from langchain_deepseek import ChatDeepSeek
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -6,7 +8,9 @@ from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
 from enum import Enum
 from pydantic import BaseModel
-from typing import Tuple
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
 
 
 class ModelProvider(str, Enum):
@@ -72,14 +76,18 @@ def get_model_info(model_name: str) -> LLMModel | None:
     return next((model for model in all_models if model.model_name == model_name), None)
 
 
-def get_model(model_name: str, model_provider: ModelProvider) -> ChatOpenAI | ChatGroq | None:
+def _create_model(model_name: str, model_provider: ModelProvider, temperature: Optional[float] = None) -> ChatOpenAI | ChatGroq | None:
+    """Construct a new chat client for a model; temperature and the LLM_REQUEST_TIMEOUT_SECONDS request timeout are fixed at construction."""
+    options = {} if temperature is None else {"temperature": temperature}
+    if timeout := os.getenv("LLM_REQUEST_TIMEOUT_SECONDS"):
+        options["timeout"] = float(timeout)
     if model_provider == ModelProvider.GROQ:
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             # Print error to console
             print(f"API Key Error: Please make sure GROQ_API_KEY is set in your .env file.")
             raise ValueError("Groq API key not found.  Please make sure GROQ_API_KEY is set in your .env file.")
-        return ChatGroq(model=model_name, api_key=api_key)
+        return ChatGroq(model=model_name, api_key=api_key, **options)
     elif model_provider == ModelProvider.OPENAI:
         # Get and validate API key
         api_key = os.getenv("OPENAI_API_KEY")
@@ -87,22 +95,131 @@ def get_model(model_name: str, model_provider: ModelProvider) -> ChatOpenAI | Ch
             # Print error to console
             print(f"API Key Error: Please make sure OPENAI_API_KEY is set in your .env file.")
             raise ValueError("OpenAI API key not found.  Please make sure OPENAI_API_KEY is set in your .env file.")
-        return ChatOpenAI(model=model_name, api_key=api_key)
+        return ChatOpenAI(model=model_name, api_key=api_key, **options)
     elif model_provider == ModelProvider.ANTHROPIC:
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             print(f"API Key Error: Please make sure ANTHROPIC_API_KEY is set in your .env file.")
             raise ValueError("Anthropic API key not found.  Please make sure ANTHROPIC_API_KEY is set in your .env file.")
-        return ChatAnthropic(model=model_name, api_key=api_key)
+        return ChatAnthropic(model=model_name, api_key=api_key, **options)
     elif model_provider == ModelProvider.DEEPSEEK:
         api_key = os.getenv("DEEPSEEK_API_KEY")
         if not api_key:
             print(f"API Key Error: Please make sure DEEPSEEK_API_KEY is set in your .env file.")
             raise ValueError("DeepSeek API key not found.  Please make sure DEEPSEEK_API_KEY is set in your .env file.")
-        return ChatDeepSeek(model=model_name, api_key=api_key)
+        return ChatDeepSeek(model=model_name, api_key=api_key, **options)
     elif model_provider == ModelProvider.GEMINI:
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             print(f"API Key Error: Please make sure GOOGLE_API_KEY is set in your .env file.")
             raise ValueError("Google API key not found.  Please make sure GOOGLE_API_KEY is set in your .env file.")
-        return ChatGoogleGenerativeAI(model=model_name, api_key=api_key)
+        return ChatGoogleGenerativeAI(model=model_name, api_key=api_key, **options)
+
+
+def _sdk_client(llm: Any) -> Any:
+    """Get the provider SDK client (holding the HTTP connection pool) behind a LangChain chat model, if any."""
+    for sdk in (getattr(llm, "_client", None), getattr(getattr(llm, "client", None), "_client", None)):
+        if sdk is not None and hasattr(sdk, "base_url") and hasattr(sdk, "_client"):
+            return sdk
+    return None
+
+
+class LLMClientPool:
+    """Reuses chat clients, and their keep-alive HTTP connections, across calls and requests.
+
+    Clients are keyed by (provider, model, temperature, output mode). Structured-output
+    runnables are cached under their output mode and schema on top of the pooled base client,
+    so they share its connection pool. Pooled clients are shared between threads and are
+    never mutated after construction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[Hashable, Any] = {}
+        self._hits = 0
+        self._misses = 0
+        self._preconnected = 0
+
+    def get(
+        self,
+        model_name: str,
+        model_provider: ModelProvider,
+        temperature: Optional[float] = None,
+        output_schema: Optional[Type[BaseModel]] = None,
+    ) -> Any:
+        """Get a pooled client, wrapped for JSON-mode structured output when `output_schema` is given."""
+        provider = getattr(model_provider, "value", model_provider)
+        key = (provider, model_name, temperature, "json_mode" if output_schema else "text", output_schema)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._hits += 1
+                return client
+            self._misses += 1
+            if output_schema is None:
+                client = _create_model(model_name, model_provider, temperature)
+            else:
+                base_key = (provider, model_name, temperature, "text", None)
+                base = self._clients.get(base_key)
+                if base is None:
+                    base = self._clients[base_key] = _create_model(model_name, model_provider, temperature)
+                client = base.with_structured_output(output_schema, method="json_mode")
+            if client is not None:
+                self._clients[key] = client
+            return client
+
+    def preconnect(self, models: Iterable[Tuple[str, ModelProvider]], timeout: float = 5.0) -> int:
+        """Create clients for `models` and open a connection to each provider ahead of the first call.
+
+        Best effort: providers without an HTTP SDK client, or that cannot be reached, are skipped.
+        Returns the number of providers connected.
+        """
+        connected = 0
+        for model_name, model_provider in models:
+            try:
+                sdk = _sdk_client(self.get(model_name, model_provider))
+                if sdk is None:
+                    continue
+                # Any response, even an error status, leaves the TLS connection in the pool
+                sdk._client.head(str(sdk.base_url), timeout=timeout)
+                connected += 1
+            except Exception as e:
+                logger.warning(f"Error preconnecting to {model_provider} {model_name}: {e}")
+        with self._lock:
+            self._preconnected += connected
+        return connected
+
+    def clear(self) -> None:
+        """Drop every pooled client."""
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool counters: hits, misses (clients created), pooled clients and providers preconnected."""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "clients": len(self._clients), "preconnected": self._preconnected}
+
+
+_client_pool = LLMClientPool()
+
+
+def get_client_pool() -> LLMClientPool:
+    """Get the global LLM client pool."""
+    return _client_pool
+
+
+def get_model(
+    model_name: str,
+    model_provider: ModelProvider,
+    temperature: Optional[float] = None,
+    output_schema: Optional[Type[BaseModel]] = None,
+) -> ChatOpenAI | ChatGroq | None:
+    """Get a pooled chat client for a model; see LLMClientPool.get."""
+    return _client_pool.get(model_name, model_provider, temperature, output_schema)
+
+
+def preconnect_models() -> int:
+    """Preconnect the models listed in LLM_PRECONNECT (comma separated model names from AVAILABLE_MODELS)."""
+    names = [name.strip() for name in os.getenv("LLM_PRECONNECT", "").split(",") if name.strip()]
+    models = [(info.model_name, info.provider) for info in map(get_model_info, names) if info is not None]
+    return _client_pool.preconnect(models) if models else 0
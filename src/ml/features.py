@@ -0,0 +1,179 @@
+import numpy as np
+import scipy.sparse as sp
+from typing import TYPE_CHECKING, Dict, Sequence, Tuple
+from src.data.coin_table import CoinTable
+
+if TYPE_CHECKING:
+    import lightgbm as lgb
+
+# 模型使用的数值特征列（time特征恒为0，不在此列）
+FEATURE_COLUMNS = [
+    'galaxy_score', 'galaxy_score_previous', 'alt_rank', 'alt_rank_previous',
+    'market_cap', 'market_cap_rank', 'volume_24h', 'interactions_24h',
+    'social_volume_24h', 'social_dominance', 'sentiment',
+    'percent_change_1h', 'percent_change_7d', 'percent_change_30d',
+    'market_dominance', 'market_dominance_prev', 'volatility'
+]
+
+# 训练时按int64处理的列，小数部分截断
+INTEGER_COLUMNS = {'alt_rank', 'alt_rank_previous', 'market_cap_rank', 'interactions_24h', 'social_volume_24h'}
+
+# 缺失时整行丢弃的关键字段
+CRITICAL_COLUMNS = ['galaxy_score', 'alt_rank', 'market_cap_rank', 'interactions_24h', 'social_volume_24h', 'social_dominance']
+
+# 模型未见过的币种统一归为该符号
+UNKNOWN_SYMBOL = 'UNKNOWN'
+
+
+class ModelSchema:
+    """
+    模型的特征结构，在加载模型时计算一次，供每次推理复用
+
+    包含特征顺序、数值特征所在列、symbol到独热列的映射，以及未知币种对应的列
+    （模型中没有symbol_UNKNOWN时为-1，即整行独热为0）。
+    """
+
+    __slots__ = ('feature_names', 'numeric_positions', 'symbol_columns', 'unknown_column')
+
+    def __init__(self, feature_names: Sequence[str]):
+        self.feature_names = tuple(feature_names)
+        feature_index = {name: i for i, name in enumerate(self.feature_names)}
+        self.numeric_positions = {col: feature_index[col] for col in FEATURE_COLUMNS if col in feature_index}
+        self.symbol_columns = {name[len('symbol_'):]: i for name, i in feature_index.items() if name.startswith('symbol_')}
+        self.unknown_column = self.symbol_columns.get(UNKNOWN_SYMBOL, -1)
+
+    @classmethod
+    def from_booster(cls, booster: 'lgb.Booster') -> 'ModelSchema':
+        """从已加载的模型构造特征结构"""
+        return cls(booster.feature_name())
+
+    def __len__(self) -> int:
+        return len(self.feature_names)
+
+    def symbol_positions(self, symbols: Sequence[str]) -> np.ndarray:
+        """每个symbol对应的独热列，模型不认识且没有UNKNOWN列时为-1"""
+        get = self.symbol_columns.get
+        unknown = self.unknown_column
+        return np.fromiter((get(symbol, unknown) for symbol in symbols), dtype=np.intp, count=len(symbols))
+
+
+def extract_feature_columns(coins: Sequence | CoinTable) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    取出预测所需的symbol数组和float64数值列（缺失值为NaN）
+    Args:
+        coins: CryptoCoin列表或CoinTable列式数据
+    Returns:
+        (symbols, 数值列字典)
+    """
+    if isinstance(coins, CoinTable):
+        return coins.symbols, {col: coins.column(col) for col in FEATURE_COLUMNS}
+
+    size = len(coins)
+    symbols = np.empty(size, dtype=object)
+    symbols[:] = [coin.symbol for coin in coins]
+    columns = {
+        col: np.fromiter(
+            (np.nan if (value := getattr(coin, col, None)) is None else float(value) for coin in coins),
+            dtype=np.float64,
+            count=size,
+        )
+        for col in FEATURE_COLUMNS
+    }
+    return symbols, columns
+
+
+def _prepare_rows(
+    symbols: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    schema: ModelSchema,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]:
+    """
+    按训练时的规则填充缺失值、丢弃关键字段缺失的行并截断整数列
+    Returns:
+        (保留下来的输入行号, 保留行的数值特征, 保留行的symbol独热列)
+    """
+    # 缺失值填充
+    columns = dict(columns)
+    columns['galaxy_score_previous'] = np.where(np.isnan(columns['galaxy_score_previous']), columns['galaxy_score'], columns['galaxy_score_previous'])
+    columns['alt_rank_previous'] = np.where(np.isnan(columns['alt_rank_previous']), columns['alt_rank'], columns['alt_rank_previous'])
+    columns['sentiment'] = np.nan_to_num(columns['sentiment'], nan=0.0)
+    columns['percent_change_30d'] = np.nan_to_num(columns['percent_change_30d'], nan=0.0)
+
+    # 丢弃关键字段缺失的行
+    keep = symbols != None  # noqa: E711  逐元素比较
+    for col in CRITICAL_COLUMNS:
+        keep &= ~np.isnan(columns[col])
+    rows = np.flatnonzero(keep)
+
+    numeric = {}
+    for col in schema.numeric_positions:
+        values = columns[col][rows]
+        numeric[col] = np.trunc(values) if col in INTEGER_COLUMNS else values
+    return rows, numeric, schema.symbol_positions(symbols[rows])
+
+
+def build_feature_matrix(
+    symbols: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    schema: ModelSchema,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按模型特征顺序直接写入一个预分配的float64特征矩阵
+
+    缺失值填充、关键字段过滤、整数截断和symbol独热编码与训练时的pandas流程一致，
+    未知币种映射为symbol_UNKNOWN（模型中没有该特征时整行独热为0）。
+
+    Args:
+        symbols: 每行的币种符号
+        columns: 数值列字典，缺失值为NaN
+        schema: 模型的特征结构
+    Returns:
+        (特征矩阵, 保留下来的输入行号)
+    """
+    rows, numeric, positions = _prepare_rows(symbols, columns, schema)
+    matrix = np.zeros((len(rows), len(schema)), dtype=np.float64)
+
+    # 数值特征
+    for col, position in schema.numeric_positions.items():
+        matrix[:, position] = numeric[col]
+
+    # symbol独热编码
+    hit = positions >= 0
+    matrix[np.flatnonzero(hit), positions[hit]] = 1.0
+
+    return matrix, rows
+
+
+def build_feature_csr(
+    symbols: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    schema: ModelSchema,
+) -> Tuple[sp.csr_matrix, np.ndarray]:
+    """
+    构造与build_feature_matrix等价的CSR稀疏特征矩阵
+
+    每行只存数值特征和至多一个symbol独热值，内存和耗时随 行数×数值特征数 增长，
+    而不是 行数×全部特征数。NaN作为显式值保存，LightGBM仍按缺失值处理。
+
+    Returns:
+        (CSR特征矩阵, 保留下来的输入行号)
+    """
+    rows, numeric, positions = _prepare_rows(symbols, columns, schema)
+    count = len(rows)
+
+    # 每行依次为各数值特征和symbol独热列，未命中的独热列被掩掉
+    values = np.empty((count, len(numeric) + 1), dtype=np.float64)
+    indices = np.empty((count, len(numeric) + 1), dtype=np.int32)
+    for i, (col, position) in enumerate(schema.numeric_positions.items()):
+        values[:, i] = numeric[col]
+        indices[:, i] = position
+    values[:, -1] = 1.0
+    indices[:, -1] = positions
+    mask = np.ones(values.shape, dtype=bool)
+    mask[:, -1] = positions >= 0
+
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(mask.sum(axis=1), out=indptr[1:])
+    matrix = sp.csr_matrix((values[mask], indices[mask], indptr), shape=(count, len(schema)))
+    matrix.sort_indices()
+    return matrix, rows
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+
+def file_version(path: str) -> str:
+    """模型文件的版本标识，由文件名、大小和修改时间决定"""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+class ModelRegistry:
+    """
+    模型注册表：管理当前生效的模型和可选的影子模型
+
+    新版本在后台线程中加载并预热，完成后通过一次引用赋值原子切换；
+    切换前已取得旧模型的预测继续使用旧模型完成，不会被阻塞。
+    影子模型与生效模型对同一批特征打分，结果只记录用于对比，从不返回给调用方，
+    并在单独的线程中执行，繁忙时跳过，不增加请求延迟。
+
+    holder需提供 path、version、get()、warmup()，即xgboost_pred.ModelHolder。
+    """
+
+    def __init__(self, factory: Callable[[str], Any], path: str, threshold: float, max_comparisons: int = 100):
+        self._factory = factory
+        self._threshold = threshold
+        self._active = factory(path)
+        self._shadow = None
+        self._load_lock = threading.Lock()  # 同一时间只加载一个新版本
+        self._stats_lock = threading.Lock()
+        self._swaps = 0
+        self._failures = 0
+        self._last_swap: Optional[Dict[str, Any]] = None
+        self._last_error: Optional[str] = None
+
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-shadow")
+        self._shadow_pending = False
+        self._shadow_runs = 0
+        self._shadow_skipped = 0
+        self._shadow_seconds = 0.0
+        self._comparisons = deque(maxlen=max_comparisons)
+
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watcher = threading.Event()
+
+    @property
+    def active(self):
+        """当前生效的模型容器；调用方应在一次预测中只取一次"""
+        return self._active
+
+    @property
+    def shadow(self):
+        """当前的影子模型容器，没有时为None"""
+        return self._shadow
+
+    def load(self, path: Optional[str] = None, wait: bool = False) -> threading.Thread:
+        """
+        在后台加载并预热新版本模型，完成后原子切换为生效模型
+        Args:
+            path: 模型文件路径，为None时重新加载当前模型文件
+            wait: 是否等待加载和切换完成
+        Returns:
+            执行加载的线程
+        """
+        return self._start(self._load_active, path or self._active.path, wait)
+
+    def load_shadow(self, path: str, wait: bool = False) -> threading.Thread:
+        """在后台加载并预热影子模型"""
+        return self._start(self._load_shadow, path, wait)
+
+    def clear_shadow(self) -> None:
+        """停止影子打分"""
+        self._shadow = None
+
+    def _start(self, target: Callable[[str], None], path: str, wait: bool) -> threading.Thread:
+        thread = threading.Thread(target=target, args=(path,), name="model-load", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _prepare(self, path: str):
+        """加载并预热模型，失败时记录错误并返回None"""
+        try:
+            holder = self._factory(path)
+            holder.warmup()
+            return holder
+        except Exception as e:
+            with self._stats_lock:
+                self._failures += 1
+                self._last_error = f"{path}: {e}"
+            print(f"Error loading model {path}: {e}")
+            return None
+
+    def _load_active(self, path: str) -> None:
+        with self._load_lock:
+            start = time.perf_counter()
+            holder = self._prepare(path)
+            if holder is None:
+                return
+            loaded = time.perf_counter()
+            previous, self._active = self._active, holder  # 原子切换
+            swapped = time.perf_counter()
+            with self._stats_lock:
+                self._swaps += 1
+                self._last_swap = {
+                    "from": previous.version,
+                    "to": holder.version,
+                    "load_seconds": loaded - start,
+                    "swap_seconds": swapped - loaded,
+                }
+
+    def _load_shadow(self, path: str) -> None:
+        with self._load_lock:
+            holder = self._prepare(path)
+            if holder is not None:
+                self._shadow = holder
+
+    def check_for_update(self) -> bool:
+        """当前模型文件被替换时在后台加载新文件，返回是否触发了加载"""
+        active = self._active
+        try:
+            changed = file_version(active.path) != active.version
+        except OSError:
+            return False
+        if changed and not self._load_lock.locked():
+            self.load(active.path)
+        return changed
+
+    def start_watcher(self, interval: float) -> None:
+        """每隔interval秒检查一次模型文件，被替换时自动热切换"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_watcher.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop_watcher.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop_watcher.wait(interval):
+            self.check_for_update()
+
+    def score_shadow(self, primary: np.ndarray, predict: Callable[[Any], np.ndarray]) -> bool:
+        """
+        在后台用影子模型对同一批输入打分并与生效模型的结果对比
+        Args:
+            primary: 生效模型的预测结果
+            predict: 给定影子模型容器，返回其预测结果
+        Returns:
+            是否提交了影子打分（没有影子模型或上一次尚未完成时为False）
+        """
+        shadow = self._shadow
+        if shadow is None:
+            return False
+        with self._stats_lock:
+            if self._shadow_pending:
+                self._shadow_skipped += 1
+                return False
+            self._shadow_pending = True
+        self._shadow_executor.submit(self._run_shadow, shadow, primary, predict)
+        return True
+
+    def _run_shadow(self, shadow, primary: np.ndarray, predict: Callable[[Any], np.ndarray]) -> None:
+        start = time.perf_counter()
+        try:
+            scores = predict(shadow)
+        except Exception as e:
+            print(f"Error scoring shadow model: {e}")
+            with self._stats_lock:
+                self._shadow_pending = False
+            return
+        elapsed = time.perf_counter() - start
+        diff = np.abs(scores - primary)
+        comparison = {
+            "version": shadow.version,
+            "rows": len(primary),
+            "mean_abs_diff": float(diff.mean()) if len(diff) else 0.0,
+            "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+            "label_agreement": float(((scores > self._threshold) == (primary > self._threshold)).mean()) if len(diff) else 1.0,
+            "seconds": elapsed,
+        }
+        with self._stats_lock:
+            self._shadow_pending = False
+            self._shadow_runs += 1
+            self._shadow_seconds += elapsed
+            self._comparisons.append(comparison)
+
+    def wait_for_shadow(self) -> None:
+        """等待已提交的影子打分完成"""
+        self._shadow_executor.submit(lambda: None).result()
+
+    def comparisons(self) -> list:
+        """最近的影子对比记录，从旧到新"""
+        with self._stats_lock:
+            return list(self._comparisons)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取注册表统计：当前版本、切换次数和耗时、影子打分次数和开销"""
+        shadow = self._shadow
+        with self._stats_lock:
+            return {
+                "active": self._active.version,
+                "shadow": shadow.version if shadow is not None else None,
+                "swaps": self._swaps,
+                "failures": self._failures,
+                "last_swap": self._last_swap,
+                "last_error": self._last_error,
+                "shadow_runs": self._shadow_runs,
+                "shadow_skipped": self._shadow_skipped,
+                "shadow_seconds_total": self._shadow_seconds,
+                "shadow_seconds_mean": self._shadow_seconds / self._shadow_runs if self._shadow_runs else None,
+                "last_comparison": self._comparisons[-1] if self._comparisons else None,
+            }
@@ -0,0 +1,292 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.data.coin_table import CoinTable
+from src.data.singleflight import SingleFlight
+from src.data.snapshot import MarketSnapshot
+from src.ml.features import FEATURE_COLUMNS
+
+# 用给定的模型容器对整张CoinTable打分，返回 (每行的symbol, 保留下来的行号, 这些行的上涨概率)
+Scorer = Callable[[CoinTable, Any], Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+PREDICTION_COLUMNS = ['symbol', 'predicted_label', 'confidence']
+
+# 排名前缀索引为每个前缀保留的置信度最高的币种数
+TOP_K = 3
+
+
+class ScoredSnapshot:
+    """
+    一份市场快照在某个模型版本下的全量预测结果
+
+    按快照行号保存标签和置信度（预处理中被丢弃的行为NaN），
+    单个币种的查询为O(1)，任意行子集都可以直接组装成predict_from_coin_data格式的DataFrame。
+
+    同时预先计算排名前缀索引：按market_cap_rank排序后，每个前缀中置信度最高的TOP_K行，
+    任意排名阈值n的top-k查询只需一次二分查找。
+    """
+
+    __slots__ = (
+        'key', 'ids', 'symbols', 'features', 'labels', 'confidence', 'rescored',
+        '_by_symbol', '_sorted_ranks', '_prefix_top', '_overall_top',
+    )
+
+    def __init__(
+        self,
+        key: Hashable,
+        symbols: np.ndarray,
+        rows: np.ndarray,
+        confidence: np.ndarray,
+        threshold: float,
+        ranks: Optional[np.ndarray] = None,
+        ids: Optional[np.ndarray] = None,
+        features: Optional[np.ndarray] = None,
+        rescored: Optional[int] = None,
+    ):
+        self.key = key
+        self.ids = ids  # 币种id和原始特征行，供下一次刷新增量打分时比对
+        self.features = features
+        self.rescored = len(symbols) if rescored is None else rescored  # 本次实际送入模型的行数
+        self.symbols = symbols
+        self.confidence = np.full(len(symbols), np.nan)
+        self.confidence[rows] = confidence
+        self.labels = np.full(len(symbols), np.nan)
+        self.labels[rows] = (confidence > threshold).astype(np.float64)
+
+        # 同一symbol有多行时取置信度最高的一行，与按置信度降序排序后取首行一致
+        order = np.argsort(-confidence, kind='stable')
+        by_symbol = {}
+        for symbol, label, value in zip(symbols[rows[order]].tolist(), self.labels[rows[order]].tolist(), confidence[order].tolist()):
+            if symbol not in by_symbol:
+                by_symbol[symbol] = (int(label), value)
+        self._by_symbol = by_symbol
+        self._build_rank_index(np.full(len(symbols), np.nan) if ranks is None else ranks)
+
+    def _build_rank_index(self, ranks: np.ndarray) -> None:
+        """
+        构造排名前缀索引
+
+        有排名的行按排名稳定排序，_prefix_top[i] 为前i行中置信度最高的TOP_K个行号（不足时以-1补齐）；
+        没有排名的行不进入任何前缀，只参与 n == 0（全部币种）的查询。
+        """
+        ranked = np.flatnonzero(~np.isnan(ranks))
+        ranked = ranked[np.argsort(ranks[ranked], kind='stable')]
+        self._sorted_ranks = ranks[ranked]
+
+        prefix_top = [[-1] * TOP_K]
+        top = []  # (置信度, 行号)，按置信度降序
+        for row, value in zip(ranked.tolist(), self.confidence[ranked].tolist()):
+            # 置信度相同时排名靠前的行优先；NaN与任何值比较都为False，不会进入top
+            if (len(top) < TOP_K and value == value) or (top and value > top[-1][0]):
+                position = next((j for j, (other, _) in enumerate(top) if value > other), len(top))
+                top.insert(position, (value, row))
+                del top[TOP_K:]
+            prefix_top.append([row for _, row in top] + [-1] * (TOP_K - len(top)))
+        self._prefix_top = np.array(prefix_top, dtype=np.intp)
+
+        scored = np.flatnonzero(~np.isnan(self.confidence))
+        self._overall_top = scored[np.argsort(-self.confidence[scored], kind='stable')[:TOP_K]]
+
+    def __len__(self) -> int:
+        return len(self._by_symbol)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._by_symbol
+
+    def get(self, symbol: str) -> Optional[Tuple[int, float]]:
+        """获取币种的 (预测标签, 置信度)，没有预测结果时为None"""
+        return self._by_symbol.get(symbol)
+
+    def frame(self, rows: Optional[Sequence[int]] = None) -> pd.DataFrame:
+        """
+        组装指定快照行的预测结果，格式与predict_from_coin_data一致
+        Args:
+            rows: 快照行号，为None时使用全部行
+        Returns:
+            按置信度降序排序的DataFrame，没有预测结果的行被跳过
+        """
+        rows = np.arange(len(self.symbols)) if rows is None else np.asarray(rows, dtype=np.intp)
+        rows = rows[~np.isnan(self.confidence[rows])]
+        result_df = pd.DataFrame({
+            'symbol': self.symbols[rows],
+            'predicted_label': self.labels[rows],
+            'confidence': self.confidence[rows],
+        })
+        return result_df.sort_values(by='confidence', ascending=False)
+
+    def top_rows(self, n: int) -> np.ndarray:
+        """
+        market_cap_rank <= n 的币种中置信度最高的至多TOP_K个快照行号，按置信度降序
+        Args:
+            n: 市值排名阈值，为0时在全部币种（包括没有排名的币种）中选取
+        """
+        if n == 0:
+            return self._overall_top
+        top = self._prefix_top[np.searchsorted(self._sorted_ranks, n, side='right')]
+        return top[top >= 0]
+
+    def top(self, n: int) -> pd.DataFrame:
+        """以predict_from_coin_data的格式返回top_rows(n)的预测结果"""
+        rows = self.top_rows(n)
+        return pd.DataFrame({
+            'symbol': self.symbols[rows],
+            'predicted_label': self.labels[rows],
+            'confidence': self.confidence[rows],
+        }, index=rows)
+
+
+def _feature_rows(table: CoinTable) -> np.ndarray:
+    """把模型输入的数值列拼成 行数×特征数 的矩阵，用于比对两次刷新间的变化"""
+    return np.column_stack([table.column(col) for col in FEATURE_COLUMNS]) if len(table) else np.empty((0, len(FEATURE_COLUMNS)))
+
+
+def _unchanged_rows(previous: ScoredSnapshot, ids: np.ndarray, symbols: np.ndarray, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按币种id把新快照的行与上一次打分的行对齐，找出模型输入完全相同的行
+    Returns:
+        (新快照中未变化的行号, 它们在上一次结果中的行号)
+    """
+    if len(previous.ids) == 0 or len(ids) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    order = np.argsort(previous.ids, kind='stable')
+    found = np.minimum(np.searchsorted(previous.ids, ids, sorter=order), len(order) - 1)
+    old = order[found]
+    old_features = previous.features[old]
+    same = (previous.ids[old] == ids) & (previous.symbols[old] == symbols)
+    same &= ((old_features == features) | (np.isnan(old_features) & np.isnan(features))).all(axis=1)
+    rows = np.flatnonzero(same)
+    return rows, old[rows]
+
+
+class PredictionCache:
+    """
+    按快照版本和模型版本缓存全量预测结果
+
+    每次刷新后的首个请求对整个币种集合打一次分，之后所有分析师的请求都直接查表；
+    同一快照的并发请求通过SingleFlight共享同一次计算。
+    版本号为0的临时快照（未经过缓存的直连数据）不会被缓存。
+
+    开启增量打分时，新快照按币种id与同一模型版本最近一次的结果比对，
+    模型输入完全相同的行直接沿用上次的预测，只把新增或变化的行送入模型。
+
+    active_model返回当前生效的模型容器（需有version属性），每次请求只取一次，
+    同时用于缓存键和打分。
+    """
+
+    def __init__(
+        self,
+        score: Scorer,
+        active_model: Callable[[], Any],
+        threshold: float,
+        max_entries: int = 2,
+        incremental: bool = True,
+    ):
+        self._score = score
+        self._active_model = active_model
+        self._threshold = threshold
+        self._max_entries = max_entries
+        self._incremental = incremental
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, ScoredSnapshot]' = OrderedDict()
+        self._flight = SingleFlight()
+        self._hits = 0
+        self._misses = 0
+        self._uncached = 0
+        self._full_scores = 0
+        self._incremental_scores = 0
+        self._rows_rescored = 0
+        self._rows_carried = 0
+        self._last_refresh: Optional[Dict[str, Any]] = None
+
+    def get(self, snapshot: MarketSnapshot) -> ScoredSnapshot:
+        """获取快照的全量预测结果，未命中时计算并缓存"""
+        # 只取一次当前模型：缓存键中的版本和实际打分的模型必须一致，期间的热切换不影响本次结果
+        # created_at 区分不同缓存实例产生的同号快照
+        model = self._active_model()
+        key = (snapshot.version, snapshot.created_at, model.version)
+        if snapshot.version == 0:
+            with self._lock:
+                self._uncached += 1
+            return self._compute(key, snapshot, model)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return entry
+            self._misses += 1
+        return self._flight.do(key, lambda: self._compute_and_store(key, snapshot, model))
+
+    def _compute(self, key: Hashable, snapshot: MarketSnapshot, model: Any, previous: Optional[ScoredSnapshot] = None) -> ScoredSnapshot:
+        table = snapshot.table
+        ranks = table.column('market_cap_rank')
+        features = _feature_rows(table)
+        if previous is not None:
+            unchanged, old_rows = _unchanged_rows(previous, table.ids, table.symbols, features)
+        # 变化超过一半时，取子表和回填的开销不再划算，直接全量打分
+        if previous is None or len(unchanged) * 2 < len(table):
+            symbols, rows, confidence = self._score(table, model)
+            return ScoredSnapshot(key, symbols, rows, confidence, self._threshold, ranks, table.ids, features)
+
+        full = np.full(len(table), np.nan)
+        full[unchanged] = previous.confidence[old_rows]
+
+        changed = np.setdiff1d(np.arange(len(table)), unchanged, assume_unique=True)
+        if len(changed):
+            _, kept, confidence = self._score(table.take(changed), model)
+            full[changed[kept]] = confidence
+
+        rows = np.flatnonzero(~np.isnan(full))
+        return ScoredSnapshot(key, table.symbols, rows, full[rows], self._threshold, ranks, table.ids, features, rescored=len(changed))
+
+    def _previous_entry(self, model_version: Hashable) -> Optional[ScoredSnapshot]:
+        """同一模型版本下最近一次缓存的结果"""
+        with self._lock:
+            return next((entry for key, entry in reversed(self._entries.items()) if key[2] == model_version), None)
+
+    def _compute_and_store(self, key: Hashable, snapshot: MarketSnapshot, model: Any) -> ScoredSnapshot:
+        previous = self._previous_entry(key[2]) if self._incremental else None
+        entry = self._compute(key, snapshot, model, previous)
+        with self._lock:
+            if entry.rescored == len(entry.symbols):
+                self._full_scores += 1
+            else:
+                self._incremental_scores += 1
+            self._rows_rescored += entry.rescored
+            self._rows_carried += len(entry.symbols) - entry.rescored
+            self._last_refresh = {
+                'version': snapshot.version,
+                'rows': len(entry.symbols),
+                'rescored': entry.rescored,
+                'incremental': entry.rescored < len(entry.symbols),
+            }
+            self._entries[key] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        """清空缓存，例如更换模型后"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计：命中、未命中、不缓存的临时快照次数，实际打分次数，以及每次刷新重新打分的行数"""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'uncached': self._uncached,
+                'entries': len(self._entries),
+                'full_scores': self._full_scores,
+                'incremental_scores': self._incremental_scores,
+                'rows_rescored': self._rows_rescored,
+                'rows_carried': self._rows_carried,
+                'last_refresh': self._last_refresh,
+                'scoring': self._flight.stats(),
+            }
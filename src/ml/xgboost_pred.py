@@ -1,240 +1,352 @@
+import numpy as np
 import pandas as pd
-import lightgbm as lgb
 import os
-from typing import List
-from src.tools.api import get_coins
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+import scipy.sparse as sp
+from src.data.coin_table import CoinTable
+from src.data.snapshot import MarketSnapshot
+from src.ml.features import ModelSchema, build_feature_csr, build_feature_matrix, extract_feature_columns
+from src.ml.model_registry import ModelRegistry, file_version
+from src.ml.prediction_cache import PREDICTION_COLUMNS, PredictionCache, ScoredSnapshot
+from src.ml.tree_artifact import TreeEnsemble, flatten_model
+from src.tools.api import get_coins, get_market_snapshot
+
+if TYPE_CHECKING:
+    import lightgbm as lgb
 
 # === 1. 加载模型 ===
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'lgbm_model.txt')
-if not os.path.exists(MODEL_PATH):
-    raise FileNotFoundError(f"模型文件不存在：{MODEL_PATH}")
-model = lgb.Booster(model_file=MODEL_PATH)
 
-def get_top_market_cap_coins(n: int) -> List:
+
+class ModelHolder:
+    """
+    线程安全的惰性模型容器
+
+    导入本模块时不加载模型，首次预测或调用warmup()时才加载，
+    并发的首次调用只会加载一次。LightGBM模型和NumPy树模型分别按需加载，
+    warmup()也只加载配置的引擎，MODEL_ENGINE=numpy 的进程无需导入lightgbm。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.artifact_path = os.path.splitext(path)[0] + '.bin'
+        self._lock = threading.Lock()
+        self._model = None
+        self._ensemble = None
+        self._schema = None
+        self._version = None
+
+    @property
+    def version(self) -> str:
+        """模型版本，由模型文件名、大小和修改时间决定，用作预测缓存的键"""
+        if self._version is None:
+            self._version = file_version(self.path)
+        return self._version
+
+    @property
+    def loaded(self) -> bool:
+        """模型是否已加载"""
+        return self._model is not None
+
+    def get(self) -> Tuple['lgb.Booster', ModelSchema]:
+        """获取模型及其特征结构，未加载时先加载"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        return self._model, self._schema
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"模型文件不存在：{self.path}")
+        self.version  # 读取文件前记下版本，文件随后被替换时由注册表检测到
+        import lightgbm as lgb  # 推迟导入，不预测的进程无需承担其导入开销
+
+        model = lgb.Booster(model_file=self.path)
+        # 特征结构只在加载模型时计算一次
+        if self._schema is None:
+            self._schema = ModelSchema.from_booster(model)
+        self._model = model  # 最后赋值，其他线程看到模型时特征结构已就绪
+
+    def get_ensemble(self) -> Tuple[TreeEnsemble, ModelSchema]:
+        """获取NumPy树模型及特征结构，未加载时先加载"""
+        if self._ensemble is None:
+            with self._lock:
+                if self._ensemble is None:
+                    self._load_ensemble()
+        return self._ensemble, self._schema
+
+    def _load_ensemble(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"模型文件不存在：{self.path}")
+        self.version
+        # 优先内存映射构建好的二进制模型；不存在或比文本模型旧时直接从文本模型扁平化
+        if os.path.exists(self.artifact_path) and os.path.getmtime(self.artifact_path) >= os.path.getmtime(self.path):
+            ensemble = TreeEnsemble.load(self.artifact_path)
+        else:
+            with open(self.path) as f:
+                ensemble = TreeEnsemble(*flatten_model(f.read()))
+        if self._schema is None:
+            self._schema = ModelSchema(ensemble.feature_names)
+        self._ensemble = ensemble
+
+    def warmup(self, engines: Sequence[str] = None) -> None:
+        """加载模型并执行一次空预测，使首个请求不再承担加载和初始化开销；engines为None时预热配置会用到的引擎"""
+        for engine in engines or _configured_engines():
+            predictor, schema = _predictor(engine, self)
+            predictor.predict(sp.csr_matrix((1, len(schema))))
+
+
+# 上涨概率超过该阈值时预测标签为1
+LABEL_THRESHOLD = 0.35
+
+_registry = ModelRegistry(ModelHolder, MODEL_PATH, LABEL_THRESHOLD)
+
+
+def get_model_registry() -> ModelRegistry:
+    """获取模型注册表，用于热切换模型和影子打分"""
+    return _registry
+
+
+def get_model() -> 'lgb.Booster':
+    """获取预测模型，首次调用时加载"""
+    return _registry.active.get()[0]
+
+
+def get_model_schema() -> ModelSchema:
+    """获取模型的特征结构，首次调用时加载模型"""
+    return _registry.active.get()[1]
+
+
+# 推理引擎：LightGBM 的 Booster.predict，或基于扁平化树数组的 NumPy 向量化实现，两者结果完全一致
+ENGINES = ('lightgbm', 'numpy')
+
+# 不超过该行数的批次视为小批量（如叙事分析的几个币种），否则为大批量（如全量刷新）
+SMALL_BATCH_ROWS = 64
+
+# engine='auto' 时小批量和大批量各自使用的引擎，warmup() 时按实测耗时校准
+_auto_engines = {'small': 'lightgbm', 'large': 'lightgbm'}
+
+
+def _predictor(engine: str, holder: ModelHolder = None) -> Tuple:
+    """获取指定引擎的预测器及特征结构，holder为None时使用当前生效的模型"""
+    if holder is None:
+        holder = _registry.active
+    if engine == 'lightgbm':
+        return holder.get()
+    if engine == 'numpy':
+        return holder.get_ensemble()
+    raise ValueError(f"未知的推理引擎：{engine}，可选 {ENGINES} 或 'auto'")
+
+
+def _configured_engines() -> Tuple[str, ...]:
+    """MODEL_ENGINE 指定的引擎；未指定或为 'auto' 时两个引擎都可能用到"""
+    engine = os.getenv('MODEL_ENGINE', 'auto')
+    return ENGINES if engine == 'auto' else (engine,)
+
+
+def _resolve_engine(engine: str, rows: int) -> str:
+    """解析 engine='auto'：环境变量 MODEL_ENGINE 优先，否则按批量大小选择校准过的引擎"""
+    if engine == 'auto':
+        engine = os.getenv('MODEL_ENGINE', 'auto')
+    if engine == 'auto':
+        return _auto_engines['small' if rows <= SMALL_BATCH_ROWS else 'large']
+    return engine
+
+
+def calibrate_engines(large_rows: int = 1000, repeat: int = 5) -> Dict[str, str]:
+    """
+    分别在小批量和大批量上实测两个引擎的耗时，更新 engine='auto' 的选择
+    Returns:
+        {'small': 引擎, 'large': 引擎}
+    """
+    for size, rows in (('small', 3), ('large', large_rows)):
+        timings = {}
+        for engine in ENGINES:
+            predictor, schema = _predictor(engine)
+            features = sp.csr_matrix((rows, len(schema)))
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                predictor.predict(features)
+                best = min(best, time.perf_counter() - start)
+            timings[engine] = best
+        _auto_engines[size] = min(timings, key=timings.get)
+    return dict(_auto_engines)
+
+
+def warmup() -> None:
+    """
+    在服务就绪前预加载并预热配置的引擎；MODEL_ENGINE 未指定时预热两个引擎并校准 engine='auto' 的引擎选择
+
+    设置了 MODEL_SHADOW_PATH 时在后台加载影子模型；
+    设置了 MODEL_RELOAD_INTERVAL_SECONDS 时定期检查模型文件，被替换后自动热切换。
+    """
+    _registry.active.warmup()
+    if len(_configured_engines()) > 1:
+        calibrate_engines()
+    if shadow_path := os.getenv('MODEL_SHADOW_PATH'):
+        _registry.load_shadow(shadow_path)
+    if interval := os.getenv('MODEL_RELOAD_INTERVAL_SECONDS'):
+        _registry.start_watcher(float(interval))
+
+
+def __getattr__(name: str):
+    # 兼容旧代码直接使用模块属性 model / model_schema
+    if name == 'model':
+        return get_model()
+    if name == 'model_schema':
+        return get_model_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_top_market_cap_coins(n: int, snapshot: MarketSnapshot = None) -> List:
     """
     获取市值排名前N的加密货币列表
     
     Args:
         n: 市值排名阈值，返回market_cap_rank <= n的加密货币
             如果n为0，则返回所有加密货币
+        snapshot: 使用的市场快照，为None时使用当前快照
         
     Returns:
         包含市值排名前N的加密货币列表，如果n为0则返回所有加密货币
     """
     try:
-        # 获取所有加密货币数据
-        coins = get_coins()
-        
-        # 如果n为0，返回所有加密货币
-        if n == 0:
-            return coins
-            
-        # 筛选市值排名前N的加密货币
-        top_coins = [coin for coin in coins if coin.market_cap_rank <= n]
-        
-        # 按市值排名排序
-        top_coins.sort(key=lambda x: x.market_cap_rank)
-        
-        return top_coins
+        if snapshot is None:
+            snapshot = get_market_snapshot()
+
+        # 在列式数据上筛选并按市值排名排序
+        return [snapshot.coins[row] for row in snapshot.table.rows_by_rank(n)]
         
     except Exception as e:
         print(f"Error getting top market cap coins: {e}")
         return []
 
-def predict_from_coin_data(coins: List) -> pd.DataFrame:
+def get_top_market_cap_table(n: int, snapshot: MarketSnapshot = None) -> CoinTable:
+    """
+    获取市值排名前N的加密货币列式数据，可直接用于预测
+    
+    Args:
+        n: 市值排名阈值，返回market_cap_rank <= n的加密货币
+            如果n为0，则返回所有加密货币
+        snapshot: 使用的市场快照，为None时使用当前快照
+        
+    Returns:
+        按市值排名排序的CoinTable
+    """
+    if snapshot is None:
+        snapshot = get_market_snapshot()
+    return snapshot.table.take(snapshot.table.rows_by_rank(n))
+
+def score_coin_data(coins: List | CoinTable, sparse: bool = True, engine: str = 'auto', holder: ModelHolder = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    对币种数据打分，参数同predict_from_coin_data
+    Args:
+        holder: 打分使用的模型容器，为None时取当前生效的模型
+    Returns:
+        (每个输入的symbol, 预处理后保留下来的输入行号, 这些行的上涨概率)
+    """
+    # === 2. 按模型特征顺序直接构造特征矩阵 ===
+    symbols, columns = extract_feature_columns(coins)
+    engine = _resolve_engine(engine, len(symbols))
+    if holder is None:
+        holder = _registry.active  # 整个预测使用同一个模型版本，期间的热切换不影响本次预测
+    model, model_schema = _predictor(engine, holder)
+    build = build_feature_csr if sparse else build_feature_matrix
+    features, rows = build(symbols, columns, model_schema)
+    if len(rows) == 0:
+        return symbols, rows, np.empty(0)
+
+    # === 5. 模型预测 ===
+    y_pred = model.predict(features)
+
+    # 影子模型在后台对同一批特征打分，结果只记录不返回
+    def shadow_predict(shadow: ModelHolder) -> np.ndarray:
+        shadow_model, shadow_schema = _predictor(engine, shadow)
+        if shadow_schema.feature_names == model_schema.feature_names:
+            return shadow_model.predict(features)
+        return shadow_model.predict(build(symbols, columns, shadow_schema)[0])
+
+    _registry.score_shadow(y_pred, shadow_predict)
+    return symbols, rows, y_pred
+
+def predict_from_coin_data(coins: List | CoinTable, sparse: bool = True, engine: str = 'auto') -> pd.DataFrame:
     """
     使用coin_data进行预测
     Args:
-        coins: 从get_coins()获取的加密货币数据列表
+        coins: 从get_coins()获取的加密货币数据列表，或CoinTable列式数据
+        sparse: 是否以CSR稀疏矩阵输入模型（每行至多一个symbol独热值），为False时使用稠密矩阵
+        engine: 推理引擎，'lightgbm'、'numpy' 或 'auto'（按批量大小选择更快的引擎）
     Returns:
         包含预测结果的DataFrame
     """
-    # 将coin_data转换为DataFrame
-    data = []
-    for coin in coins:
-        data.append({
-            'symbol': coin.symbol,
-            'time': coin.time if hasattr(coin, 'time') else None,
-            'galaxy_score': coin.galaxy_score,
-            'galaxy_score_previous': coin.galaxy_score_previous if hasattr(coin, 'galaxy_score_previous') else None,
-            'alt_rank': coin.alt_rank,
-            'alt_rank_previous': coin.alt_rank_previous if hasattr(coin, 'alt_rank_previous') else None,
-            'market_cap': coin.market_cap if hasattr(coin, 'market_cap') else None,
-            'market_cap_rank': coin.market_cap_rank,
-            'volume_24h': coin.volume_24h if hasattr(coin, 'volume_24h') else None,
-            'interactions_24h': coin.interactions_24h,
-            'social_volume_24h': coin.social_volume_24h,
-            'social_dominance': coin.social_dominance,
-            'sentiment': coin.sentiment,
-            'percent_change_1h': coin.percent_change_1h if hasattr(coin, 'percent_change_1h') else None,
-            'percent_change_7d': coin.percent_change_7d if hasattr(coin, 'percent_change_7d') else None,
-            'percent_change_30d': coin.percent_change_30d if hasattr(coin, 'percent_change_30d') else None,
-            'market_dominance': coin.market_dominance,
-            'market_dominance_prev': coin.market_dominance_prev if hasattr(coin, 'market_dominance_prev') else None,
-            'volatility': coin.volatility
-        })
-    
-    df = pd.DataFrame(data)
-    # print(f"Initial DataFrame shape: {df.shape}")
-    
-    # Store original symbols before any transformations
-    original_symbols = df['symbol'].copy()
-    
-    # === 3. 筛选与训练一致的特征字段 ===
-    feature_cols = [
-        'symbol', 'time', 'galaxy_score', 'galaxy_score_previous', 'alt_rank', 'alt_rank_previous',
-        'market_cap', 'market_cap_rank', 'volume_24h', 'interactions_24h',
-        'social_volume_24h', 'social_dominance', 'sentiment',
-        'percent_change_1h', 'percent_change_7d', 'percent_change_30d',
-        'market_dominance', 'market_dominance_prev', 'volatility'
-    ]
-    df = df[feature_cols].copy()
-    # print(f"After feature selection shape: {df.shape}")
-    
-    # Check for missing values
-    missing_values = df.isnull().sum()
-    # print("\nMissing values per column:")
-    # print(missing_values[missing_values > 0])
-    
-    # Fill missing values with appropriate defaults
-    df['time'] = pd.Timestamp.now()  # Use current time for missing time values
-    df['galaxy_score_previous'] = df['galaxy_score_previous'].fillna(df['galaxy_score'])  # Use current score if previous is missing
-    df['alt_rank_previous'] = df['alt_rank_previous'].fillna(df['alt_rank'])  # Use current rank if previous is missing
-    df['sentiment'] = df['sentiment'].fillna(0.0)  # Neutral sentiment for missing values
-    df['percent_change_30d'] = df['percent_change_30d'].fillna(0.0)  # No change for missing values
-    
-    # Drop any remaining rows with missing values in critical fields
-    critical_fields = ['symbol', 'galaxy_score', 'alt_rank', 'market_cap_rank', 
-                      'interactions_24h', 'social_volume_24h', 'social_dominance']
-    df = df.dropna(subset=critical_fields)
-    # print(f"After handling missing values shape: {df.shape}")
-    
-    if df.empty:
+    symbols, rows, y_pred = score_coin_data(coins, sparse, engine)
+
+    if len(rows) == 0:
         raise ValueError("DataFrame is empty after preprocessing. Check the input data and missing values.")
 
-    # Convert numeric columns to appropriate types
-    numeric_columns = {
-        'galaxy_score': 'float64',
-        'galaxy_score_previous': 'float64',
-        'alt_rank': 'int64',
-        'alt_rank_previous': 'int64',
-        'market_cap': 'float64',
-        'market_cap_rank': 'int64',
-        'volume_24h': 'float64',
-        'interactions_24h': 'int64',
-        'social_volume_24h': 'int64',
-        'social_dominance': 'float64',
-        'sentiment': 'float64',
-        'percent_change_1h': 'float64',
-        'percent_change_7d': 'float64',
-        'percent_change_30d': 'float64',
-        'market_dominance': 'float64',
-        'market_dominance_prev': 'float64',
-        'volatility': 'float64'
-    }
-    
-    for col, dtype in numeric_columns.items():
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-        df[col] = df[col].astype(dtype)
-    
-    # Remove time column as it's not needed for prediction
-    df = df.drop('time', axis=1)
-    
-    # Get the feature names from the model
-    model_feature_names = model.feature_name()
-    # print(f"\nModel expects {len(model_feature_names)} features")
-    # print("\nModel feature names:")
-    # print(model_feature_names[:10], "...")  # Print first 10 features
-    
-    # === 4. 独热编码 symbol ===
-    # First, get the unique symbols from the model's feature names
-    model_symbols = set()
-    for feature in model_feature_names:
-        if feature.startswith('symbol_'):
-            model_symbols.add(feature[7:])  # Remove 'symbol_' prefix
-    
-    # print("\nModel symbols:")
-    # print(list(model_symbols)[:10], "...")  # Print first 10 symbols
-    
-    # Filter symbols to only include those present in the model
-    df['symbol'] = df['symbol'].apply(lambda x: x if x in model_symbols else 'UNKNOWN')
-    
-    # Perform one-hot encoding
-    symbol_dummies = pd.get_dummies(df['symbol'], prefix='symbol')
-    
-    # Drop the original symbol column
-    df = df.drop('symbol', axis=1)
-    
-    # Create a dictionary of all features with default values
-    feature_dict = {col: 0 for col in model_feature_names}
-    
-    # Update the dictionary with actual values from numeric features
-    for col in df.columns:
-        if col in model_feature_names:
-            feature_dict[col] = df[col].values
-    
-    # Update the dictionary with one-hot encoded symbol values
-    for col in symbol_dummies.columns:
-        if col in model_feature_names:
-            feature_dict[col] = symbol_dummies[col].values
-    
-    # Create the final DataFrame using pd.concat
-    template_df = pd.DataFrame(feature_dict, index=df.index)
-    
-    # print(f"\nFinal feature count: {len(template_df.columns)}")
-    # print("\nInput symbols:")
-    # print(df.index[:10], "...")  # Print first 10 input symbols
-    
-    # === 5. 模型预测 ===
-    y_pred = model.predict(template_df)
-    y_pred_label = (y_pred > 0.35).astype(int)
+    y_pred_label = (y_pred > LABEL_THRESHOLD).astype(int)
 
-    # === 6. 将预测结果附加到 DataFrame 中 ===
-    # Create result DataFrame with all data at once
+    # === 6. 组装预测结果 ===
     result_df = pd.DataFrame({
-        'symbol': df.index,  # Use the original index as symbol
+        'symbol': symbols[rows],
         'predicted_label': y_pred_label.astype('float64'),
         'confidence': y_pred.astype('float64')
     })
-    
-    # Map the index back to the original symbol
-    symbol_map = {i: s for i, s in enumerate(original_symbols)}
-    result_df['symbol'] = result_df['symbol'].map(symbol_map)
-    
+
     # 按置信度降序排序
     result_df = result_df.sort_values(by='confidence', ascending=False)
-    
-    # print("\nPrediction results:")
-    # print(result_df.head())
 
     return result_df
 
-def get_top3_predictions(n: int) -> pd.DataFrame:
+# 默认只对两次刷新之间模型输入发生变化的币种重新打分
+_prediction_cache = PredictionCache(
+    lambda table, holder: score_coin_data(table, holder=holder),
+    lambda: _registry.active,
+    LABEL_THRESHOLD,
+    incremental=os.getenv('PREDICTION_INCREMENTAL', 'True').lower() == 'true',
+)
+
+
+def get_prediction_cache() -> PredictionCache:
+    """获取全局预测缓存"""
+    return _prediction_cache
+
+
+def get_scored_snapshot(snapshot: MarketSnapshot) -> ScoredSnapshot:
+    """
+    获取快照中全部币种的预测结果
+
+    每个快照版本和模型版本只打分一次，所有分析师共享；并发请求共享同一次计算。
+    """
+    return _prediction_cache.get(snapshot)
+
+
+def get_top3_predictions(n: int, snapshot: MarketSnapshot = None) -> pd.DataFrame:
     """
     从LunarCrush获取市值排名前N的加密货币，并进行预测，返回置信度最高的前3个预测结果
     
     Args:
         n: 市值排名阈值，返回market_cap_rank <= n的加密货币
             如果n为0，则返回所有加密货币
+        snapshot: 使用的市场快照，为None时使用当前快照
         
     Returns:
         包含前3个预测结果的DataFrame，按置信度降序排序
     """
     try:
-        # 获取n个加密货币数据
-        coins = get_top_market_cap_coins(n)
-        
-        # 进行预测
-        predictions_df = predict_from_coin_data(coins)
-        
-        # 按置信度降序排序并获取前3个结果
-        top_predictions = predictions_df.sort_values(by='confidence', ascending=False).head(3)
-        
-        return top_predictions
+        if snapshot is None:
+            snapshot = get_market_snapshot()
+
+        # 全量预测结果及其排名前缀索引按快照缓存，任意n都只需一次查找
+        return get_scored_snapshot(snapshot).top(n)
         
     except Exception as e:
         print(f"Error getting top predictions: {e}")
-        return pd.DataFrame(columns=['symbol', 'predicted_label', 'confidence'])
+        return pd.DataFrame(columns=PREDICTION_COLUMNS)
 
 # 示例使用
 if __name__ == "__main__":
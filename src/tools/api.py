@@ -1,60 +1,235 @@
+import logging
 import os
 import requests
-from typing import List
+from typing import Any, Dict, List, Optional
+from src.data.coin_stream import CoinFilter, coin_filter, parse_coins_stream, peek_generated
 from src.data.crypto_models import CryptoCoin, CryptoCoinResponse
-from src.data.crypto_cache import get_crypto_cache
+from src.data.crypto_cache import NOT_MODIFIED, THROTTLED, get_crypto_cache, get_history_store
+from src.data.fetch_scheduler import get_fetch_scheduler
+from src.data.snapshot import MarketSnapshot
+
+logger = logging.getLogger(__name__)
 
 _cache = get_crypto_cache()
+_scheduler = get_fetch_scheduler()
+
+COINS_URL = "https://lunarcrush.com/api4/public/coins/list/v1"
+
+
+class RateLimitExceeded(Exception):
+    """Raised when the LunarCrush request budget is exhausted."""
+
 
-def get_coins(symbols: List[str] = None) -> List:
+def _streaming_enabled() -> bool:
+    """Whether cold-cache symbol lookups may stream and filter the coins list instead of loading it all."""
+    return os.environ.get("LUNARCRUSH_STREAMING", "False").lower() == "true"
+
+
+def get_coins(symbols: List[str] = None, snapshot: MarketSnapshot = None) -> List:
     """
     get cryptocurrency data
     Args:
         symbols: list of cryptocurrency symbols to get, if None get all
+        snapshot: market snapshot to read from, if None use the current one
     Returns:
         list of cryptocurrency data
     """
-    # get all coins
-    all_coins = get_all_coins()
-    
+    if snapshot is None:
+        if symbols and (coins := _stream_while_cold(symbols)) is not None:
+            return coins
+        snapshot = get_market_snapshot()
+
     # if symbols are specified, return only the specified coins
     if symbols:
-        return [coin for coin in all_coins if coin.symbol in symbols]
-    
-    return all_coins
+        return snapshot.select(symbols)
+
+    return list(snapshot.coins)
 
 
 def get_all_coins() -> List:
     """
     Fetch cryptocurrency data from LunarCrush API.
-    
+
     Returns:
         List[CryptoCoin]: A list of cryptocurrency data objects.
     """
-    # Check cache first
-    if cached_data := _cache.get_coins():
-        return [CryptoCoin(**coin) for coin in cached_data]
+    return list(get_market_snapshot().coins)
+
+
+def get_market_snapshot() -> MarketSnapshot:
+    """
+    Get the current market snapshot, fetching from LunarCrush API when the cache is cold or expired.
+
+    Concurrent callers that miss the cache together share a single API request.
+
+    Returns:
+        MarketSnapshot: An immutable, indexed view of the coin universe.
+    """
+    return _cache.get_or_load_snapshot(fetch_coins_if_changed) or MarketSnapshot([], version=0)
+
+
+def _max_budget_wait() -> float:
+    """Seconds a load that needs the coins list may wait for the request budget before failing."""
+    return float(os.environ.get("LUNARCRUSH_RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+
+
+def fetch_coins() -> List[CryptoCoin]:
+    """
+    Fetch the coins list from LunarCrush API, bypassing the cache.
+
+    The raw response bytes are validated once, straight into pydantic models,
+    and the validated coins are what gets cached. Nothing can be served without
+    this fetch, so it waits for the request budget instead of failing at once.
+
+    Returns:
+        List[CryptoCoin]: A list of cryptocurrency data objects.
+    Raises:
+        RateLimitExceeded: when the budget stays exhausted for LUNARCRUSH_RATE_LIMIT_MAX_WAIT_SECONDS
+    """
+    response = _request_coins(wait=_max_budget_wait())
+    parsed = parse_coins_response(response.content)
+    _scheduler.record(parsed.config.generated, response.headers)
+    return parsed.data
+
+
+def fetch_coins_if_changed():
+    """
+    Fetch the coins list from LunarCrush API only if it was regenerated since the cached snapshot.
+
+    The request is conditional on the last response's validators, and a 200 body whose
+    `config.generated` matches the cached generation is recognised without being parsed.
+    When the request budget is exhausted the cached snapshot is kept, without being marked fresh.
+
+    Returns:
+        List[CryptoCoin], NOT_MODIFIED when the cached snapshot is still current,
+        or THROTTLED when the budget allowed no request
+    """
+    if _cache.get_latest_snapshot() is None:
+        return fetch_coins()
+    try:
+        response = _request_coins(headers=_scheduler.conditional_headers())
+    except RateLimitExceeded as e:
+        logger.warning(f"{e}, keeping the cached coins snapshot")
+        return THROTTLED
+    if response.status_code == 304:
+        _scheduler.record_not_modified()
+        return NOT_MODIFIED
+    if _scheduler.is_unchanged(peek_generated(response.content)):
+        return NOT_MODIFIED
+    parsed = parse_coins_response(response.content)
+    _scheduler.record(parsed.config.generated, response.headers)
+    return parsed.data
+
+
+def stream_coins(symbols: List[str] = None, max_rank: Optional[int] = None, keep: Optional[CoinFilter] = None) -> List[CryptoCoin]:
+    """
+    Fetch the coins list from LunarCrush API as a stream, validating only the coins that are asked for.
+
+    The body is parsed incrementally, so peak memory is bounded by the number of matching
+    coins rather than the size of the universe. The result is not cached; on the request path
+    it is only used through CryptoCache.stream_while_cold, which warms the cache alongside.
+
+    Args:
+        symbols: keep coins with one of these symbols
+        max_rank: keep coins with market_cap_rank <= max_rank
+        keep: extra predicate over the raw coin record, e.g. a cache retention policy
+    Returns:
+        List[CryptoCoin]: the matching coins in upstream order
+    """
+    with _request_coins(stream=True) as response:
+        _, coins = parse_coins_stream(response.iter_content(chunk_size=64 * 1024), coin_filter(symbols, max_rank, keep))
+    return coins
+
+
+def _stream_while_cold(symbols: List[str]) -> Optional[List[CryptoCoin]]:
+    """
+    With streaming enabled and a cold cache, stream just `symbols` while the full snapshot loads in the background.
+
+    Returns None when the caller should use get_market_snapshot instead: streaming is off, the
+    cache is warm, or another caller already started the load, which this caller then shares.
+    """
+    if not _streaming_enabled():
+        return None
+    try:
+        return _cache.stream_while_cold(lambda: stream_coins(symbols=symbols), fetch_coins_if_changed)
+    except RateLimitExceeded as e:
+        # The background load waits for the budget; share it instead
+        logger.warning(f"{e}, waiting for the coins snapshot instead of streaming")
+        return None
+
 
-    # If not in cache or cache expired, fetch from API
-    headers = {}
+def _request_coins(stream: bool = False, headers: Optional[Dict[str, str]] = None, wait: float = 0) -> requests.Response:
+    """Request the coins list within the API budget, waiting up to `wait` seconds for it, raising on a response other than 200 or 304."""
+    if not _scheduler.acquire(wait):
+        raise RateLimitExceeded("LunarCrush request budget exhausted")
+    headers = dict(headers or {})
     if api_key := os.environ.get("LUNARCRUSH_API_KEY"):
         headers["Authorization"] = f"Bearer {api_key}"
 
-    url = "https://lunarcrush.com/api4/public/coins/list/v1"
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code != 200:
+    response = requests.get(COINS_URL, headers=headers, stream=stream)
+
+    if response.status_code not in (200, 304):
         raise Exception(f"Error fetching data: {response.status_code} - {response.text}")
+    return response
 
-    # Parse response with Pydantic model
-    data = response.json()
-    response_model = CryptoCoinResponse(**data)
-    coins = response_model.data
-
-    if not coins:
-        return []
-    
-    # Cache the results
-    _cache.set_coins([coin.model_dump() for coin in coins])
-    
-    return coins
+
+def parse_coins_response(content: bytes) -> CryptoCoinResponse:
+    """
+    Parse a LunarCrush coins response directly from its raw bytes.
+
+    Args:
+        content: the raw JSON body
+    Returns:
+        CryptoCoinResponse: the validated response
+    """
+    return CryptoCoinResponse.model_validate_json(content)
+
+
+def start_background_refresh() -> None:
+    """
+    Keep the market snapshot warm from a background thread, so requests never pay for the LunarCrush round trip.
+
+    Refreshes follow the fetch scheduler: just after LunarCrush is expected to regenerate the list.
+    """
+    _cache.start_refresher(fetch_coins_if_changed, schedule=_scheduler.next_fetch_at)
+
+
+def stop_background_refresh() -> None:
+    """
+    Stop the background snapshot refresher.
+    """
+    _cache.stop_refresher()
+
+
+def get_fetch_stats() -> Dict[str, Any]:
+    """
+    Get counters for LunarCrush fetches, including coalesced and waiting callers,
+    the next planned fetch time, the remaining request budget and the history writer.
+    """
+    history = get_history_store()
+    return {**_cache.stats(), "scheduler": _scheduler.stats(), "history": history.stats() if history is not None else None}
+
+
+def get_pinned_snapshot(data: Dict[str, Any], symbols: List[str] = None) -> MarketSnapshot:
+    """
+    Get the market snapshot pinned to an analyst run.
+
+    The first call pins the current snapshot into the run's state data, so every
+    later step of the same run reads the same coins. With streaming enabled and a
+    cold cache, the run that starts the cache load and only needs `symbols` pins an
+    uncached (version 0) snapshot holding just those coins; concurrent runs share the load.
+
+    Args:
+        data: the `data` dict of the agent state
+        symbols: the only symbols the run needs, if known
+    Returns:
+        MarketSnapshot: the snapshot pinned to this run
+    """
+    snapshot = data.get("market_snapshot")
+    if snapshot is None:
+        if symbols and (coins := _stream_while_cold(symbols)) is not None:
+            snapshot = MarketSnapshot(coins, version=0)
+        else:
+            snapshot = get_market_snapshot()
+        data["market_snapshot"] = snapshot
+    return snapshot
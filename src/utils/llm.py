@@ -1,9 +1,12 @@
 """Helper functions for LLM"""
 
 import json
-from typing import TypeVar, Type, Optional, Any
+import time
+from typing import Callable, TypeVar, Type, Optional, Any
 from pydantic import BaseModel
 from src.llm.models import get_model, get_model_info
+from src.utils.llm_cache import get_response_cache, response_key
+from src.utils.llm_resilience import CircuitOpenError, get_hedge_model, get_llm_resilience
 from src.utils.progress import progress
 
 T = TypeVar("T", bound=BaseModel)
@@ -18,9 +21,12 @@ def call_llm(
     max_retries: int = 3,
     default_factory=None,
     temperature: float = 0.7,
+    cache: Optional[bool] = None,
+    cacheable: Optional[Callable[[T], bool]] = None,
 ) -> T:
     """
     Makes an LLM call with retry logic, handling both JSON supported and non-JSON supported models.
+    Retries back off with jitter and skip providers whose circuit is open; see LLMResilience.
 
     Args:
         prompt: The prompt to send to the LLM
@@ -31,54 +37,84 @@ def call_llm(
         max_retries: Maximum number of retries (default: 3)
         default_factory: Optional factory function to create default response on failure
         temperature: Controls randomness in the output (default: 0.7)
+        cache: Serve and store validated responses in the response cache; None follows the
+            per-agent LLM_CACHE_AGENTS setting
+        cacheable: Optional check a response must pass to be stored, for schemas looser than
+            what the caller accepts
 
     Returns:
         An instance of the specified Pydantic model
     """
 
-    model_info = get_model_info(model_name)
-    llm = get_model(model_name, model_provider)
-
-    # 设置temperature
-    if hasattr(llm, "temperature"):
-        llm.temperature = temperature
-
-    # For non-JSON support models, we can use structured output
-    if not (model_info and not model_info.has_json_mode()):
-        llm = llm.with_structured_output(
-            pydantic_model,
-            method="json_mode",
-        )
+    response_cache = get_response_cache()
+    if cache is None:
+        cache = response_cache.enabled_for(agent_name)
+    if cache:
+        key = response_key(prompt, model_name, model_provider, temperature, pydantic_model)
+        cached = response_cache.get(key, pydantic_model, agent_name)
+        if cached is not None:
+            return cached
+
+    # Retries back off exponentially with jitter; each provider sits behind a circuit
+    # breaker, and with LLM_HEDGE_MODEL set, slow calls are hedged on that model
+    resilience = get_llm_resilience()
+    hedge = None
+    hedge_info = get_model_info(get_hedge_model() or "")
+    if hedge_info is not None:
+        hedge = (hedge_info.provider, hedge_info.model_name, lambda: _invoke(prompt, hedge_info.model_name, hedge_info.provider, pydantic_model, temperature))
 
-    # Call the LLM with retries
     for attempt in range(max_retries):
         try:
-            # Call the LLM
-            result = llm.invoke(prompt)
-
-            # For non-JSON support models, we need to extract and parse the JSON manually
-            if model_info and not model_info.has_json_mode():
-                parsed_result = extract_json_from_response(result.content)
-                if parsed_result:
-                    return pydantic_model(**parsed_result)
-            else:
-                return result
+            start = time.perf_counter()
+            result, answered_by = resilience.execute(
+                model_provider,
+                model_name,
+                lambda: _invoke(prompt, model_name, model_provider, pydantic_model, temperature),
+                hedge,
+            )
+
+            # Hedge responses are not stored under the primary model's key
+            if cache and answered_by == model_name and isinstance(result, BaseModel) and (cacheable is None or cacheable(result)):
+                response_cache.put(key, result, time.perf_counter() - start, agent_name)
+            return result
 
         except Exception as e:
             if agent_name:
                 progress.update_status(agent_name, None, f"Error - retry {attempt + 1}/{max_retries}")
 
-            if attempt == max_retries - 1:
-                print(f"Error in LLM call after {max_retries} attempts: {e}")
+            # An open circuit with nothing to fail over to would refuse every retry as well
+            if attempt == max_retries - 1 or isinstance(e, CircuitOpenError):
+                print(f"Error in LLM call after {attempt + 1} attempts: {e}")
                 # Use default_factory if provided, otherwise create a basic default
                 if default_factory:
                     return default_factory()
                 return create_default_response(pydantic_model)
 
+            time.sleep(resilience.backoff.delay(attempt))
+
     # This should never be reached due to the retry logic above
     return create_default_response(pydantic_model)
 
 
+def _invoke(prompt: Any, model_name: str, model_provider: str, pydantic_model: Type[T], temperature: float) -> T:
+    """Makes a single LLM call and returns the structured result, raising if it cannot be parsed."""
+    model_info = get_model_info(model_name)
+
+    # Pooled client with the temperature set at construction; for JSON mode models,
+    # the pooled structured output wrapper for this schema
+    json_mode = not (model_info and not model_info.has_json_mode())
+    llm = get_model(model_name, model_provider, temperature=temperature, output_schema=pydantic_model if json_mode else None)
+    result = llm.invoke(prompt)
+
+    # For non-JSON support models, we need to extract and parse the JSON manually
+    if not json_mode:
+        parsed_result = extract_json_from_response(result.content)
+        if not parsed_result:
+            raise ValueError(f"No JSON found in response from {model_name}")
+        result = pydantic_model(**parsed_result)
+    return result
+
+
 def create_default_response(model_class: Type[T]) -> T:
     """Creates a safe default response based on the model's fields."""
     default_values = {}
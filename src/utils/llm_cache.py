@@ -0,0 +1,172 @@
+"""Content-addressed cache of structured LLM responses"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T", bound=BaseModel)
+
+
+def _render_prompt(prompt: Any) -> Any:
+    """Render a prompt to plain data: (role, content) pairs for chat prompts, else its string form."""
+    if hasattr(prompt, "to_messages"):
+        return [(message.type, message.content) for message in prompt.to_messages()]
+    if isinstance(prompt, str):
+        return prompt
+    return str(prompt)
+
+
+def response_key(prompt: Any, model_name: str, model_provider: Any, temperature: float, pydantic_model: Type[BaseModel]) -> str:
+    """Hash everything that determines a response: rendered prompt, model, provider, temperature and output schema."""
+    payload = json.dumps(
+        {
+            "prompt": _render_prompt(prompt),
+            "model": model_name,
+            "provider": getattr(model_provider, "value", model_provider),
+            "temperature": temperature,
+            "schema": [pydantic_model.__module__, pydantic_model.__qualname__, pydantic_model.model_json_schema()],
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier cache of validated LLM responses keyed by `response_key`.
+
+    An in-memory LRU sits in front of an optional directory of JSON files shared
+    across processes and restarts. Entries expire after `ttl` seconds. Only
+    successful, validated responses are stored, never fallback defaults. Each
+    entry records how long the original call took, so hits report the latency
+    they saved. Counters are kept per agent.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, directory: Optional[str] = None, agents: Iterable[str] = ()):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.agents = frozenset(agents)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, float, Dict[str, Any]]]" = OrderedDict()  # key -> (expires_at, latency, value)
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def enabled_for(self, agent_name: Optional[str]) -> bool:
+        """Whether responses for this agent are cached ('*' enables every agent)."""
+        return "*" in self.agents or (agent_name is not None and agent_name in self.agents)
+
+    def _count(self, agent_name: Optional[str], name: str, amount: float = 1) -> None:
+        counters = self._stats.setdefault(agent_name or "", {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "saved_seconds": 0.0})
+        counters[name] += amount
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str, pydantic_model: Type[T], agent_name: Optional[str] = None) -> Optional[T]:
+        """Get a cached response as a fresh model instance, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._count(agent_name, "memory_hits")
+                self._count(agent_name, "saved_seconds", entry[1])
+                return pydantic_model.model_validate(entry[2])
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._count(agent_name, "misses")
+                return None
+            self._remember(key, entry)
+            self._count(agent_name, "disk_hits")
+            self._count(agent_name, "saved_seconds", entry[1])
+        return pydantic_model.model_validate(entry[2])
+
+    def put(self, key: str, response: BaseModel, latency: float, agent_name: Optional[str] = None) -> None:
+        """Store a validated response and the latency of the call that produced it."""
+        entry = (time.time() + self.ttl, latency, response.model_dump(mode="json"))
+        with self._lock:
+            self._remember(key, entry)
+            self._count(agent_name, "stores")
+        self._write_disk(key, entry)
+
+    def _remember(self, key: str, entry: Tuple[float, float, Dict[str, Any]]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, float, Dict[str, Any]]]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data["expires_at"] <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data["expires_at"], data["latency"], data["value"]
+
+    def _write_disk(self, key: str, entry: Tuple[float, float, Dict[str, Any]]) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": entry[0], "latency": entry[1], "value": entry[2]}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error writing LLM cache entry: {e}")
+
+    def clear(self) -> None:
+        """Drop the in-memory tier and reset counters (disk entries expire on their own)."""
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get per-agent counters with hit rate and latency saved, plus the in-memory size."""
+        with self._lock:
+            agents = {}
+            for agent_name, counters in self._stats.items():
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                lookups = hits + counters["misses"]
+                agents[agent_name or "unknown"] = {**counters, "hit_rate": hits / lookups if lookups else None}
+            return {"entries": len(self._entries), "agents": agents}
+
+
+def _env_agents() -> Iterable[str]:
+    return [name.strip() for name in os.getenv("LLM_CACHE_AGENTS", "").split(",") if name.strip()]
+
+
+_response_cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", "300")),
+    directory=os.getenv("LLM_CACHE_DIR") or None,
+    agents=_env_agents(),
+)
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Get the global LLM response cache."""
+    return _response_cache
@@ -0,0 +1,310 @@
+"""Backoff, per-provider circuit breaking and hedged requests for LLM calls"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Provider SDK errors for requests that never got an answer (openai, anthropic, groq, google)
+_TRANSPORT_ERRORS = frozenset({"APIConnectionError", "APITimeoutError", "ConnectError", "TimeoutException", "TransportError", "DeadlineExceeded", "ServiceUnavailable"})
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a provider's circuit is open and no hedge model can take the call."""
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Whether an error says the provider is unhealthy: a transport error, a timeout or a 5xx response.
+
+    Answers that cannot be parsed or validated are not provider failures.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "code", None)
+    if isinstance(status, int) and 500 <= status < 600:
+        return True
+    return any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(error).__mro__)
+
+
+class Backoff:
+    """Exponential backoff with full jitter: attempt n sleeps uniformly in [0, min(cap, base * 2**n)]."""
+
+    def __init__(self, base: float = 0.5, cap: float = 8.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops sending calls to a provider after consecutive failures.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are
+    refused for `reset_timeout` seconds. Then a single trial call is let through
+    (half open). Its success closes the circuit; its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._opened = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; in half-open state only one trial call is allowed."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._failures, "opened": self._opened, "rejected": self._rejected}
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one model."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 20) -> Optional[float]:
+        """Get the p-th percentile latency, or None until `min_samples` calls were recorded."""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class LLMResilience:
+    """Runs LLM calls behind per-provider circuit breakers, optionally hedged with a second model.
+
+    A hedged call starts on the primary model. If it has not finished after that
+    model's `hedge_percentile` latency, or `hedge_after` seconds until enough
+    latencies were seen, the same request is also sent to the hedge model. The
+    first valid response wins. When the primary provider's circuit is open, the
+    call fails over to the hedge model at once.
+
+    Each hedged attempt runs on its own thread, so a hedge delay always counts
+    from the moment the primary call actually starts, and calls stuck on a
+    degraded provider never queue new ones behind them. The losing call cannot
+    be interrupted; it ends at the client's request timeout and its result is
+    discarded. `in_flight` counts the calls still running.
+
+    Only provider failures (see is_provider_failure) count against a breaker.
+    A hedge model on the primary's own provider is ignored: it would share the
+    primary's breaker, so it could neither take over from an open circuit nor
+    escape a degraded provider.
+    """
+
+    def __init__(
+        self,
+        backoff: Optional[Backoff] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge_percentile: float = 95.0,
+        hedge_after: float = 10.0,
+    ):
+        self.backoff = backoff or Backoff()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._in_flight = 0
+        self._counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "provider_failures": 0}
+
+    def breaker(self, provider: Any) -> CircuitBreaker:
+        provider = getattr(provider, "value", provider)
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[provider]
+
+    def latency(self, model_name: str) -> LatencyTracker:
+        with self._lock:
+            if model_name not in self._latencies:
+                self._latencies[model_name] = LatencyTracker()
+            return self._latencies[model_name]
+
+    def hedge_delay(self, model_name: str) -> float:
+        """How long to wait for the primary model before sending the hedge."""
+        threshold = self.latency(model_name).percentile(self.hedge_percentile)
+        return self.hedge_after if threshold is None else threshold
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _timed(self, provider: Any, model_name: str, fn: Callable[[], T]) -> T:
+        """Run one call, feeding its outcome to the provider's breaker and its latency to the model's tracker."""
+        breaker = self.breaker(provider)
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            if is_provider_failure(e):
+                self._count("provider_failures")
+                breaker.record_failure()
+            else:
+                # The provider answered, so it is reachable even though the answer was unusable
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        self.latency(model_name).record(time.perf_counter() - start)
+        return result
+
+    def _start(self, provider: Any, model_name: str, fn: Callable[[], T]) -> Future:
+        """Start one call on a thread of its own and return its future."""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self._timed(provider, model_name, fn))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+        with self._lock:
+            self._in_flight += 1
+        threading.Thread(target=run, name="llm-call", daemon=True).start()
+        return future
+
+    def execute(
+        self,
+        provider: Any,
+        model_name: str,
+        fn: Callable[[], T],
+        hedge: Optional[Tuple[Any, str, Callable[[], T]]] = None,
+    ) -> Tuple[T, str]:
+        """
+        Run a call on the primary model, with an optional (provider, model_name, fn) hedge.
+
+        Returns:
+            (result, name of the model that produced it)
+        Raises:
+            CircuitOpenError when neither model's circuit admits the call, else the call's own error
+        """
+        self._count("calls")
+        if hedge is not None and getattr(hedge[0], "value", hedge[0]) == getattr(provider, "value", provider):
+            hedge = None
+
+        if not self.breaker(provider).allow():
+            if hedge is not None and self.breaker(hedge[0]).allow():
+                self._count("failovers")
+                return self._timed(*hedge), hedge[1]
+            raise CircuitOpenError(f"Circuit open for provider {getattr(provider, 'value', provider)}")
+
+        if hedge is None:
+            return self._timed(provider, model_name, fn), model_name
+
+        primary = self._start(provider, model_name, fn)
+        done, _ = wait([primary], timeout=self.hedge_delay(model_name))
+        if done or not self.breaker(hedge[0]).allow():
+            return primary.result(), model_name
+
+        self._count("hedged")
+        secondary = self._start(*hedge)
+        pending = {primary: model_name, secondary: hedge[1]}
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                if future.exception() is None:
+                    if future is secondary:
+                        self._count("hedge_wins")
+                    return future.result(), winner
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        """Get call counters, per-provider breaker state and per-model latency percentiles."""
+        with self._lock:
+            counters = dict(self._counters, in_flight=self._in_flight)
+            breakers = dict(self._breakers)
+            latencies = dict(self._latencies)
+        return {
+            **counters,
+            "breakers": {provider: breaker.stats() for provider, breaker in breakers.items()},
+            "latency": {
+                model_name: {f"p{p}": tracker.percentile(p, min_samples=1) for p in (50, 95, 99)}
+                for model_name, tracker in latencies.items()
+            },
+        }
+
+
+_resilience = LLMResilience(
+    backoff=Backoff(float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")), float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))),
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+    hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "10")),
+)
+
+
+def get_llm_resilience() -> LLMResilience:
+    """Get the global LLM resilience layer."""
+    return _resilience
+
+
+def get_hedge_model() -> Optional[str]:
+    """The model named by LLM_HEDGE_MODEL that hedges slow calls, or None when hedging is off."""
+    return os.getenv("LLM_HEDGE_MODEL") or None
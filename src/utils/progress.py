@@ -6,14 +6,20 @@ from rich.style import Style
 from rich.text import Text
 from typing import Dict, Optional, Callable, List
 import asyncio
+import threading
 
 console = Console()
 
 
 class AgentProgress:
-    """Manages progress tracking for multiple agents."""
+    """Manages progress tracking for multiple agents.
+
+    Updates may come from worker threads (e.g. concurrent per-symbol LLM calls);
+    they are applied, dispatched and rendered one at a time.
+    """
 
     def __init__(self):
+        self._lock = threading.RLock()
         self.agent_status: Dict[str, Dict[str, str]] = {}
         self.table = Table(show_header=False, box=None, padding=(0, 1))
         self.live = Live(self.table, console=console, refresh_per_second=4)
@@ -46,30 +52,32 @@ class AgentProgress:
         """Update the status of an agent."""
         if not self.started:
             return
-            
-        # 更新状态
-        if agent_name not in self.agent_status:
-            self.agent_status[agent_name] = {"status": "", "crypto": None}
-
-        if crypto:
-            self.agent_status[agent_name]["crypto"] = crypto
-        if status:
-            self.agent_status[agent_name]["status"] = status
-        self.agent_status[agent_name]["timestamp"] = datetime.now(timezone.utc).isoformat()
-
-        # 通知所有注册的处理程序
-        for handler in self.update_handlers:
-            try:
-                handler(agent_name, crypto, status)
-            except Exception as e:
-                print(f"Error in handler: {e}")
-
-        # 立即刷新显示
-        self._refresh_display()
+
+        with self._lock:
+            # 更新状态
+            if agent_name not in self.agent_status:
+                self.agent_status[agent_name] = {"status": "", "crypto": None}
+
+            if crypto:
+                self.agent_status[agent_name]["crypto"] = crypto
+            if status:
+                self.agent_status[agent_name]["status"] = status
+            self.agent_status[agent_name]["timestamp"] = datetime.now(timezone.utc).isoformat()
+
+            # 通知所有注册的处理程序
+            for handler in self.update_handlers:
+                try:
+                    handler(agent_name, crypto, status)
+                except Exception as e:
+                    print(f"Error in handler: {e}")
+
+            # 立即刷新显示
+            self._refresh_display()
 
     def get_all_status(self):
         """Get the current status of all agents as a dictionary."""
-        return {agent_name: {"crypto": info["crypto"], "status": info["status"], "display_name": self._get_display_name(agent_name)} for agent_name, info in self.agent_status.items()}
+        with self._lock:
+            return {agent_name: {"crypto": info["crypto"], "status": info["status"], "display_name": self._get_display_name(agent_name)} for agent_name, info in self.agent_status.items()}
 
     def _get_display_name(self, agent_name: str) -> str:
         """Convert agent_name to a display-friendly format."""
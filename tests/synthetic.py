@@ -0,0 +1,45 @@
+"""Coin builders shared by the test modules."""
+
+import random
+from src.data.crypto_models import CryptoCoin
+
+
+def make_coin(coin_id: int, symbol: str, rank=None, **fields) -> dict:
+    """Build a minimal coin record as returned by LunarCrush."""
+    return {"id": coin_id, "symbol": symbol, "name": symbol.title(), "price": 1.0, "market_cap_rank": rank, **fields}
+
+
+def make_coins(count: int, seed: int = 0) -> list:
+    """Build a reproducible coin universe mixing model-known and unknown symbols and missing values."""
+    from src.ml.xgboost_pred import get_model  # only the model-aware builder loads the model
+
+    rng = random.Random(seed)
+    known = [name[len("symbol_"):] for name in get_model().feature_name() if name.startswith("symbol_")]
+    coins = []
+    for i in range(count):
+        symbol = rng.choice(known) if rng.random() < 0.8 else f"NEW{i}"
+        maybe = lambda value: None if rng.random() < 0.1 else value
+        coins.append(CryptoCoin(
+            id=i,
+            symbol=symbol,
+            name=symbol,
+            price=rng.uniform(0.001, 1000),
+            market_cap=maybe(rng.uniform(1e5, 1e12)),
+            market_cap_rank=maybe(i + 1),
+            volume_24h=maybe(rng.uniform(1e3, 1e10)),
+            galaxy_score=maybe(rng.uniform(0, 100)),
+            galaxy_score_previous=maybe(rng.uniform(0, 100)),
+            alt_rank=maybe(rng.randint(1, 5000)),
+            alt_rank_previous=maybe(rng.randint(1, 5000)),
+            interactions_24h=maybe(rng.randint(0, 10**7)),
+            social_volume_24h=maybe(rng.randint(0, 10**5)),
+            social_dominance=maybe(rng.uniform(0, 5)),
+            sentiment=maybe(rng.randint(0, 100)),
+            percent_change_1h=maybe(rng.uniform(-10, 10)),
+            percent_change_7d=maybe(rng.uniform(-50, 50)),
+            percent_change_30d=maybe(rng.uniform(-90, 200)),
+            market_dominance=maybe(rng.uniform(0, 50)),
+            market_dominance_prev=maybe(rng.uniform(0, 50)),
+            volatility=maybe(rng.uniform(0, 1)),
+        ))
+    return coins
@@ -1,6 +1,60 @@
+import json
 import os
+import time
 import pytest
-from src.tools.api import get_coins
+from datetime import timedelta
+import src.tools.api as api
+from src.data.crypto_cache import NOT_MODIFIED, THROTTLED, CryptoCache
+from src.data.fetch_scheduler import FetchScheduler, TokenBucket
+from src.tools.api import get_coins, get_pinned_snapshot
+from tests.synthetic import make_coin
+
+
+class FakeResponse:
+    """Stand-in for a requests response holding a fixed body."""
+
+    def __init__(self, content: bytes, status_code: int = 200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = content.decode()
+
+    def iter_content(self, chunk_size: int = 1):
+        return (self.content[i:i + chunk_size] for i in range(0, len(self.content), chunk_size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeUpstream:
+    """Serves the coins list to the API module from memory and records the requests made."""
+
+    def __init__(self):
+        self.status_code = 200
+        self.headers = {"ETag": '"v1"'}
+        self.requests = []
+        self.serve([make_coin(1, "BTC", 1), make_coin(2, "ETH", 2), make_coin(3, "SOL", 3)], generated=1717171717)
+
+    def serve(self, records, generated: int) -> None:
+        self.body = json.dumps({"data": records, "config": {"generated": generated}}).encode()
+
+    def get(self, url, headers=None, stream=False):
+        self.requests.append(dict(headers or {}))
+        return FakeResponse(self.body if self.status_code == 200 else b"", self.status_code, self.headers)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Give the API module a fresh cache and scheduler, and a fake LunarCrush behind requests.get."""
+    fake = FakeUpstream()
+    monkeypatch.setattr(api, "_cache", CryptoCache())
+    monkeypatch.setattr(api, "_scheduler", FetchScheduler(TokenBucket(capacity=10, refill_per_second=0.001)))
+    monkeypatch.setattr(api.requests, "get", fake.get)
+    monkeypatch.delenv("LUNARCRUSH_STREAMING", raising=False)
+    return fake
 
 
 def test_get_coins():
@@ -28,4 +82,108 @@ def test_get_coins():
     print(f"First coin: {first_coin.name} ({first_coin.symbol})")
     print(f"Price: ${first_coin.price:,.2f}")
     print(f"Market Cap: ${first_coin.market_cap:,.2f}")
-    print(f"24h Change: {first_coin.percent_change_24h:,.2f}%") 
\ No newline at end of file
+    print(f"24h Change: {first_coin.percent_change_24h:,.2f}%")
+
+
+def test_pinned_snapshot_survives_cache_updates(upstream):
+    """Test that a run keeps reading the snapshot it pinned first while the cache moves on."""
+    data = {}
+    pinned = get_pinned_snapshot(data)
+    assert data["market_snapshot"] is pinned
+    assert [coin.symbol for coin in pinned] == ["BTC", "ETH", "SOL"]
+
+    api._cache.set_coins([make_coin(4, "DOGE", 4)])
+    assert "DOGE" in api.get_market_snapshot()
+    assert get_pinned_snapshot(data) is pinned and "DOGE" not in pinned
+
+
+def test_pinned_snapshot_streams_only_the_symbols_on_a_cold_start(upstream, monkeypatch):
+    """Test that with streaming on, the run starting a cold load pins just its symbols while the cache warms."""
+    monkeypatch.setenv("LUNARCRUSH_STREAMING", "true")
+    data = {}
+    pinned = get_pinned_snapshot(data, ["ETH", "SOL"])
+    assert pinned.version == 0
+    assert [coin.symbol for coin in pinned] == ["ETH", "SOL"]
+
+    deadline = time.monotonic() + 5
+    while api._cache.get_latest_snapshot() is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(api._cache.get_latest_snapshot()) == 3
+    assert get_pinned_snapshot(data, ["ETH", "SOL"]) is pinned
+
+    # Once the cache is warm, a new run pins the full cached snapshot
+    assert len(get_pinned_snapshot({}, ["ETH"])) == 3
+
+
+def test_parse_coins_response_matches_the_json_route():
+    """Test that validating the raw bytes gives the same response as validating response.json()."""
+    body = '''{
+        "config": {"generated": 1717171717, "sort": "market_cap_rank", "limit": 3},
+        "data": [
+            {"id": 1, "symbol": "BTC", "name": "Bitcoin", "price": 67321.8842918735, "price_btc": 1,
+             "volume_24h": 28731234567.12, "volatility": 0.0123, "circulating_supply": 19712345,
+             "max_supply": 21000000, "percent_change_1h": -0.151234, "percent_change_24h": 2.3456789,
+             "percent_change_7d": -4.1, "percent_change_30d": 12.75, "market_cap": 1327123456789.5,
+             "market_cap_rank": 1, "interactions_24h": 123456789, "social_volume_24h": 54321,
+             "social_dominance": 21.543, "market_dominance": 52.1, "market_dominance_prev": 51.9,
+             "galaxy_score": 71.5, "galaxy_score_previous": 68, "alt_rank": 12, "alt_rank_previous": 40,
+             "sentiment": 82, "categories": "layer-1,pow", "blockchains": [{"type": "layer1", "network": "bitcoin", "address": null, "decimals": 8}],
+             "last_updated_price": 1717171700, "last_updated_price_by": "coingecko", "topic": "bitcoin",
+             "logo": "https://cdn.lunarcrush.com/bitcoin.png", "unknown_field": {"nested": [1, 2]}},
+            {"id": 7, "symbol": "ÉTH", "name": "Ethereum ✓", "price": 3512.07, "market_cap_rank": 2,
+             "galaxy_score": null, "blockchains": null, "percent_change_24h": null},
+            {"id": 9000, "symbol": "NEW", "name": "New", "price": 0.000001234}
+        ]
+    }'''.encode()
+
+    parsed = api.parse_coins_response(body)
+
+    assert parsed == api.CryptoCoinResponse(**json.loads(body))
+    assert parsed.config.generated == 1717171717
+    assert [coin.symbol for coin in parsed.data] == ["BTC", "ÉTH", "NEW"]
+    assert parsed.data[0].blockchains[0].network == "bitcoin"
+
+
+def test_fetch_if_changed_sends_validators_and_counts_304(upstream):
+    """Test that a warm cache makes a conditional request and a 304 keeps the cached coins."""
+    first = api.get_market_snapshot()
+    upstream.status_code = 304
+
+    assert api.fetch_coins_if_changed() is NOT_MODIFIED
+    assert upstream.requests[-1]["If-None-Match"] == '"v1"'
+    assert api._scheduler.stats()["not_modified"] == 1
+    assert api._cache.get_or_load_snapshot(api.fetch_coins_if_changed) is first
+
+
+def test_fetch_if_changed_skips_parsing_an_unchanged_generation(upstream, monkeypatch):
+    """Test that a 200 body carrying the cached generation is recognised without being parsed."""
+    api.get_market_snapshot()
+
+    def parse(content):
+        raise AssertionError("an unchanged body must not be parsed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(api, "parse_coins_response", parse)
+        assert api.fetch_coins_if_changed() is NOT_MODIFIED
+    assert api._scheduler.stats()["unchanged"] == 1
+
+    upstream.serve([make_coin(1, "BTC", 1), make_coin(4, "DOGE", 4)], generated=1717172017)
+    assert [coin.symbol for coin in api.fetch_coins_if_changed()] == ["BTC", "DOGE"]
+    assert api._scheduler.generated == 1717172017
+
+
+def test_fetch_if_changed_keeps_the_stale_snapshot_when_throttled(upstream, monkeypatch):
+    """Test that an exhausted budget keeps serving the cached snapshot without marking it fresh."""
+    monkeypatch.setattr(api, "_cache", CryptoCache(cache_duration=timedelta(0)))
+    first = api.get_market_snapshot()
+    while api._scheduler.bucket.try_acquire():
+        pass
+    sent = len(upstream.requests)
+
+    assert api.fetch_coins_if_changed() is THROTTLED
+    assert api.get_market_snapshot() is first
+    assert len(upstream.requests) == sent
+    assert api._cache.get_snapshot() is None  # still expired
+    stats = api._cache.stats()
+    assert (stats["throttled"], stats["not_modified"]) == (1, 0)
+    assert api._scheduler.stats()["throttled"] == 2
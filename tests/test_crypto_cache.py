@@ -0,0 +1,317 @@
+import json
+import os
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from src.data.coin_stream import coin_filter, parse_coins_stream, peek_generated
+from src.data.crypto_cache import NOT_MODIFIED, THROTTLED, CryptoCache
+from src.data.crypto_models import CryptoCoin
+from src.data.fetch_scheduler import FetchScheduler, TokenBucket
+from src.data.history import HistoryStore
+from src.data.snapshot import MarketSnapshot
+from src.data.snapshot_store import SnapshotStore
+from tests.synthetic import make_coin
+
+
+def test_snapshot_lookups():
+    """Test symbol, id and rank lookups on a market snapshot."""
+    coins = [CryptoCoin(**make_coin(1, "BTC", 1)), CryptoCoin(**make_coin(2, "ETH", 2)), CryptoCoin(**make_coin(3, "BTC", None))]
+    snapshot = MarketSnapshot(coins, version=7)
+
+    assert snapshot.version == 7
+    assert len(snapshot) == 3
+    assert snapshot.get("BTC").id == 1
+    assert snapshot.get("DOGE") is None
+    assert snapshot.get_by_id(3).symbol == "BTC"
+    assert snapshot.get_by_rank(2).symbol == "ETH"
+    assert [coin.id for coin in snapshot.select(["BTC", "ETH"])] == [1, 2, 3]
+
+    with pytest.raises(AttributeError):
+        snapshot.version = 8
+
+
+def test_set_coins_builds_new_snapshot():
+    """Test that every cache write publishes a new, higher snapshot version."""
+    cache = CryptoCache()
+    assert cache.get_snapshot() is None
+
+    cache.set_coins([make_coin(1, "BTC", 1)])
+    first = cache.get_snapshot()
+    assert cache.get_snapshot() is first
+
+    cache.set_coins([make_coin(2, "ETH", 2)])
+    second = cache.get_snapshot()
+    assert second.version > first.version
+    assert "ETH" in second and "ETH" not in first
+
+
+def test_set_coins_upserts_and_records_changes():
+    """Test that writes update existing coins in place and record which fields changed."""
+    cache = CryptoCache()
+    seen = []
+    cache.subscribe(seen.append)
+
+    first = cache.set_coins([make_coin(1, "BTC", 1, galaxy_score=50.0), make_coin(2, "ETH", 2)])
+    assert first.delta is None
+
+    second = cache.set_coins([make_coin(1, "BTC", 1, galaxy_score=55.0), make_coin(2, "ETH", 2), make_coin(3, "SOL", 3)])
+    assert second.get("BTC").galaxy_score == 55.0
+    assert second.delta.base_version == first.version
+    assert second.delta.added == {3}
+    assert dict(second.delta.changed) == {1: {"galaxy_score"}}
+    assert second.delta.touched == {1, 3}
+    assert [snapshot.version for snapshot in seen] == [first.version, second.version]
+
+
+def test_concurrent_misses_share_one_load():
+    """Test that concurrent cache misses run the loader only once."""
+    cache = CryptoCache()
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return [make_coin(1, "BTC", 1)]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load_snapshot(loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["loads"]["waiting"] < 7:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({id(snapshot) for snapshot in results}) == 1
+    stats = cache.stats()["loads"]
+    assert stats["executions"] == 1
+    assert stats["coalesced"] == 7
+    assert stats["waiting"] == 0
+
+
+def test_stale_snapshot_served_while_revalidating():
+    """Test that an expired snapshot within max staleness is served while a background refresh runs."""
+    cache = CryptoCache(cache_duration=timedelta(seconds=60), max_staleness=timedelta(seconds=600))
+    first = cache.set_coins([make_coin(1, "BTC", 1)])
+    cache._last_update["coins"] -= timedelta(seconds=120)
+
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.set()
+        return [make_coin(2, "ETH", 2)]
+
+    assert cache.get_or_load_snapshot(loader) is first
+    assert refreshed.wait(5)
+    while cache.get_snapshot() is None:
+        time.sleep(0.01)
+    assert "ETH" in cache.get_snapshot()
+    assert cache.stats()["stale_served"] == 1
+
+    # Beyond max staleness the caller blocks on a fresh load
+    cache._last_update["coins"] -= timedelta(seconds=3600)
+    assert cache.get_or_load_snapshot(lambda: [make_coin(3, "SOL", 3)]).version > first.version + 1
+
+
+def test_disk_store_warms_sibling_cache(tmp_path):
+    """Test that a second cache sharing the disk store loads the snapshot without fetching."""
+    path = str(tmp_path / "coins.snapshot")
+    writer = CryptoCache(store=SnapshotStore(path))
+    written = writer.set_coins([make_coin(1, "BTC", 1), make_coin(2, "ETH", 2)])
+
+    def loader():
+        raise AssertionError("should not fetch when the disk snapshot is fresh")
+
+    reader = CryptoCache(store=SnapshotStore(path))
+    snapshot = reader.get_or_load_snapshot(loader)
+    assert snapshot.version == written.version
+    assert snapshot.get("ETH").id == 2
+    assert reader.stats()["disk_loads"] == 1
+
+    # Versions keep increasing across processes sharing the store
+    assert reader.set_coins([make_coin(3, "SOL", 3)]).version > written.version
+
+
+def test_disk_store_never_unpickles(tmp_path):
+    """Test that a pickle planted under the store's path is rejected instead of loaded."""
+    import pickle
+    import struct
+
+    payload = pickle.dumps([CryptoCoin(**make_coin(1, "BTC", 1))])
+    path = tmp_path / "coins.snapshot"
+    for format_version in (1, 2):
+        path.write_bytes(struct.pack("<8sHQdQ", b"PMSNAP\x00\x00", format_version, 1, time.time(), len(payload)) + payload)
+        assert SnapshotStore(str(path)).read() is None
+
+
+def test_stream_parser_keeps_only_matching_coins():
+    """Test that the streaming parser validates only coins matching the filter, across chunk boundaries."""
+    records = [make_coin(i, f"C{i}", i, galaxy_score=12.345 + i, name="Çoin ✓") for i in range(1, 200)]
+    body = json.dumps({"data": records, "config": {"generated": 1717171717}}, ensure_ascii=False).encode()
+    chunks = (body[i:i + 7] for i in range(0, len(body), 7))
+
+    config, coins = parse_coins_stream(chunks, coin_filter(symbols=["C150", "C7"], max_rank=3))
+
+    assert config.generated == 1717171717
+    assert [coin.symbol for coin in coins] == ["C1", "C2", "C3", "C7", "C150"]
+    assert float(coins[-1].galaxy_score) == 162.345
+    assert coins[0].name == "Çoin ✓"
+
+
+def test_history_store_range_queries(tmp_path):
+    """Test appending snapshots to the history store and querying a symbol's field over time."""
+    store = HistoryStore(str(tmp_path))
+    base = datetime(2024, 5, 31, 23, 59, tzinfo=timezone.utc)
+    for minutes, score in ((0, 40.0), (1, 45.0), (2, 50.0)):
+        coins = [CryptoCoin(**make_coin(1, "BTC", 1, galaxy_score=score)), CryptoCoin(**make_coin(2, "ETH", 2, galaxy_score=1.0))]
+        assert store.append(MarketSnapshot(coins, version=minutes + 1, created_at=base + timedelta(minutes=minutes))) == 2
+
+    # Re-appending an already recorded snapshot is a no-op
+    assert store.append(MarketSnapshot(coins, version=3, created_at=base + timedelta(minutes=2))) == 0
+    assert [day.isoformat() for day in store.days()] == ["2024-05-31", "2024-06-01"]
+
+    series = store.series("BTC", "galaxy_score")
+    assert series.tolist() == [40.0, 45.0, 50.0]
+    assert store.series("BTC", "galaxy_score", start=base + timedelta(minutes=1)).tolist() == [45.0, 50.0]
+
+    # The first snapshot of 2024-06-01 sealed the previous day
+    assert os.listdir(tmp_path / "2024-05-31").count("columns.npz") == 1
+    assert not (tmp_path / "2024-05-31" / "time.bin").exists()
+    frame = store.frame(["galaxy_score", "market_cap_rank"], symbols=["ETH"])
+    assert frame["galaxy_score"].tolist() == [1.0, 1.0, 1.0]
+    assert frame["market_cap_rank"].tolist() == [2.0, 2.0, 2.0]
+
+
+def test_history_store_keeps_snapshots_within_one_second(tmp_path):
+    """Test that snapshots taken less than a second apart are all recorded, in order."""
+    store = HistoryStore(str(tmp_path))
+    base = datetime(2024, 6, 1, 12, tzinfo=timezone.utc)
+    for offset, score in ((0, 40.0), (250, 41.0), (999, 42.0)):
+        coins = [CryptoCoin(**make_coin(1, "BTC", 1, galaxy_score=score))]
+        assert store.append(MarketSnapshot(coins, version=offset + 1, created_at=base + timedelta(milliseconds=offset))) == 1
+
+    series = store.series("BTC", "galaxy_score")
+    assert series.tolist() == [40.0, 41.0, 42.0]
+    assert list(series.index) == [base, base + timedelta(milliseconds=250), base + timedelta(milliseconds=999)]
+    assert store.series("BTC", "galaxy_score", start=base + timedelta(milliseconds=1), end=base + timedelta(milliseconds=999)).tolist() == [41.0]
+
+
+def test_history_writer_seals_and_prunes_off_the_listener_path(tmp_path):
+    """Test that recorded snapshots are written by the writer thread, with old days sealed or deleted."""
+    store = HistoryStore(str(tmp_path), retention_days=2)
+    base = datetime(2024, 6, 1, 12, tzinfo=timezone.utc)
+    for day in range(4):
+        coins = [CryptoCoin(**make_coin(1, "BTC", 1, galaxy_score=float(day)))]
+        assert store.record(MarketSnapshot(coins, version=day + 1, created_at=base + timedelta(days=day)))
+    store.flush()
+
+    assert [day.isoformat() for day in store.days()] == ["2024-06-02", "2024-06-03", "2024-06-04"]
+    assert (tmp_path / "2024-06-03" / "columns.npz").exists()
+    assert (tmp_path / "2024-06-04" / "time.bin").exists()
+    assert store.series("BTC", "galaxy_score").tolist() == [1.0, 2.0, 3.0]
+    stats = store.stats()
+    assert stats["recorded"] == 4 and stats["pending"] == 0 and stats["pruned"] == 1
+
+
+def test_unchanged_generation_keeps_snapshot():
+    """Test that a loader reporting NOT_MODIFIED restarts the TTL without publishing a new snapshot."""
+    cache = CryptoCache(cache_duration=timedelta(seconds=0.1))
+    first = cache.get_or_load_snapshot(lambda: [CryptoCoin(**make_coin(1, "BTC", 1))])
+    time.sleep(0.15)
+    assert cache.get_snapshot() is None
+
+    assert cache.get_or_load_snapshot(lambda: NOT_MODIFIED) is first
+    assert cache.get_snapshot() is first
+    assert cache.stats()["not_modified"] == 1
+
+
+def test_throttled_refresh_keeps_snapshot_and_backs_off():
+    """Test that a throttled loader keeps the expired snapshot without restarting its TTL, and the refresher backs off."""
+    cache = CryptoCache(cache_duration=timedelta(seconds=0.05))
+    first = cache.get_or_load_snapshot(lambda: [CryptoCoin(**make_coin(1, "BTC", 1))])
+    calls = []
+
+    def throttled():
+        calls.append(1)
+        return THROTTLED
+
+    cache.start_refresher(throttled, retry_delay=timedelta(seconds=0.2))
+    time.sleep(0.3)
+    cache.stop_refresher()
+
+    assert 1 <= len(calls) <= 3
+    assert cache.get_snapshot() is None
+    assert cache.get_or_load_snapshot(throttled) is first
+    stats = cache.stats()
+    assert stats["throttled"] == len(calls) and stats["not_modified"] == 0
+
+
+def test_fetch_scheduler_plans_around_generation_and_budget():
+    """Test the token bucket, conditional headers, generation tracking and the planned fetch time."""
+    scheduler = FetchScheduler(TokenBucket(2, 0.001), generation_interval=timedelta(minutes=5), settle_delay=timedelta(seconds=10))
+    assert scheduler.next_fetch_at() <= datetime.now()
+    assert scheduler.conditional_headers() == {}
+
+    content = json.dumps({"config": {"generated": 1700000000}, "data": [make_coin(1, "BTC", 1)]}).encode()
+    assert peek_generated(content) == 1700000000
+    assert scheduler.acquire()
+    scheduler.record(peek_generated(content), {"ETag": '"abc"', "Last-Modified": "Tue, 14 Nov 2023 22:13:20 GMT"})
+    assert scheduler.conditional_headers() == {"If-None-Match": '"abc"', "If-Modified-Since": "Tue, 14 Nov 2023 22:13:20 GMT"}
+    assert scheduler.is_unchanged(1700000000)
+    assert not scheduler.is_unchanged(1700000300)
+
+    assert scheduler.acquire()
+    assert not scheduler.acquire()
+    stats = scheduler.stats()
+    assert (stats["fetches"], stats["throttled"], stats["unchanged"]) == (2, 1, 1)
+    assert stats["budget_remaining"] < 1
+    # An exhausted budget pushes the plan past the next expected generation
+    assert scheduler.next_fetch_at() > datetime.now() + timedelta(minutes=10)
+
+
+def test_fetch_scheduler_waits_for_budget_when_asked():
+    """Test that an acquire allowed to wait gets the next token instead of failing."""
+    scheduler = FetchScheduler(TokenBucket(1, 20))
+    assert scheduler.acquire()
+    assert not scheduler.acquire()
+    assert not scheduler.acquire(wait=0.01)
+    assert scheduler.acquire(wait=1)
+    stats = scheduler.stats()
+    assert (stats["fetches"], stats["throttled"]) == (2, 2) and stats["waited"] >= 1
+
+
+def test_stream_while_cold_streams_once_and_warms_cache():
+    """Test that a cold start streams for one caller only while a single background load warms the cache."""
+    cache = CryptoCache()
+    streaming = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def stream():
+        streaming.set()
+        release.wait(5)
+        return [CryptoCoin(**make_coin(1, "BTC", 1))]
+
+    def loader():
+        loads.append(1)
+        release.wait(5)
+        return [CryptoCoin(**make_coin(1, "BTC", 1)), CryptoCoin(**make_coin(2, "ETH", 2))]
+
+    result = {}
+    streamer = threading.Thread(target=lambda: result.setdefault("coins", cache.stream_while_cold(stream, loader)))
+    streamer.start()
+    assert streaming.wait(5)
+
+    # Everyone else arriving during the cold start shares the coalesced load instead of streaming
+    assert cache.stream_while_cold(stream, loader) is None
+    release.set()
+    streamer.join()
+    assert [coin.symbol for coin in result["coins"]] == ["BTC"]
+    assert "ETH" in cache.get_or_load_snapshot(loader)
+    assert len(loads) == 1
+    assert cache.stats()["streamed"] == 1
+    assert cache.stream_while_cold(stream, loader) is None
@@ -0,0 +1,114 @@
+import threading
+import time
+import src.agents.crypto_narrative_sentiment as narrative
+from src.agents.crypto_narrative_sentiment import CryptoNarrativeSignal, crypto_narrative_agent
+from src.data.snapshot import MarketSnapshot
+from tests.synthetic import make_coins
+
+
+def run_agent(symbols, snapshot):
+    state = {
+        "messages": [],
+        "data": {"symbols": symbols, "market_snapshot": snapshot},
+        "metadata": {"model_name": "test-model", "model_provider": "OpenAI", "show_reasoning": False},
+    }
+    return crypto_narrative_agent(state)["data"]["analyst_signals"]["crypto_narrative_agent"]
+
+
+def test_narratives_run_concurrently_and_keep_input_order(monkeypatch):
+    """Test that narrative LLM calls fan out up to the concurrency cap and merge back in input order."""
+    coins = make_coins(60, seed=2)
+    snapshot = MarketSnapshot(coins, version=0)
+    symbols = list(dict.fromkeys(coin.symbol for coin in coins))[:8]
+    lock = threading.Lock()
+    running, peak = 0, 0
+
+    def fake_narrative(symbol, analysis_data, model_name, model_provider, snapshot=None):
+        nonlocal running, peak
+        assert list(analysis_data) == [symbol]
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return CryptoNarrativeSignal(signal="neutral", confidence="no confidence in price increase", reasoning=symbol)
+
+    monkeypatch.setattr(narrative, "generate_narrative_output", fake_narrative)
+    monkeypatch.setenv("NARRATIVE_CONCURRENCY", "3")
+    start = time.perf_counter()
+    result = run_agent(symbols, snapshot)
+    elapsed = time.perf_counter() - start
+
+    analyzed = [symbol for symbol in symbols if symbol in result]
+    assert list(result) == analyzed
+    assert all(result[symbol]["reasoning"] == symbol for symbol in analyzed)
+    assert peak == min(3, len(analyzed))
+    assert elapsed < 0.05 * len(analyzed)
+
+    monkeypatch.setenv("NARRATIVE_CONCURRENCY", "1")
+    peak = 0
+    assert run_agent(symbols, snapshot) == result
+    assert peak == 1
+
+
+def test_batched_narratives_retry_only_failing_symbols(monkeypatch):
+    """Test that a batch keeps valid entries and re-asks only for missing or invalid symbols, splitting failed batches."""
+    snapshot = MarketSnapshot(make_coins(5), version=0)
+    symbols = ["AAA", "BBB", "CCC", "DDD", "EEE"]
+    analysis = {symbol: {"signal": "bullish"} for symbol in symbols}
+    batches, singles = [], []
+
+    def fake_call_llm(prompt, pydantic_model, **kwargs):
+        human = prompt.to_messages()[1].content
+        requested = human.split("each of these symbols: ")[1].split("\n")[0].split(", ")
+        batches.append(requested)
+        if len(requested) == 4:
+            return pydantic_model(signals={})  # nothing valid: split in half
+        signals = {s: {"signal": "neutral", "confidence": "no confidence in price increase", "reasoning": f"batch {s}"} for s in requested}
+        if "BBB" in signals:
+            signals["BBB"]["signal"] = "sideways"  # fails validation
+        signals.pop("DDD", None)  # missing from the response
+        return pydantic_model(signals=signals)
+
+    def fake_narrative(symbol, analysis_data, model_name, model_provider, snapshot=None):
+        singles.append(symbol)
+        return CryptoNarrativeSignal(signal="bearish", confidence="no confidence in price increase", reasoning=f"single {symbol}")
+
+    monkeypatch.setattr(narrative, "call_llm", lambda **kwargs: fake_call_llm(**kwargs))
+    monkeypatch.setattr(narrative, "generate_narrative_output", fake_narrative)
+
+    result = narrative.generate_narrative_batch(symbols, analysis, "test-model", "OpenAI", snapshot)
+    assert list(result) == symbols
+    assert batches == [symbols, ["BBB", "DDD"]]
+    assert result["AAA"].reasoning == "batch AAA" and result["EEE"].reasoning == "batch EEE"
+    assert result["BBB"].reasoning == "single BBB" and result["DDD"].reasoning == "single DDD"
+    assert sorted(singles) == ["BBB", "DDD"]
+
+    batches.clear()
+    result = narrative.generate_narrative_batch(["AAA", "CCC", "EEE", "FFF"], {**analysis, "FFF": {}}, "test-model", "OpenAI", snapshot)
+    assert batches == [["AAA", "CCC", "EEE", "FFF"], ["AAA", "CCC"], ["EEE", "FFF"]]
+    assert [output.reasoning for output in result.values()] == ["batch AAA", "batch CCC", "batch EEE", "batch FFF"]
+
+
+def test_batch_falls_back_without_splitting_when_the_llm_call_fails(monkeypatch):
+    """Test that a failed LLM call yields defaults for the whole batch in one call, and partial batches are not cacheable."""
+    snapshot = MarketSnapshot(make_coins(5), version=0)
+    symbols = ["AAA", "BBB", "CCC", "DDD"]
+    calls = []
+
+    def failing_call_llm(**kwargs):
+        calls.append(kwargs)
+        return kwargs["default_factory"]()
+
+    monkeypatch.setattr(narrative, "call_llm", failing_call_llm)
+    result = narrative.generate_narrative_batch(symbols, {symbol: {} for symbol in symbols}, "test-model", "OpenAI", snapshot)
+    assert len(calls) == 1
+    assert list(result) == symbols
+    assert all(signal == narrative.create_default_narrative_signal() for signal in result.values())
+
+    valid = {"signal": "neutral", "confidence": "no confidence in price increase", "reasoning": "ok"}
+    cacheable = calls[0]["cacheable"]
+    assert cacheable(narrative.CryptoNarrativeBatch(signals={symbol: valid for symbol in symbols}))
+    assert not cacheable(narrative.CryptoNarrativeBatch(signals={**{symbol: valid for symbol in symbols}, "BBB": {"signal": "up"}}))
+    assert not cacheable(narrative.CryptoNarrativeBatch(signals={"AAA": valid}))
@@ -0,0 +1,82 @@
+import time
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+import src.utils.llm as llm_module
+from src.utils.llm import call_llm
+from src.utils.llm_cache import LLMResponseCache, response_key
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class FakeLLM:
+    """Structured-output stand-in that counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return Answer(text=f"answer {self.calls}")
+
+
+def make_prompt(symbol: str):
+    return ChatPromptTemplate.from_messages([("system", "Analyze."), ("human", "{symbol}")]).invoke({"symbol": symbol})
+
+
+def test_response_key_covers_prompt_model_and_schema():
+    """Test that the key changes with any input that changes the response."""
+    base = response_key(make_prompt("BTC"), "gpt-4o", "OpenAI", 0.1, Answer)
+    assert base == response_key(make_prompt("BTC"), "gpt-4o", "OpenAI", 0.1, Answer)
+    assert base != response_key(make_prompt("ETH"), "gpt-4o", "OpenAI", 0.1, Answer)
+    assert base != response_key(make_prompt("BTC"), "gpt-4o-mini", "OpenAI", 0.1, Answer)
+    assert base != response_key(make_prompt("BTC"), "gpt-4o", "OpenAI", 0.7, Answer)
+
+
+def test_call_llm_serves_cached_responses_per_agent(monkeypatch):
+    """Test that enabled agents reuse validated responses and disabled agents always call the model."""
+    fake = FakeLLM()
+    cache = LLMResponseCache(agents=["crypto_narrative_agent"])
+    monkeypatch.setattr(llm_module, "get_model", lambda *args, **kwargs: fake)
+    monkeypatch.setattr(llm_module, "get_response_cache", lambda: cache)
+
+    first = call_llm(make_prompt("BTC"), "gpt-4o", "OpenAI", Answer, agent_name="crypto_narrative_agent")
+    second = call_llm(make_prompt("BTC"), "gpt-4o", "OpenAI", Answer, agent_name="crypto_narrative_agent")
+    assert first == second and first is not second
+    assert fake.calls == 1
+
+    call_llm(make_prompt("BTC"), "gpt-4o", "OpenAI", Answer, agent_name="other_agent")
+    assert fake.calls == 2
+    stats = cache.stats()["agents"]["crypto_narrative_agent"]
+    assert stats["memory_hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+
+def test_response_cache_disk_tier_and_ttl(tmp_path):
+    """Test that entries survive a new process through the disk tier and expire after the TTL."""
+    key = response_key(make_prompt("BTC"), "gpt-4o", "OpenAI", 0.1, Answer)
+    LLMResponseCache(directory=str(tmp_path), ttl=60).put(key, Answer(text="cached"), latency=1.5, agent_name="a")
+
+    restarted = LLMResponseCache(directory=str(tmp_path), ttl=60)
+    assert restarted.get(key, Answer, "a") == Answer(text="cached")
+    assert restarted.stats()["agents"]["a"]["disk_hits"] == 1
+    assert restarted.stats()["agents"]["a"]["saved_seconds"] == 1.5
+
+    short = LLMResponseCache(directory=str(tmp_path / "short"), ttl=0.01)
+    short.put(key, Answer(text="cached"), latency=1.0)
+    time.sleep(0.02)
+    assert short.get(key, Answer) is None
+    assert not any((tmp_path / "short").rglob("*.json"))
+
+
+def test_call_llm_skips_responses_that_are_not_cacheable(monkeypatch):
+    """Test that a response failing the caller's cacheable check is returned but not stored."""
+    fake = FakeLLM()
+    cache = LLMResponseCache(agents=["*"])
+    monkeypatch.setattr(llm_module, "get_model", lambda *args, **kwargs: fake)
+    monkeypatch.setattr(llm_module, "get_response_cache", lambda: cache)
+
+    for _ in range(2):
+        call_llm(make_prompt("BTC"), "gpt-4o", "OpenAI", Answer, agent_name="a", cacheable=lambda answer: False)
+    assert fake.calls == 2
+    assert cache.stats()["agents"]["a"]["stores"] == 0
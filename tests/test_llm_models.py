@@ -0,0 +1,92 @@
+import logging
+import threading
+from pydantic import BaseModel
+import src.llm.models as models_module
+from src.llm.models import LLMClientPool, ModelProvider, _sdk_client
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def test_client_pool_reuses_clients_by_key(monkeypatch):
+    """Test that clients are reused per (provider, model, temperature, output mode) and never mutated."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    pool = LLMClientPool()
+
+    client = pool.get("gpt-4o", ModelProvider.OPENAI, temperature=0.1)
+    assert client.temperature == 0.1
+    assert pool.get("gpt-4o", "OpenAI", temperature=0.1) is client
+    assert pool.get("gpt-4o", ModelProvider.OPENAI, temperature=0.7) is not client
+    assert client.temperature == 0.1
+
+    structured = pool.get("gpt-4o", ModelProvider.OPENAI, temperature=0.1, output_schema=Answer)
+    assert structured is not client
+    assert pool.get("gpt-4o", ModelProvider.OPENAI, temperature=0.1, output_schema=Answer) is structured
+    assert pool.stats() == {"hits": 2, "misses": 3, "clients": 3, "preconnected": 0}
+
+
+def test_client_pool_creates_one_client_under_concurrency(monkeypatch):
+    """Test that concurrent first calls for the same key share a single client."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    pool = LLMClientPool()
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(pool.get("gpt-4o", ModelProvider.OPENAI, 0.1))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(client is clients[0] for client in clients)
+    assert pool.stats()["misses"] == 1
+
+
+def test_clients_get_the_configured_request_timeout(monkeypatch):
+    """Test that LLM_REQUEST_TIMEOUT_SECONDS bounds every request a pooled client makes."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_REQUEST_TIMEOUT_SECONDS", "12.5")
+    assert LLMClientPool().get("gpt-4o", ModelProvider.OPENAI).request_timeout == 12.5
+
+
+def test_preconnect_opens_a_connection_per_reachable_provider(monkeypatch, caplog):
+    """Test that preconnect sends a HEAD to each SDK's base URL, counting only the providers it reached."""
+    heads = []
+
+    class FakeHTTP:
+        def __init__(self, reachable):
+            self.reachable = reachable
+
+        def head(self, url, timeout):
+            if not self.reachable:
+                raise ConnectionError("unreachable")
+            heads.append((url, timeout))
+
+    class FakeSDK:
+        def __init__(self, name, reachable):
+            self.base_url = f"https://{name}.example.com/v1/"
+            self._client = FakeHTTP(reachable)
+
+    class FakeLLM:
+        def __init__(self, sdk):
+            self._client = sdk
+
+    models = {"up": FakeLLM(FakeSDK("up", True)), "down": FakeLLM(FakeSDK("down", False)), "local": FakeLLM(None)}
+    monkeypatch.setattr(models_module, "_create_model", lambda model_name, *args: models[model_name])
+    pool = LLMClientPool()
+
+    with caplog.at_level(logging.WARNING, logger=models_module.__name__):
+        assert pool.preconnect([("up", "OpenAI"), ("down", "Groq"), ("local", "Gemini")], timeout=2.0) == 1
+    assert heads == [("https://up.example.com/v1/", 2.0)]
+    assert pool.stats()["preconnected"] == 1
+    assert "Error preconnecting to Groq down: unreachable" in caplog.text
+
+
+def test_preconnect_finds_the_sdk_client_of_a_real_chat_model(monkeypatch):
+    """Test that the SDK client and its HTTP pool are found behind the installed ChatOpenAI."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    pool = LLMClientPool()
+    sdk = _sdk_client(pool.get("gpt-4o", ModelProvider.OPENAI))
+    heads = []
+    monkeypatch.setattr(sdk._client, "head", lambda url, timeout: heads.append(url))
+
+    assert pool.preconnect([("gpt-4o", ModelProvider.OPENAI)]) == 1
+    assert heads == ["https://api.openai.com/v1/"]
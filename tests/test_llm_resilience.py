@@ -0,0 +1,199 @@
+import threading
+import time
+import pytest
+from pydantic import BaseModel
+import src.utils.llm as llm_module
+from src.utils.llm import call_llm
+from src.utils.llm_resilience import Backoff, CircuitBreaker, CircuitOpenError, LLMResilience, is_provider_failure
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def test_backoff_grows_exponentially_with_full_jitter():
+    """Test that each delay lies in [0, min(cap, base * 2**attempt)]."""
+    backoff = Backoff(base=0.5, cap=3.0)
+    for attempt, ceiling in enumerate([0.5, 1.0, 2.0, 3.0, 3.0]):
+        delays = [backoff.delay(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= ceiling
+        assert max(delays) > ceiling / 2
+
+
+def test_circuit_breaker_opens_and_recovers_through_half_open():
+    """Test closed -> open after consecutive failures -> single half-open trial -> closed."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()  # one trial call only
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    assert breaker.stats()["opened"] == 2
+
+
+def test_hedge_wins_when_primary_is_slow():
+    """Test that a call still running after the hedge delay is raced against the hedge model."""
+    resilience = LLMResilience(hedge_after=0.05)
+
+    def slow():
+        time.sleep(0.5)
+        return "primary"
+
+    start = time.perf_counter()
+    result, model = resilience.execute("OpenAI", "gpt-4o", slow, ("DeepSeek", "deepseek-chat", lambda: "hedge"))
+    assert (result, model) == ("hedge", "deepseek-chat")
+    assert time.perf_counter() - start < 0.4
+    stats = resilience.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+    result, model = resilience.execute("OpenAI", "gpt-4o", lambda: "fast", ("DeepSeek", "deepseek-chat", lambda: "hedge"))
+    assert (result, model) == ("fast", "gpt-4o")
+    assert resilience.stats()["hedged"] == 1
+
+
+def test_open_circuit_fails_over_to_hedge_model():
+    """Test that an open provider is skipped for the hedge model, and refused without one."""
+    resilience = LLMResilience(failure_threshold=1, reset_timeout=60)
+
+    def broken():
+        raise ConnectionError("provider down")
+
+    with pytest.raises(ConnectionError):
+        resilience.execute("OpenAI", "gpt-4o", broken)
+    with pytest.raises(CircuitOpenError):
+        resilience.execute("OpenAI", "gpt-4o", broken)
+
+    result, model = resilience.execute("OpenAI", "gpt-4o", broken, ("DeepSeek", "deepseek-chat", lambda: "hedge"))
+    assert (result, model) == ("hedge", "deepseek-chat")
+    stats = resilience.stats()
+    assert stats["failovers"] == 1 and stats["breakers"]["OpenAI"]["state"] == "open"
+
+
+def test_hedge_on_the_same_provider_is_ignored():
+    """Test that a hedge sharing the primary's provider neither races a slow call nor takes over an open circuit."""
+    resilience = LLMResilience(failure_threshold=1, reset_timeout=60, hedge_after=0.01)
+    hedge = ("OpenAI", "gpt-4o-mini", lambda: "hedge")
+
+    def slow():
+        time.sleep(0.05)
+        return "primary"
+
+    assert resilience.execute("OpenAI", "gpt-4o", slow, hedge) == ("primary", "gpt-4o")
+
+    def broken():
+        raise ConnectionError("provider down")
+
+    with pytest.raises(ConnectionError):
+        resilience.execute("OpenAI", "gpt-4o", broken, hedge)
+    with pytest.raises(CircuitOpenError):
+        resilience.execute("OpenAI", "gpt-4o", broken, hedge)
+    stats = resilience.stats()
+    assert (stats["hedged"], stats["failovers"]) == (0, 0)
+    assert stats["breakers"]["OpenAI"]["rejected"] == 1
+
+
+def test_call_llm_backs_off_between_retries(monkeypatch):
+    """Test that call_llm sleeps with backoff between failed attempts and returns the default at the end."""
+    resilience = LLMResilience(backoff=Backoff(base=0.01, cap=0.01), failure_threshold=10)
+    sleeps = []
+    calls = []
+
+    class FailingLLM:
+        def invoke(self, prompt):
+            calls.append(prompt)
+            raise TimeoutError("slow provider")
+
+    monkeypatch.setattr(llm_module, "get_model", lambda *args, **kwargs: FailingLLM())
+    monkeypatch.setattr(llm_module, "get_llm_resilience", lambda: resilience)
+    monkeypatch.setattr(llm_module.time, "sleep", sleeps.append)
+
+    result = call_llm("prompt", "gpt-4o", "OpenAI", Answer, default_factory=lambda: Answer(text="default"), cache=False)
+    assert result.text == "default"
+    assert len(calls) == 3 and len(sleeps) == 2
+    assert all(0 <= delay <= 0.01 for delay in sleeps)
+    assert resilience.stats()["breakers"]["OpenAI"]["consecutive_failures"] == 3
+
+
+def test_hedging_stays_bounded_with_more_slow_calls_than_threads():
+    """Test that many concurrent stuck primaries do not delay new calls or their hedges."""
+    resilience = LLMResilience(hedge_after=0.05)
+    release = threading.Event()
+
+    def stuck():
+        release.wait(5)
+        return "primary"
+
+    results = []
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=lambda: results.append(resilience.execute("OpenAI", "gpt-4o", stuck, ("DeepSeek", "deepseek-chat", lambda: "hedge"))))
+        for _ in range(64)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    assert results == [("hedge", "deepseek-chat")] * 64
+    assert elapsed < 2
+    assert resilience.stats()["in_flight"] == 64
+    release.set()
+    while resilience.stats()["in_flight"]:
+        time.sleep(0.01)
+
+
+def test_unusable_answers_do_not_open_the_circuit():
+    """Test that parse or validation errors are retried without counting against the provider."""
+    resilience = LLMResilience(failure_threshold=1, hedge_after=0.01)
+
+    def malformed():
+        raise ValueError("No JSON found in response")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            resilience.execute("OpenAI", "gpt-4o", malformed)
+    assert resilience.stats()["breakers"]["OpenAI"]["state"] == "closed"
+
+    def slow_malformed():
+        time.sleep(0.05)
+        raise ValueError("No JSON found in response")
+
+    # A malformed primary loses the race to a valid hedge
+    assert resilience.execute("OpenAI", "gpt-4o", slow_malformed, ("DeepSeek", "deepseek-chat", lambda: "hedge")) == ("hedge", "deepseek-chat")
+
+    class ServerError(Exception):
+        status_code = 503
+
+    assert is_provider_failure(ServerError()) and is_provider_failure(TimeoutError())
+    assert not is_provider_failure(ValueError()) and not is_provider_failure(KeyError("signals"))
+
+
+def test_call_llm_returns_default_at_once_when_the_circuit_is_open(monkeypatch):
+    """Test that call_llm does not back off and retry against an open circuit without a hedge model."""
+    resilience = LLMResilience(backoff=Backoff(base=0.01, cap=0.01), failure_threshold=1, reset_timeout=60)
+    sleeps = []
+    calls = []
+
+    class DownLLM:
+        def invoke(self, prompt):
+            calls.append(prompt)
+            raise ConnectionError("provider down")
+
+    monkeypatch.setattr(llm_module, "get_model", lambda *args, **kwargs: DownLLM())
+    monkeypatch.setattr(llm_module, "get_llm_resilience", lambda: resilience)
+    monkeypatch.setattr(llm_module.time, "sleep", sleeps.append)
+
+    result = call_llm("prompt", "gpt-4o", "OpenAI", Answer, default_factory=lambda: Answer(text="default"), cache=False)
+    assert result.text == "default"
+    assert len(calls) == 1 and len(sleeps) == 1
+    assert resilience.stats()["breakers"]["OpenAI"]["rejected"] == 1
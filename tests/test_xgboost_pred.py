@@ -0,0 +1,322 @@
+import os
+import random
+import shutil
+import threading
+import time
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import pytest
+from src.data.coin_table import CoinTable
+from src.data.crypto_models import CryptoCoin
+from src.data.snapshot import MarketSnapshot
+from src.ml.features import build_feature_csr, build_feature_matrix, extract_feature_columns
+from src.ml.tree_artifact import TreeEnsemble, build_artifact, flatten_model
+from src.ml.model_registry import ModelRegistry
+from src.ml.prediction_cache import PredictionCache
+from src.ml.xgboost_pred import (
+    ENGINES, LABEL_THRESHOLD, MODEL_PATH, ModelHolder, calibrate_engines, get_top3_predictions, get_top_market_cap_table,
+    get_model_registry, model, model_schema, predict_from_coin_data, score_coin_data,
+)
+from tests.synthetic import make_coins
+
+
+def make_prediction_cache(**kwargs) -> PredictionCache:
+    """Build a prediction cache scoring with the active model, like the global one."""
+    return PredictionCache(lambda table, holder: score_coin_data(table, holder=holder), lambda: get_model_registry().active, LABEL_THRESHOLD, **kwargs)
+
+
+def test_predict_from_coin_table_matches_coin_list():
+    """Test that predictions from a CoinTable match predictions from CryptoCoin objects."""
+    coins = make_coins(500)
+    expected = predict_from_coin_data(coins)
+    actual = predict_from_coin_data(CoinTable.from_coins(coins))
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_coin_table_keeps_the_original_coins():
+    """Test that CoinTable rows give back the coins they were built from, with exact Decimal values."""
+    coins = make_coins(20)
+    coins[0] = coins[0].model_copy(update={"price": Decimal("0.123456789012345678901"), "market_cap": Decimal("1234567890123456789.01")})
+    table = CoinTable.from_coins(coins)
+    for row, coin in enumerate(coins):
+        assert table.coin(row) is coin
+    assert table.coin(0).price == Decimal("0.123456789012345678901")
+    assert table.coins([3, 0]) == [coins[3], coins[0]]
+    assert table.take([5, 0]).coin(1).market_cap == Decimal("1234567890123456789.01")
+
+
+def test_feature_matrix_fills_drops_and_one_hots():
+    """Test missing-value rules, critical-field filtering and the symbol one-hot of the feature matrix."""
+    known = next(name[len("symbol_"):] for name in model.feature_name() if name.startswith("symbol_"))
+    base = dict(galaxy_score=50.0, alt_rank=10, market_cap_rank=1, interactions_24h=5, social_volume_24h=3, social_dominance=1.0)
+    coins = [
+        CryptoCoin(id=1, symbol=known, name=known, price=1, **base),
+        CryptoCoin(id=2, symbol="NOT_A_MODEL_SYMBOL", name="x", price=1, **base),
+        CryptoCoin(id=3, symbol=known, name=known, price=1, **{**base, "alt_rank": None}),
+    ]
+    symbols, columns = extract_feature_columns(coins)
+    features, rows = build_feature_matrix(symbols, columns, model_schema)
+    index = {name: i for i, name in enumerate(model.feature_name())}
+
+    assert rows.tolist() == [0, 1]
+    assert features.shape == (2, len(index))
+    assert features[0, index["galaxy_score_previous"]] == 50.0
+    assert features[0, index["alt_rank_previous"]] == 10.0
+    assert features[0, index["sentiment"]] == 0.0
+    assert features[0, index["time"]] == 0.0
+    assert features[0, index[f"symbol_{known}"]] == 1.0
+    symbol_columns = [i for name, i in index.items() if name.startswith("symbol_")]
+    assert features[0, symbol_columns].sum() == 1.0
+    assert features[1, symbol_columns].sum() == 0.0
+
+
+def test_model_schema_matches_booster():
+    """Test that the schema computed at load time mirrors the booster's feature names."""
+    names = model.feature_name()
+    assert model_schema.feature_names == tuple(names)
+    assert all(names[position] == col for col, position in model_schema.numeric_positions.items())
+    assert all(names[position] == f"symbol_{symbol}" for symbol, position in model_schema.symbol_columns.items())
+    assert model_schema.symbol_positions(["NOT_A_MODEL_SYMBOL"]).tolist() == [model_schema.unknown_column]
+
+
+def test_sparse_input_matches_dense():
+    """Test that the CSR feature path equals the dense matrix and gives identical predictions."""
+    coins = make_coins(500, seed=1)
+    symbols, columns = extract_feature_columns(coins)
+    dense, dense_rows = build_feature_matrix(symbols, columns, model_schema)
+    csr, csr_rows = build_feature_csr(symbols, columns, model_schema)
+    assert (dense_rows == csr_rows).all()
+    np.testing.assert_array_equal(csr.toarray(), dense)
+    pd.testing.assert_frame_equal(predict_from_coin_data(coins, sparse=True), predict_from_coin_data(coins, sparse=False))
+
+
+def test_model_holder_loads_lazily_once():
+    """Test that the model holder defers loading until first use and loads once under concurrency."""
+    holder = ModelHolder(MODEL_PATH)
+    assert not holder.loaded
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(holder.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert holder.loaded
+    assert all(result[0] is results[0][0] and result[1] is results[0][1] for result in results)
+
+    missing = ModelHolder(MODEL_PATH + ".missing")
+    with pytest.raises(FileNotFoundError):
+        missing.get()
+
+
+def test_model_holder_warms_only_the_configured_engine(monkeypatch):
+    """Test that warmup loads just the engine MODEL_ENGINE forces, and both when it is auto."""
+    monkeypatch.setenv("MODEL_ENGINE", "numpy")
+    holder = ModelHolder(MODEL_PATH)
+    holder.warmup()
+    assert not holder.loaded and holder._ensemble is not None
+
+    monkeypatch.setenv("MODEL_ENGINE", "auto")
+    holder = ModelHolder(MODEL_PATH)
+    holder.warmup()
+    assert holder.loaded and holder._ensemble is not None
+
+
+def test_tree_artifact_matches_booster(tmp_path):
+    """Test that the memory-mapped binary model reproduces Booster.predict exactly."""
+    path = str(tmp_path / "model.bin")
+    build_artifact(MODEL_PATH, path)
+    ensemble = TreeEnsemble.load(path)
+    assert ensemble.feature_name() == model.feature_name()
+
+    symbols, columns = extract_feature_columns(make_coins(200, seed=2))
+    features, _ = build_feature_csr(symbols, columns, model_schema)
+    np.testing.assert_array_equal(ensemble.predict(features), model.predict(features))
+
+    # Raw inputs exercising the time splits, zeros and missing values
+    rng = np.random.default_rng(0)
+    dense = rng.normal(size=(50, len(model_schema))) * rng.choice([0.0, 1.0, 1.744e9], size=(50, len(model_schema)))
+    dense[rng.random(dense.shape) < 0.1] = np.nan
+    np.testing.assert_array_equal(ensemble.predict(dense), model.predict(dense))
+
+
+def test_numpy_engine_matches_lightgbm():
+    """Test that both inference engines give identical predictions and that auto resolves to one of them."""
+    coins = make_coins(300, seed=4)
+    expected = predict_from_coin_data(coins, engine="lightgbm")
+    pd.testing.assert_frame_equal(predict_from_coin_data(coins, engine="numpy"), expected)
+    pd.testing.assert_frame_equal(predict_from_coin_data(coins[:3], engine="numpy"), predict_from_coin_data(coins[:3], engine="lightgbm"))
+    assert set(calibrate_engines(large_rows=200, repeat=1).values()) <= set(ENGINES)
+    pd.testing.assert_frame_equal(predict_from_coin_data(coins), expected)
+
+
+def test_numpy_engine_handles_missing_value_splits():
+    """Test the evaluator on splits with NaN and zero missing types, which the shipped model does not use."""
+    lgb = pytest.importorskip("lightgbm")
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(1000, 6))
+    data[rng.random(data.shape) < 0.2] = np.nan
+    data[rng.random(data.shape) < 0.2] = 0.0
+    label = (np.nan_to_num(data[:, 0]) + rng.normal(size=1000) > 0).astype(int)
+    for params in ({}, {"zero_as_missing": True}):
+        booster = lgb.train({"objective": "binary", "verbose": -1, "num_leaves": 15, **params}, lgb.Dataset(data, label), num_boost_round=10)
+        ensemble = TreeEnsemble(*flatten_model(booster.model_to_string()))
+        np.testing.assert_array_equal(ensemble.predict(data), booster.predict(data))
+
+
+def test_prediction_cache_matches_direct_prediction():
+    """Test that cached full-universe scores answer top-3 and per-symbol lookups like a direct prediction."""
+    snapshot = MarketSnapshot(make_coins(300, seed=4), version=7)
+    for n in (0, 10, 150):
+        expected = predict_from_coin_data(get_top_market_cap_table(n, snapshot)).head(3)
+        pd.testing.assert_frame_equal(get_top3_predictions(n, snapshot).reset_index(drop=True), expected.reset_index(drop=True))
+
+    cache = make_prediction_cache()
+    scored = cache.get(snapshot)
+    direct = predict_from_coin_data(snapshot.table)
+    for symbol in set(direct["symbol"]):
+        best = direct[direct["symbol"] == symbol].iloc[0]
+        assert scored.get(symbol) == (int(best["predicted_label"]), float(best["confidence"]))
+    assert scored.get("NOT_A_SYMBOL") is None
+    assert cache.get(snapshot) is scored
+    assert cache.stats()["hits"] == 1
+
+
+def test_prediction_cache_single_flights_and_skips_version_zero():
+    """Test that concurrent requests share one scoring run and version-0 snapshots are never cached."""
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def score(table, holder):
+        calls.append(len(table))
+        return score_coin_data(table, holder=holder)
+
+    cache = PredictionCache(score, lambda: get_model_registry().active, LABEL_THRESHOLD)
+    snapshot = MarketSnapshot(make_coins(50), version=3)
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(cache.get(snapshot))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+    transient = MarketSnapshot(make_coins(10), version=0)
+    assert cache.get(transient) is not cache.get(transient)
+    assert cache.stats()["uncached"] == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_prediction_cache_keys_by_the_model_it_scored_with():
+    """Test that a swap between reading the model version and scoring cannot mislabel cached scores."""
+
+    class Holder:
+        def __init__(self, version):
+            self.version = version
+
+    holders = iter([Holder("v1"), Holder("v2"), Holder("v3")])
+    used = []
+
+    def score(table, holder):
+        used.append(holder.version)
+        return score_coin_data(table)
+
+    cache = PredictionCache(score, lambda: next(holders), LABEL_THRESHOLD)
+    scored = cache.get(MarketSnapshot(make_coins(20), version=1))
+    assert used == ["v1"] and scored.key[2] == "v1"
+
+
+def test_prefix_top_index_matches_every_rank_threshold():
+    """Test that the rank prefix index gives the top 3 of every threshold, keeping unranked coins out of prefixes."""
+    coins = make_coins(200, seed=5)
+    rng = random.Random(5)
+    ranks = list(range(1, 201))
+    rng.shuffle(ranks)
+    coins = [coin.model_copy(update={"market_cap_rank": None if i % 7 == 0 else ranks[i]}) for i, coin in enumerate(coins)]
+    snapshot = MarketSnapshot(coins, version=9)
+    scored = make_prediction_cache().get(snapshot)
+
+    table = snapshot.table
+    for n in range(0, 205):
+        rows = table.rows_by_rank(n)
+        rows = rows[~np.isnan(scored.confidence[rows])]
+        expected = rows[np.argsort(-scored.confidence[rows], kind="stable")][:3]
+        assert scored.top_rows(n).tolist() == expected.tolist(), n
+    assert len(get_top3_predictions(0, snapshot)) == 3
+
+
+def test_incremental_scoring_rescores_only_changed_rows():
+    """Test that a refresh rescores only coins whose inputs changed and matches a full rescoring."""
+    coins = make_coins(300, seed=6)
+    cache = make_prediction_cache()
+    first = cache.get(MarketSnapshot(coins, version=1))
+    assert first.rescored == 300
+
+    refreshed = list(coins)
+    for i in (3, 50, 120):
+        refreshed[i] = refreshed[i].model_copy(update={"galaxy_score": 42.0, "alt_rank": 7})
+    refreshed[200] = refreshed[200].model_copy(update={"price": 1.0})  # not a model input
+    refreshed.append(make_coins(301, seed=7)[300].model_copy(update={"id": 10_000}))
+    snapshot = MarketSnapshot(refreshed, version=2)
+    second = cache.get(snapshot)
+
+    assert second.rescored == 4
+    assert cache.stats()["last_refresh"] == {"version": 2, "rows": 301, "rescored": 4, "incremental": True}
+    full = make_prediction_cache(incremental=False).get(snapshot)
+    np.testing.assert_array_equal(second.confidence, full.confidence)
+    np.testing.assert_array_equal(second.labels, full.labels)
+    assert second.top_rows(100).tolist() == full.top_rows(100).tolist()
+
+
+def test_model_registry_swaps_atomically_and_reloads_replaced_file(tmp_path):
+    """Test that a new model version is loaded in the background and swapped in while old holders keep working."""
+    path = str(tmp_path / "model.txt")
+    shutil.copy(MODEL_PATH, path)
+    registry = ModelRegistry(ModelHolder, MODEL_PATH, LABEL_THRESHOLD)
+    in_flight = registry.active
+    booster, _ = in_flight.get()
+
+    registry.load(path, wait=True)
+    assert registry.active.path == path and registry.active.loaded
+    assert registry.stats()["swaps"] == 1
+    assert registry.stats()["last_swap"]["from"] == in_flight.version
+    features = np.zeros((1, booster.num_feature()))
+    np.testing.assert_array_equal(in_flight.get()[0].predict(features), registry.active.get()[0].predict(features))
+
+    registry.load(str(tmp_path / "missing.txt"), wait=True)
+    assert registry.active.path == path
+    assert registry.stats()["failures"] == 1
+
+    before = registry.active
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert registry.check_for_update()
+    deadline = time.monotonic() + 30
+    while registry.active is before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert registry.active is not before
+    assert registry.stats()["swaps"] == 2
+
+
+def test_shadow_model_is_recorded_but_never_returned(tmp_path):
+    """Test that shadow scores are compared on the same rows without changing the returned predictions."""
+    path = str(tmp_path / "candidate.txt")
+    shutil.copy(MODEL_PATH, path)
+    coins = make_coins(200, seed=8)
+    expected = predict_from_coin_data(coins)
+    registry = get_model_registry()
+    registry.load_shadow(path, wait=True)
+    try:
+        pd.testing.assert_frame_equal(predict_from_coin_data(coins), expected)
+        registry.wait_for_shadow()
+    finally:
+        registry.clear_shadow()
+    comparison = registry.comparisons()[-1]
+    assert comparison["rows"] == len(expected)
+    assert comparison["max_abs_diff"] == 0.0 and comparison["label_agreement"] == 1.0
+    assert registry.stats()["shadow_runs"] >= 1